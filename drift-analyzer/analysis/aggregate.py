@@ -0,0 +1,147 @@
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .rules import compile_rules
+
+# Result formats served by aggregate_result rather than as file-level records
+VIEW_FORMATS = ("layers", "directories")
+
+def target_group(path: str) -> str:
+    """
+    The group of an edge target that is not a file: "DATABASE" for Ruby
+    db_call edges, "EXTERNAL" for every "EXTERNAL:<package>" import
+    """
+    return path.split(":", 1)[0]
+
+def aggregate_result(result: Dict[str, Any], rules: Dict[str, Any], view: str,
+                     depth: int = 1, prefix: str = "", offset: int = 0,
+                     limit: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Collapse an analysis result into the "layers" or "directories" view
+    """
+    if view == "layers":
+        return layer_graph(result, rules)
+    if view == "directories":
+        return directory_graph(result, rules, depth, prefix, offset, limit)
+    raise ValueError(f"Unknown view: {view}")
+
+def layer_graph(result: Dict[str, Any], rules: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The layer-to-layer graph of an analysis result
+
+    One node per layer with its file and violation counts, and one edge per
+    pair of layers with the number of file edges between them, how many of
+    those break a forbidden_dependencies or (direct) must_route_via rule,
+    and the count per edge type. Files outside every layer form the
+    "unknown" layer. Layers are listed in rules order, followed by the
+    groups of targets that are not files (see target_group).
+    """
+    layers = {node["path"]: node.get("layer", "unknown") for node in result["nodes"]}
+    order = {name: index for index, name in enumerate(layer["name"] for layer in rules.get("layers", []))}
+    groups, edges = _collapse(result, rules, layers, lambda path: layers.get(path) or target_group(path))
+    nodes = sorted(groups.values(), key=lambda group: (not group["files"], order.get(group["id"], len(order)), group["id"]))
+    return {
+        "view": "layers",
+        "nodes": [{key: group[key] for key in ("id", "files", "violations", "internal_edges")} for group in nodes],
+        "edges": edges,
+        "metrics": result["metrics"]
+    }
+
+def directory_graph(result: Dict[str, Any], rules: Dict[str, Any], depth: int = 1, prefix: str = "",
+                    offset: int = 0, limit: Optional[int] = None) -> Dict[str, Any]:
+    """
+    The graph of an analysis result with files collapsed into directories
+
+    Files under prefix are grouped by their first `depth` directories below
+    it; everything else stays collapsed at prefix's own level, so drilling
+    into a directory keeps its edges to the rest of the repo. Targets that
+    are not files are grouped as in layer_graph. A group that is a single
+    file, or such a target group, has "leaf" set. Groups carry file, violation and
+    per-layer file counts, and edges are counted as in layer_graph; edges
+    inside a group are only counted, as its internal_edges.
+
+    Groups are sorted by id, target groups last, and paged with offset and limit. A page holds
+    the edges between its groups and the groups of earlier pages, so loading
+    the pages in turn yields every edge exactly once; next_offset is None
+    on the last page.
+    """
+    prefix = prefix.strip("/")
+    prefix_parts = prefix.split("/") if prefix else []
+    keep_inside = len(prefix_parts) + depth
+    keep_outside = max(len(prefix_parts), 1)
+
+    layers = {node["path"]: node.get("layer", "unknown") for node in result["nodes"]}
+
+    def group_of(path: str) -> str:
+        if path not in layers:
+            return target_group(path)
+        parts = path.replace("\\", "/").split("/")
+        inside = parts[:len(prefix_parts)] == prefix_parts and len(parts) > len(prefix_parts)
+        keep = keep_inside if inside else keep_outside
+        return "/".join(parts[:keep])
+
+    groups, edges = _collapse(result, rules, layers, group_of)
+    nodes = sorted(groups.values(), key=lambda group: (not group["files"], group["id"]))
+
+    end = len(nodes) if limit is None else offset + limit
+    loaded = {group["id"] for group in nodes[:end]}
+    page = {group["id"] for group in nodes[offset:end]}
+    for group in nodes:
+        group["leaf"] = not group["files"] or group["id"] in layers
+    return {
+        "view": "directories",
+        "prefix": prefix,
+        "depth": depth,
+        "nodes": nodes[offset:end],
+        "edges": [edge for edge in edges
+                  if edge["from"] in loaded and edge["to"] in loaded and (edge["from"] in page or edge["to"] in page)],
+        "total_nodes": len(nodes),
+        "offset": offset,
+        "next_offset": end if end < len(nodes) else None,
+        "metrics": result["metrics"]
+    }
+
+def _collapse(result: Dict[str, Any], rules: Dict[str, Any], layers: Dict[str, str],
+              group_of: Callable[[str], str]) -> Tuple[Dict[str, Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Group files with group_of and sum the edges between groups; returns the
+    groups by id and the edges in first-seen order
+    """
+    index = compile_rules(rules)
+    rules_by_pair: Counter = Counter()
+    for pair, rule_indexes in index.forbidden_by_pair.items():
+        rules_by_pair[pair] += len(rule_indexes)
+    for pair, rule_indexes in index.routes_by_pair.items():
+        rules_by_pair[pair] += len(rule_indexes)
+
+    groups: Dict[str, Dict[str, Any]] = {}
+
+    def group(path: str) -> Dict[str, Any]:
+        group_id = group_of(path)
+        if group_id not in groups:
+            groups[group_id] = {"id": group_id, "files": 0, "violations": 0, "internal_edges": 0, "layers": {}}
+        return groups[group_id]
+
+    for node in result["nodes"]:
+        entry = group(node["path"])
+        entry["files"] += 1
+        entry["layers"][layers[node["path"]]] = entry["layers"].get(layers[node["path"]], 0) + 1
+    for violation in result["violations"]:
+        if violation.get("node_path") in layers:
+            group(violation["node_path"])["violations"] += 1
+
+    edges: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for edge in result["edges"]:
+        source, target = group(edge["from_path"]), group(edge["to_path"])
+        if source is target:
+            source["internal_edges"] += 1
+            continue
+        key = (source["id"], target["id"])
+        if key not in edges:
+            edges[key] = {"from": key[0], "to": key[1], "count": 0, "violations": 0, "edge_types": {}}
+        entry = edges[key]
+        entry["count"] += 1
+        entry["violations"] += rules_by_pair.get((layers.get(edge["from_path"]), layers.get(edge["to_path"])), 0)
+        edge_type = edge.get("edge_type", "unknown")
+        entry["edge_types"][edge_type] = entry["edge_types"].get(edge_type, 0) + 1
+    return groups, list(edges.values())
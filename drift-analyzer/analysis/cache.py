@@ -0,0 +1,261 @@
+import hashlib
+import json
+import os
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import closing, contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: coalesce within one process only
+    fcntl = None
+
+# SQLite limits the number of bound parameters per statement
+_BATCH_SIZE = 500
+
+DEFAULT_RESULT_CACHE_BYTES = 1024 ** 3
+
+# Bump whenever edge building, the rule checks or the result payloads
+# change what an analysis returns, so results cached by an older analyzer
+# are not served; parser changes are covered by the facts version that
+# callers pass to result_key
+RESULT_VERSION = 1
+
+def default_cache_dir() -> str:
+    """
+    Directory for persisted analyzer caches (DRIFT_CACHE_DIR overrides it)
+    """
+    return os.environ.get("DRIFT_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "drift-analyzer-cache")
+
+def git_blob_sha(data: bytes) -> str:
+    """
+    Compute the git blob SHA of some file content without calling git
+    """
+    digest = hashlib.sha1(f"blob {len(data)}\0".encode("ascii"))
+    digest.update(data)
+    return digest.hexdigest()
+
+def read_blob_shas(root: str) -> Dict[str, str]:
+    """
+    Map paths under root to the blob SHAs git already has for them
+
+    Files with uncommitted modifications are left out so their content gets
+    hashed instead. Returns an empty map when root is not a git checkout.
+    """
+    try:
+        staged = subprocess.run(["git", "ls-files", "-s", "-z"], cwd=root,
+                                capture_output=True, check=True).stdout
+        modified = subprocess.run(["git", "ls-files", "-m", "-z"], cwd=root,
+                                  capture_output=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return {}
+
+    dirty = set(modified.decode("utf-8", errors="surrogateescape").split("\0"))
+    shas = {}
+    for record in staged.decode("utf-8", errors="surrogateescape").split("\0"):
+        if not record:
+            continue
+        # "<mode> <sha> <stage>\t<path>"
+        info, _, path = record.partition("\t")
+        if path in dirty:
+            continue
+        shas[path.replace("/", os.sep)] = info.split(" ")[1]
+    return shas
+
+class FactCache:
+    """
+    Content-addressed store of per-file parse results, persisted in SQLite
+
+    Keys are built from the file's blob SHA plus everything else the parse
+    depends on, so entries never need invalidating; a changed file simply
+    has a new key.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        if path is None:
+            path = os.path.join(default_cache_dir(), "facts.sqlite3")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS facts (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # One short-lived connection per call keeps the cache safe to share
+        # between request threads
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """
+        Look up several keys at once, returning only the ones present
+        """
+        keys = list(keys)
+        found = {}
+        with closing(self._connect()) as conn:
+            for i in range(0, len(keys), _BATCH_SIZE):
+                batch = keys[i:i + _BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(f"SELECT key, value FROM facts WHERE key IN ({placeholders})", batch)
+                for key, value in rows:
+                    found[key] = json.loads(value)
+        return found
+
+    def put_many(self, entries: Dict[str, Any]) -> None:
+        """
+        Store several entries in one transaction
+        """
+        if not entries:
+            return
+        rows = [(key, json.dumps(value, separators=(",", ":"))) for key, value in entries.items()]
+        with closing(self._connect()) as conn, conn:
+            conn.executemany("INSERT OR REPLACE INTO facts (key, value) VALUES (?, ?)", rows)
+
+def result_key(repo_url: str, sha: str, rules: Dict[str, Any], variant: str = "", facts_version: int = 0) -> str:
+    """
+    Cache key for the analysis of one commit under one rule set
+
+    rules are hashed in canonical JSON form, so key order and whitespace do
+    not matter. variant covers anything else that changes the result's
+    shape, such as the payload format. RESULT_VERSION and facts_version
+    (the parser's FACTS_VERSION) tie the key to the analyzer that computed
+    it.
+    """
+    rules_hash = hashlib.sha256(json.dumps(rules, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+    key = json.dumps([RESULT_VERSION, facts_version, repo_url, sha.lower(), rules_hash, variant],
+                     separators=(",", ":"))
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+class _Flight:
+    """
+    One in-progress computation that other threads can wait on
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+class ResultCache:
+    """
+    Whole analysis results, persisted in SQLite and evicted least recently
+    used first once they take up more than max_bytes
+
+    get_or_compute is single-flight: concurrent callers asking for the same
+    key wait for one computation instead of each running it. Threads of one
+    process share the outcome directly; other processes (job workers) wait
+    on a per-key file lock and then find the stored result. A max_bytes of
+    0 turns storage off but keeps the coalescing.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_bytes: Optional[int] = None):
+        if path is None:
+            path = os.path.join(default_cache_dir(), "results.sqlite3")
+        if max_bytes is None:
+            max_bytes = int(os.environ.get("DRIFT_RESULT_CACHE_MAX_BYTES", DEFAULT_RESULT_CACHE_BYTES))
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock_dir = path + ".locks"
+        os.makedirs(self.lock_dir, exist_ok=True)
+        self._flights: Dict[str, _Flight] = {}
+        self._flights_lock = threading.Lock()
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS results "
+                         "(key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS results_used ON results (used)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        The stored result for key, or None; a hit marks it recently used
+        """
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE results SET used = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Any) -> None:
+        """
+        Store a result, then evict the least recently used ones over budget
+        """
+        data = json.dumps(value, separators=(",", ":"))
+        if len(data) > self.max_bytes:
+            return
+        with closing(self._connect()) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO results (key, value, size, used) VALUES (?, ?, ?, ?)",
+                         (key, data, len(data), time.time()))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            evicted = []
+            for old_key, size in conn.execute("SELECT key, size FROM results ORDER BY used"):
+                if total <= self.max_bytes:
+                    break
+                evicted.append(old_key)
+                total -= size
+            conn.executemany("DELETE FROM results WHERE key = ?", [(old_key,) for old_key in evicted])
+        for old_key in evicted:
+            try:
+                os.remove(self._lock_path(old_key))
+            except OSError:
+                pass
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        """
+        The stored result for key, or compute() run once however many
+        callers ask for key at the same time
+
+        A failure is raised to every caller waiting on that computation and
+        nothing is stored.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            with self._key_lock(key):
+                # Another process may have finished it while we waited
+                value = self.get(key)
+                if value is None:
+                    value = compute()
+                    self.put(key, value)
+            flight.value = value
+            return value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._flights_lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def _lock_path(self, key: str) -> str:
+        return os.path.join(self.lock_dir, key + ".lock")
+
+    @contextmanager
+    def _key_lock(self, key: str) -> Iterator[None]:
+        if fcntl is None:
+            yield
+            return
+        with open(self._lock_path(key), "a") as handle:
+            # Closing the file releases the lock
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            yield
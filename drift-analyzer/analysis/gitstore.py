@@ -0,0 +1,518 @@
+import asyncio
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from .cache import default_cache_dir
+from .inventory import SourceFile, decode_source, inventory_lang
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+DEFAULT_MAX_BYTES = 10 * 1024 ** 3
+
+# Network git operations allowed at once per remote host
+DEFAULT_HOST_CONCURRENCY = 4
+
+# Seconds a credential that reached a remote stays trusted to read commits
+# its mirror already holds without asking the remote again
+ACCESS_TTL = 300
+
+# Regular files; symlinks and submodules are not analysed
+FILE_MODES = ("100644", "100755")
+
+def authed_url(repo_url: str, token: Optional[str]) -> str:
+    """
+    Embed a token into an https remote URL for a single git invocation
+    """
+    if token:
+        return repo_url.replace("https://", f"https://{token}@")
+    return repo_url
+
+def run_git(args: List[str], cwd: Optional[str] = None) -> str:
+    """
+    Run a git command and return its stdout, raising CalledProcessError on failure
+    """
+    result = subprocess.run(["git"] + args, cwd=cwd, capture_output=True, text=True, check=True)
+    return result.stdout
+
+async def run_git_async(args: List[str], cwd: Optional[str] = None) -> str:
+    """
+    run_git without blocking the event loop
+    """
+    process = await asyncio.create_subprocess_exec("git", *args, cwd=cwd, stdout=subprocess.PIPE,
+                                                   stderr=subprocess.PIPE)
+    stdout, stderr = await process.communicate()
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, ["git"] + args,
+                                            stdout.decode("utf-8", errors="replace"),
+                                            stderr.decode("utf-8", errors="replace"))
+    return stdout.decode("utf-8", errors="replace")
+
+def remote_host(repo_url: str) -> str:
+    """
+    The host a remote URL points at; "" for local paths
+    """
+    host = urlsplit(repo_url).hostname
+    if host:
+        return host.lower()
+    # scp-like "user@host:path"
+    match = re.match(r"(?:[^@/]+@)?([^:/]+):(?!//)", repo_url)
+    return match.group(1).lower() if match and len(match.group(1)) > 1 else ""
+
+class HostLimiter:
+    """
+    Caps the git network operations running at once against each remote
+    host, so a burst of requests for one host queues instead of opening
+    dozens of connections to it
+
+    Semaphores belong to the event loop that first uses them, so keep one
+    limiter per loop.
+    """
+
+    def __init__(self, limit: Optional[int] = None):
+        self.limit = limit or int(os.environ.get("DRIFT_GIT_HOST_CONCURRENCY", DEFAULT_HOST_CONCURRENCY))
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def slot(self, repo_url: str) -> asyncio.Semaphore:
+        """
+        The semaphore to hold while talking to repo_url's host
+        """
+        host = remote_host(repo_url)
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(self.limit)
+        return self._semaphores[host]
+
+def list_tree(git_dir: str, commit: str) -> Iterator[Tuple[str, str, str]]:
+    """
+    Yield (mode, blob SHA, path) for every blob in a commit's tree
+    """
+    output = run_git(["ls-tree", "-r", "-z", "--full-tree", commit], cwd=git_dir)
+    for record in output.split("\0"):
+        if not record:
+            continue
+        # "<mode> <type> <sha>\t<path>"
+        info, _, path = record.partition("\t")
+        mode, kind, sha = info.split(" ")
+        if kind == "blob":
+            yield mode, sha, path
+
+def diff_tree(git_dir: str, old: str, new: str) -> Iterator[Tuple[str, Optional[str], str]]:
+    """
+    Yield (new mode, new blob SHA or None when deleted, path) for every
+    blob that differs between two commits
+    """
+    output = run_git(["diff-tree", "-r", "-z", "--no-renames", "--no-commit-id", old, new], cwd=git_dir)
+    fields = output.split("\0")
+    # ":<old mode> <new mode> <old sha> <new sha> <status>", then the path
+    for i in range(0, len(fields) - 1, 2):
+        if not fields[i].startswith(":"):
+            continue
+        _, new_mode, _, new_sha, status = fields[i][1:].split(" ")
+        yield new_mode, (None if status == "D" else new_sha), fields[i + 1]
+
+def rev_list(git_dir: str, base: str, head: str) -> List[str]:
+    """
+    The first-parent commits after base up to head, oldest first
+    """
+    output = run_git(["rev-list", "--reverse", "--first-parent", f"{base}..{head}"], cwd=git_dir)
+    return output.split()
+
+class BlobReader:
+    """
+    Reads objects through one long-lived `git cat-file --batch` process,
+    avoiding a git invocation per blob
+    """
+
+    def __init__(self, git_dir: str):
+        self._process = subprocess.Popen(["git", "cat-file", "--batch"], cwd=git_dir,
+                                         stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def read(self, sha: str) -> Optional[bytes]:
+        """
+        The content of an object, or None if the repository lacks it
+        """
+        self._process.stdin.write(sha.encode("ascii") + b"\n")
+        self._process.stdin.flush()
+        # "<sha> <type> <size>", or "<sha> missing"
+        header = self._process.stdout.readline().split()
+        if len(header) != 3:
+            return None
+        data = self._process.stdout.read(int(header[2]))
+        self._process.stdout.read(1)
+        return data
+
+    def close(self) -> None:
+        if self._process.poll() is None:
+            self._process.stdin.close()
+            self._process.wait()
+
+    def __enter__(self) -> "BlobReader":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+class GitTree:
+    """
+    A commit's files read straight from a repository's object store, for
+    analysing without a checkout
+
+    With prefix (a "/"-terminated directory, as `git rev-parse --show-prefix`
+    prints it), only the files below that directory are listed, relative
+    to it, as a checkout of a monorepo subdirectory walks them.
+
+    The tree is listed once with `git ls-tree -r -l`, keeping only the blobs
+    the analysis can use: source files, plus JSON files and the root
+    .gitattributes for the tsconfig and attribute lookups. Contents stream
+    through one long-lived `git cat-file --batch` process, started on first
+    read. A tree pickles without that process, so parser processes each
+    start their own; subset() keeps what one of them needs small.
+    """
+
+    def __init__(self, git_dir: str, commit: str, blobs: Optional[Dict[str, Tuple[str, int]]] = None,
+                 prefix: str = ""):
+        self.git_dir = git_dir
+        self.commit = commit
+        self.prefix = prefix
+        # path -> (blob SHA, size), with os.sep separators like the inventory walk
+        self._blobs = blobs
+        self._reader: Optional[BlobReader] = None
+
+    @property
+    def blobs(self) -> Dict[str, Tuple[str, int]]:
+        if self._blobs is None:
+            args = ["ls-tree", "-r", "-l", "-z", "--full-tree", self.commit]
+            output = run_git(args + ["--", self.prefix] if self.prefix else args, cwd=self.git_dir)
+            blobs = {}
+            for record in output.split("\0"):
+                if not record:
+                    continue
+                # "<mode> <type> <sha> <padded size>\t<path>"
+                info, _, path = record.partition("\t")
+                if not path.startswith(self.prefix):
+                    continue
+                path = path[len(self.prefix):]
+                mode, kind, sha, size = info.split()
+                if kind != "blob" or mode not in FILE_MODES:
+                    continue
+                if path == ".gitattributes" or path.endswith(".json") or inventory_lang(path):
+                    blobs[path.replace("/", os.sep)] = (sha, int(size))
+            self._blobs = blobs
+        return self._blobs
+
+    def inventory(self) -> List[SourceFile]:
+        """
+        The analysable files, as build_inventory would list them in a checkout
+        """
+        files = []
+        for path in self.blobs:
+            lang = inventory_lang(path.replace(os.sep, "/"))
+            if lang:
+                files.append(SourceFile(path, lang))
+        files.sort()
+        return files
+
+    def blob_shas(self) -> Dict[str, str]:
+        """
+        Map every listed path to its blob SHA
+        """
+        return {path: sha for path, (sha, _) in self.blobs.items()}
+
+    def size(self, path: str) -> Optional[int]:
+        """
+        The size of a listed file without reading it, or None if unlisted
+        """
+        entry = self.blobs.get(path)
+        return entry[1] if entry else None
+
+    def read(self, path: str) -> Optional[bytes]:
+        """
+        The content of a listed file, or None if unlisted
+        """
+        entry = self.blobs.get(path)
+        if entry is None:
+            return None
+        if self._reader is None:
+            self._reader = BlobReader(self.git_dir)
+        return self._reader.read(entry[0])
+
+    def read_text(self, path: str) -> Optional[str]:
+        """
+        A listed file decoded as UTF-8, for config lookups
+        """
+        data = self.read(path)
+        return decode_source(data) if data is not None else None
+
+    def subset(self, paths: Iterable[str]) -> "GitTree":
+        """
+        The same tree listing only the given paths (and the root .gitattributes)
+        """
+        keep = set(paths)
+        keep.add(".gitattributes")
+        return GitTree(self.git_dir, self.commit, {path: entry for path, entry in self.blobs.items() if path in keep},
+                       self.prefix)
+
+    def close(self) -> None:
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+    def __enter__(self) -> "GitTree":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __getstate__(self) -> Dict[str, object]:
+        return {"git_dir": self.git_dir, "commit": self.commit, "prefix": self.prefix, "_blobs": self.blobs,
+                "_reader": None}
+
+def dir_size(path: str) -> int:
+    """
+    Total size in bytes of the files below path
+    """
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                pass
+    return total
+
+class _FileLock:
+    """
+    Exclusive lock on a lock file, shared by threads and (where fcntl
+    exists) processes
+    """
+
+    _thread_locks: Dict[str, threading.Lock] = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._registry_lock:
+            self._thread_lock = self._thread_locks.setdefault(path, threading.Lock())
+        self._handle = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if not self._thread_lock.acquire(blocking):
+            return False
+        if fcntl is not None:
+            self._handle = open(self.path, "a")
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            try:
+                fcntl.flock(self._handle, flags)
+            except OSError:
+                self._handle.close()
+                self._handle = None
+                self._thread_lock.release()
+                return False
+        return True
+
+    def release(self) -> None:
+        if self._handle is not None:
+            fcntl.flock(self._handle, fcntl.LOCK_UN)
+            self._handle.close()
+            self._handle = None
+        self._thread_lock.release()
+
+class MirrorStore:
+    """
+    Local bare mirrors of remote repositories, keyed by repo URL
+
+    Each fetch brings only the requested ref into the mirror, so repeated
+    scans of the same repository transfer only what changed, and tree()
+    reads the commit from the mirror itself without a checkout. Mirrors are
+    evicted least recently used first once the store grows past max_bytes.
+    """
+
+    def __init__(self, root: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.root = root or os.environ.get("DRIFT_MIRROR_DIR") or os.path.join(default_cache_dir(), "mirrors")
+        if max_bytes is None:
+            max_bytes = int(os.environ.get("DRIFT_MIRROR_MAX_BYTES", DEFAULT_MAX_BYTES))
+        self.max_bytes = max_bytes
+        self._sizes: Dict[str, int] = {}
+        os.makedirs(self.root, exist_ok=True)
+
+    def _entry_dir(self, repo_url: str) -> str:
+        return os.path.join(self.root, hashlib.sha1(repo_url.encode("utf-8")).hexdigest()[:20])
+
+    def git_dir(self, repo_url: str) -> str:
+        """
+        The bare mirror of repo_url, for reading objects without a checkout
+        """
+        return os.path.join(self._entry_dir(repo_url), "repo.git")
+
+    def fetch(self, repo_url: str, ref: str, token: Optional[str] = None) -> str:
+        """
+        Bring ref into the mirror for repo_url and return its commit SHA
+        """
+        return asyncio.run(self.fetch_async(repo_url, ref, token))
+
+    async def fetch_async(self, repo_url: str, ref: str, token: Optional[str] = None,
+                          limiter: Optional[HostLimiter] = None) -> str:
+        """
+        fetch for callers on an event loop: git runs as asyncio subprocesses,
+        the network fetch (if any) inside limiter's slot for the host, and
+        the mirror's file lock is waited for on a thread
+        """
+        entry = self._entry_dir(repo_url)
+        git_dir = os.path.join(entry, "repo.git")
+        os.makedirs(entry, exist_ok=True)
+
+        lock = _FileLock(os.path.join(entry, "fetch.lock"))
+        acquiring = asyncio.ensure_future(asyncio.to_thread(lock.acquire))
+        try:
+            await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            # The thread still takes the lock; hand it straight back
+            acquiring.add_done_callback(lambda _: lock.release())
+            raise
+        try:
+            if not os.path.isdir(git_dir):
+                await run_git_async(["init", "--bare", "--quiet", git_dir])
+
+            # A commit we already have needs no fetch, but the mirror is
+            # shared, so the caller's access to the remote is still checked:
+            # a cheap ls-remote, skipped for a credential that recently
+            # reached it
+            if re.fullmatch(r"[0-9a-fA-F]{40}", ref):
+                try:
+                    await run_git_async(["cat-file", "-e", f"{ref}^{{commit}}"], cwd=git_dir)
+                    present = True
+                except subprocess.CalledProcessError:
+                    present = False
+                if present:
+                    if not self._has_access(entry, token):
+                        ls_remote = ["ls-remote", "--quiet", authed_url(repo_url, token), "HEAD"]
+                        if limiter is not None:
+                            async with limiter.slot(repo_url):
+                                await run_git_async(ls_remote, cwd=git_dir)
+                        else:
+                            await run_git_async(ls_remote, cwd=git_dir)
+                        self._grant_access(entry, token)
+                    return ref.lower()
+
+            # Keep a local ref per requested ref so fetched history is not
+            # garbage collected and concurrent fetches of other refs never
+            # race on FETCH_HEAD
+            local_ref = "refs/drift/" + hashlib.sha1(ref.encode("utf-8")).hexdigest()[:16]
+            fetch = ["fetch", "--quiet", "--no-tags", "--force", authed_url(repo_url, token), f"+{ref}:{local_ref}"]
+            if limiter is not None:
+                async with limiter.slot(repo_url):
+                    await run_git_async(fetch, cwd=git_dir)
+            else:
+                await run_git_async(fetch, cwd=git_dir)
+            self._grant_access(entry, token)
+            return (await run_git_async(["rev-parse", f"{local_ref}^{{commit}}"], cwd=git_dir)).strip()
+        finally:
+            lock.release()
+            self._sizes.pop(entry, None)
+
+    def _access_path(self, entry: str, token: Optional[str]) -> str:
+        # Named by a hash, so the token itself is never written to disk
+        return os.path.join(entry, "access", hashlib.sha256((token or "").encode("utf-8")).hexdigest())
+
+    def _has_access(self, entry: str, token: Optional[str]) -> bool:
+        """
+        Whether token reached the remote of entry within DRIFT_ACCESS_TTL
+        seconds, in this process or another sharing the store
+        """
+        ttl = float(os.environ.get("DRIFT_ACCESS_TTL", ACCESS_TTL))
+        try:
+            return time.time() - os.stat(self._access_path(entry, token)).st_mtime < ttl
+        except OSError:
+            return False
+
+    def _grant_access(self, entry: str, token: Optional[str]) -> None:
+        path = self._access_path(entry, token)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a"):
+            pass
+        os.utime(path)
+
+    @contextmanager
+    def tree(self, repo_url: str, ref: str, token: Optional[str] = None) -> Iterator[GitTree]:
+        """
+        ref's tree, read from the mirror without a checkout, for the
+        duration of the block
+
+        The mirror is leased for the block, so it is not evicted while the
+        tree is being read.
+        """
+        sha = self.fetch(repo_url, ref, token)
+        entry = self._entry_dir(repo_url)
+        os.utime(entry)
+
+        _, lock = self._lease_slot(os.path.join(entry, "readers"))
+        try:
+            with GitTree(os.path.join(entry, "repo.git"), sha) as tree:
+                yield tree
+        finally:
+            lock.release()
+            self.evict(keep=entry)
+
+    def _lease_slot(self, directory: str) -> Tuple[str, _FileLock]:
+        """
+        Lock the first free numbered slot in directory
+        """
+        os.makedirs(directory, exist_ok=True)
+        index = 0
+        while True:
+            path = os.path.join(directory, str(index))
+            lock = _FileLock(path + ".lock")
+            if lock.acquire(blocking=False):
+                return path, lock
+            index += 1
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """
+        Delete least recently used mirrors until the store fits in max_bytes
+        """
+        entries = []
+        for name in os.listdir(self.root):
+            entry = os.path.join(self.root, name)
+            if not os.path.isdir(entry):
+                continue
+            if entry not in self._sizes:
+                self._sizes[entry] = dir_size(entry)
+            entries.append((os.stat(entry).st_mtime, entry))
+
+        total = sum(self._sizes[entry] for _, entry in entries)
+        for _, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if entry == keep:
+                continue
+            # Never pull a mirror out from under a running fetch or scan
+            locks = [_FileLock(os.path.join(entry, "fetch.lock"))]
+            locks += [_FileLock(path) for path in self._lease_locks(entry)]
+            held = []
+            try:
+                for lock in locks:
+                    if not lock.acquire(blocking=False):
+                        break
+                    held.append(lock)
+                else:
+                    shutil.rmtree(entry, ignore_errors=True)
+                    total -= self._sizes.pop(entry, 0)
+            finally:
+                for lock in held:
+                    lock.release()
+
+    def _lease_locks(self, entry: str) -> List[str]:
+        directory = os.path.join(entry, "readers")
+        if not os.path.isdir(directory):
+            return []
+        return [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".lock")]
@@ -0,0 +1,108 @@
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+class EdgeGraph:
+    """
+    Dependency edges stored as integer columns
+
+    Paths, layer names and edge types are interned into one string table,
+    and edge i is (from_ids[i], to_ids[i], type_ids[i], lines[i]) in four
+    parallel arrays, a few bytes per edge instead of a dict of strings.
+    layer_ids maps each string id to its node's layer id (-1 when the string
+    is not a node path), so rules compare integers. Edge dicts are only
+    built by iter_edges/edge_dicts, when results are serialized.
+    """
+
+    def __init__(self):
+        self.strings: List[str] = []
+        self.ids: Dict[str, int] = {}
+        self.layer_ids = array("i")
+        self.from_ids = array("i")
+        self.to_ids = array("i")
+        self.type_ids = array("i")
+        self.lines = array("i")  # 0 when the edge has no line number
+
+    def intern(self, value: str) -> int:
+        """
+        The id of value in the string table, adding it if needed
+        """
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = self.ids[value] = len(self.strings)
+            self.strings.append(value)
+            self.layer_ids.append(-1)
+        return string_id
+
+    def set_layers(self, nodes: Iterable[Dict[str, str]]) -> None:
+        """
+        Record the layer of every node path
+        """
+        for node in nodes:
+            self.layer_ids[self.intern(node["path"])] = self.intern(node.get("layer", "unknown"))
+
+    def add_edge(self, from_path: str, to_path: str, edge_type: str, line_number: Optional[int] = None) -> None:
+        self.from_ids.append(self.intern(from_path))
+        self.to_ids.append(self.intern(to_path))
+        self.type_ids.append(self.intern(edge_type))
+        self.lines.append(line_number or 0)
+
+    def sharing_strings(self) -> "EdgeGraph":
+        """
+        An empty graph using this graph's string table and node layers, so
+        string ids mean the same in both
+        """
+        graph = EdgeGraph()
+        graph.strings, graph.ids, graph.layer_ids = self.strings, self.ids, self.layer_ids
+        return graph
+
+    def extend(self, other: "EdgeGraph") -> None:
+        """
+        Append the edges of a graph that shares this one's string table
+        """
+        self.from_ids.extend(other.from_ids)
+        self.to_ids.extend(other.to_ids)
+        self.type_ids.extend(other.type_ids)
+        self.lines.extend(other.lines)
+
+    def clear_edges(self) -> None:
+        """
+        Drop the edges but keep the string table and node layers
+        """
+        for column in (self.from_ids, self.to_ids, self.type_ids, self.lines):
+            del column[:]
+
+    def __len__(self) -> int:
+        return len(self.from_ids)
+
+    def edge(self, i: int) -> Dict[str, Any]:
+        """
+        Edge i in the public dict shape
+        """
+        strings = self.strings
+        edge = {
+            "from_path": strings[self.from_ids[i]],
+            "to_path": strings[self.to_ids[i]],
+            "edge_type": strings[self.type_ids[i]]
+        }
+        if self.lines[i]:
+            edge["line_number"] = self.lines[i]
+        return edge
+
+    def iter_edges(self) -> Iterator[Dict[str, Any]]:
+        for i in range(len(self.from_ids)):
+            yield self.edge(i)
+
+    def edge_dicts(self) -> List[Dict[str, Any]]:
+        return list(self.iter_edges())
+
+    @classmethod
+    def from_edges(cls, nodes: Iterable[Dict[str, str]], edges: Iterable[Dict[str, Any]]) -> "EdgeGraph":
+        """
+        Build a graph from node and edge dicts
+        """
+        graph = cls()
+        graph.set_layers(nodes)
+        for edge in edges:
+            graph.add_edge(edge["from_path"], edge["to_path"], edge.get("edge_type", "unknown"),
+                           edge.get("line_number"))
+        return graph
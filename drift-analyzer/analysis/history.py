@@ -0,0 +1,341 @@
+import json
+import logging
+import os
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Pattern, Set, Tuple, Union
+
+from .cache import FactCache
+from .gitstore import FILE_MODES, BlobReader, GitTree, diff_tree, list_tree
+from .graph import EdgeGraph
+from .inventory import decode_source, inventory_lang
+from .layers import compile_layers
+from .reader import is_generated, parse_gitattributes, skip_reason
+from .rules import compile_rules
+from .ruby import RubyIndex
+from .scan import (build_edges, build_metrics, build_ruby_index, check_graph_rules, check_rules,
+                   collect_api_hits, collect_file_facts, fact_key, make_node, parse_source)
+from .typescript import CONFIG_NAMES, TsResolver, lookup_targets
+
+logger = logging.getLogger(__name__)
+
+class HistoryWalker:
+    """
+    The analysis of one commit, moved from commit to commit by applying only
+    the blobs each commit changes
+
+    Per file it keeps the parsed facts, the edges and the violations that
+    depend on that file alone (everything except the graph-wide rules), so
+    a commit costs work in proportion to the files it touches. When a
+    commit adds or removes files, the import edges of the TypeScript files
+    whose lookups could find those paths are re-resolved, without
+    re-parsing (those of every TypeScript file when a tsconfig changed).
+    When it changes which constants are defined where, so are the constant
+    edges of the Ruby files referring to a name that shares a segment with
+    those constants. The graph-wide rules are re-checked only when some
+    edges changed. Blobs are read from the object store, so no checkout is
+    needed after the base, and are skipped the way SourceReader skips
+    files, by size, content and the root .gitattributes of the commit.
+    """
+
+    def __init__(self, git_dir: str, rules: Dict[str, Any], cache: Optional[FactCache], blobs: BlobReader):
+        self.git_dir = git_dir
+        self.rules = rules
+        self.index = compile_rules(rules)
+        self.matcher = compile_layers(rules.get("layers", []))
+        self.cache = cache
+        self.blobs = blobs
+        self.commit: Optional[str] = None
+
+        self.nodes: Dict[str, Dict[str, str]] = {}
+        self.shas: Dict[str, str] = {}
+        self.configs: Dict[str, str] = {}
+        self.attributes: List[Tuple[Pattern, bool]] = []
+        self.facts: Dict[str, Dict[str, Any]] = {}
+        self.edges: Dict[str, EdgeGraph] = {}
+        self.violations: Dict[str, List[Dict[str, Any]]] = {}
+        self.graph_violations: List[Dict[str, Any]] = []
+        # String table and node layers shared by every per-file graph
+        self.layers = EdgeGraph()
+        self.edge_count = 0
+        self.violation_count = 0
+        self.resolver = self._new_resolver()
+        self.ruby_index = RubyIndex()
+        # Set by _recompute when a file's edges came out different
+        self.edges_changed = False
+        # Constants defined by files removed since the index was built
+        self.removed_definitions: List[str] = []
+        # What each file's edges were resolved through, and the files
+        # resolved through each key: TypeScript lookup targets, and "::"
+        # plus each segment of the constant names a Ruby file refers to
+        self.lookups: Dict[str, Set[str]] = {}
+        self.lookups_by_key: Dict[str, Set[str]] = {}
+
+    def load(self, commit: str, root: Optional[Union[str, GitTree]] = None,
+             workers: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Analyze the starting commit in full and return its metrics
+
+        With root (a checkout of commit, or its GitTree) the files are
+        parsed by collect_file_facts, in parallel for large repos.
+        """
+        self.commit = commit
+        return {"sha": commit, "metrics": self._load(list_tree(self.git_dir, commit), root, workers)}
+
+    def advance(self, commit: str) -> Dict[str, Any]:
+        """
+        Move to commit and return its metrics with the violations it added
+        and removed relative to the previous commit
+        """
+        entries = list(diff_tree(self.git_dir, self.commit, commit))
+        self.commit = commit
+        return dict(sha=commit, **self._advance(entries))
+
+    def _load(self, entries: Iterable[Tuple[str, str, str]], root: Optional[Union[str, GitTree]] = None,
+              workers: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Analyze a whole tree of (mode, blob SHA, path) entries; returns its
+        metrics
+        """
+        for mode, sha, path in entries:
+            self._apply(mode, sha, path)
+        self.resolver = self._new_resolver()
+
+        stats = {"hits": 0, "misses": 0}
+        if root is not None:
+            nodes = list(self.nodes.values())
+            self.facts = collect_file_facts(root, nodes, self.rules, self.cache, stats, workers)
+        else:
+            self._load_facts(set(self.nodes), stats)
+        self.ruby_index = self._new_ruby_index()
+
+        for path in self._ordered_paths():
+            self._recompute(path)
+        self.graph_violations = self._check_graph()
+        return self._metrics(stats)
+
+    def _advance(self, entries: Iterable[Tuple[str, Optional[str], str]]) -> Dict[str, Any]:
+        """
+        Apply changed (mode, blob SHA or None when deleted, path) entries;
+        returns the metrics with the violations added and removed
+        """
+        changed: Set[str] = set()
+        paths_changed = False
+        configs_changed = False
+        attributes_changed = False
+        for mode, sha, path in entries:
+            kind = self._apply(mode, sha, path)
+            if kind is None:
+                continue
+            if kind == "attributes":
+                attributes_changed = True
+                continue
+            changed.add(path.replace("/", os.sep))
+            paths_changed = paths_changed or kind == "paths"
+            configs_changed = configs_changed or kind == "config"
+
+        stats = {"hits": 0, "misses": 0}
+        if attributes_changed:
+            # Any file may have become (or stopped being) generated
+            changed.update(self.nodes)
+        defines_before = {path: self._defines(path) for path in changed}
+        self._load_facts({path for path in changed if path in self.nodes}, stats)
+
+        recompute = set(changed)
+        if configs_changed:
+            self.resolver = self._new_resolver()
+            recompute.update(path for path, node in self.nodes.items() if node["lang"] == "typescript")
+        elif paths_changed:
+            self.resolver = self._new_resolver()
+            for path in changed:
+                for target in lookup_targets(path):
+                    recompute.update(self.lookups_by_key.get(target, ()))
+        redefined = set(self.removed_definitions)
+        for path, defines in defines_before.items():
+            redefined.update(set(defines) ^ set(self._defines(path)))
+        if redefined:
+            self.ruby_index = self._new_ruby_index()
+            for segment in {segment for name in redefined for segment in name.split("::")}:
+                recompute.update(self.lookups_by_key.get("::" + segment, ()))
+
+        before: List[Dict[str, Any]] = []
+        after: List[Dict[str, Any]] = []
+        self.edges_changed = False
+        for path in recompute:
+            old, new = self._recompute(path)
+            before.extend(old)
+            after.extend(new)
+        if self.index.has_graph_rules and self.edges_changed:
+            before.extend(self.graph_violations)
+            self.graph_violations = self._check_graph()
+            after.extend(self.graph_violations)
+
+        return {
+            "changed_files": len(changed),
+            "metrics": self._metrics(stats),
+            "added": unmatched_violations(after, before),
+            "removed": unmatched_violations(before, after)
+        }
+
+    def _apply(self, mode: str, sha: Optional[str], path: str) -> Optional[str]:
+        """
+        Record one blob of the tree; returns "paths" when the set of source
+        files changed, "file" for a changed source file, "config" for a
+        changed tsconfig, "attributes" for the root .gitattributes, else None
+        """
+        if path == ".gitattributes":
+            data = self.blobs.read(sha) if sha else None
+            self.attributes = parse_gitattributes(decode_source(data)) if data is not None else []
+            return "attributes"
+        rp = path.replace("/", os.sep)
+        if os.path.basename(rp) in CONFIG_NAMES:
+            if sha is None:
+                self.configs.pop(rp, None)
+            else:
+                self.configs[rp] = sha
+            return "config"
+
+        lang = inventory_lang(path) if mode in FILE_MODES else None
+        if sha is None or lang is None:
+            if rp not in self.nodes:
+                return None
+            del self.nodes[rp]
+            self.shas.pop(rp, None)
+            self.removed_definitions.extend(self.facts.pop(rp, {}).get("defines", ()))
+            self.layers.layer_ids[self.layers.ids[rp]] = -1
+            return "paths"
+
+        kind = "file" if rp in self.nodes else "paths"
+        if kind == "paths":
+            self.nodes[rp] = make_node(rp, lang, self.matcher)
+            self.layers.set_layers([self.nodes[rp]])
+        self.shas[rp] = sha
+        return kind
+
+    def _load_facts(self, paths: Set[str], stats: Dict[str, int]) -> None:
+        keys = {}
+        for path in paths:
+            if is_generated(self.attributes, path):
+                self.facts.pop(path, None)
+                continue
+            node = self.nodes[path]
+            keys[path] = fact_key(node["lang"], self.shas[path], self.index.api_patterns(node["layer"]))
+        cached = self.cache.get_many(set(keys.values())) if self.cache is not None else {}
+
+        fresh = {}
+        for path, key in keys.items():
+            if key in cached:
+                self.facts[path] = cached[key]
+                stats["hits"] += 1
+                continue
+            self.facts.pop(path, None)
+            data = self.blobs.read(self.shas[path])
+            if data is None or skip_reason(path, data):
+                continue
+            node = self.nodes[path]
+            try:
+                self.facts[path] = fresh[key] = parse_source(node["lang"], data, self.index.api_patterns(node["layer"]))
+                stats["misses"] += 1
+            except Exception as e:
+                # Log error but continue processing
+                logger.warning("Error processing %s: %s", path, e)
+        if self.cache is not None:
+            self.cache.put_many(fresh)
+
+    def _recompute(self, path: str):
+        """
+        Rebuild one file's edges and violations; returns (old, new) violations
+        """
+        old_edges = self.edges.pop(path, None)
+        if old_edges is not None:
+            self.edge_count -= len(old_edges)
+        old = self.violations.pop(path, [])
+        self.violation_count -= len(old)
+
+        for key in self.lookups.pop(path, ()):
+            self.lookups_by_key[key].discard(path)
+
+        node = self.nodes.get(path)
+        if node is None or path not in self.facts:
+            self.edges_changed = self.edges_changed or bool(old_edges)
+            return old, []
+        facts = {path: self.facts[path]}
+        graph = self.layers.sharing_strings()
+        self.resolver.probed = probed = set()
+        try:
+            build_edges([node], facts, self.resolver, graph, self.ruby_index)
+        finally:
+            self.resolver.probed = None
+        for name, _, _ in facts[path].get("references", ()):
+            probed.update("::" + segment for segment in name.lstrip(":").split("::"))
+        if probed:
+            self.lookups[path] = probed
+            for key in probed:
+                self.lookups_by_key.setdefault(key, set()).add(path)
+        new = check_rules([node], graph, self.rules, api_hits=collect_api_hits([node], facts, self.rules),
+                          graph_rules=False)
+        if not self.edges_changed:
+            self.edges_changed = (old_edges.edge_dicts() if old_edges is not None else []) != graph.edge_dicts()
+        self.edges[path] = graph
+        self.edge_count += len(graph)
+        self.violations[path] = new
+        self.violation_count += len(new)
+        return old, new
+
+    def _check_graph(self) -> List[Dict[str, Any]]:
+        if not self.index.has_graph_rules:
+            return []
+        nodes = [self.nodes[path] for path in self._ordered_paths()]
+        graph = self.layers.sharing_strings()
+        for node in nodes:
+            if node["path"] in self.edges:
+                graph.extend(self.edges[node["path"]])
+        return check_graph_rules(nodes, graph, self.rules)
+
+    def _ordered_paths(self) -> List[str]:
+        # Same order as collect_nodes: Ruby files, then TypeScript, by path
+        return sorted(self.nodes, key=lambda path: (self.nodes[path]["lang"] != "ruby", path))
+
+    def _metrics(self, stats: Dict[str, int]) -> Dict[str, Any]:
+        return build_metrics({
+            "nodes": len(self.nodes),
+            "edges": self.edge_count,
+            "violations": self.violation_count + len(self.graph_violations),
+            "skipped": len(self.nodes) - len(self.facts)
+        }, stats if self.cache is not None else None)
+
+    def _defines(self, path: str) -> List[str]:
+        return self.facts[path]["defines"] if path in self.facts else []
+
+    def _new_ruby_index(self) -> RubyIndex:
+        self.removed_definitions = []
+        return build_ruby_index([self.nodes[path] for path in self._ordered_paths()], self.facts)
+
+    def _new_resolver(self) -> TsResolver:
+        return TsResolver("", set(self.nodes), read_text=self._read_config)
+
+    def _read_config(self, path: str) -> Optional[str]:
+        sha = self.configs.get(path)
+        data = self.blobs.read(sha) if sha else None
+        return decode_source(data) if data is not None else None
+
+def violation_key(violation: Dict[str, Any]) -> str:
+    """
+    What tells violations apart across commits: everything but the line
+    number, which moves with unrelated edits above it
+    """
+    return json.dumps({key: value for key, value in violation.items() if key != "line_number"}, sort_keys=True)
+
+def unmatched_violations(violations: List[Dict[str, Any]], others: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    The violations with no counterpart among others, pairing equal keys
+    (see violation_key) one to one
+    """
+    remaining = Counter(map(violation_key, others))
+    unmatched = []
+    for violation in violations:
+        key = violation_key(violation)
+        if remaining[key]:
+            remaining[key] -= 1
+        else:
+            unmatched.append(violation)
+    return unmatched
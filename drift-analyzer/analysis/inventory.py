@@ -0,0 +1,101 @@
+import fnmatch
+import logging
+import os
+from typing import List, NamedTuple, Optional, Union
+
+# Directory names that never hold first-party source: dependency trees,
+# VCS metadata and build output. Hidden directories (.git, .next, ...) are
+# skipped as well, matching what recursive glob used to do.
+IGNORED_DIRS = frozenset({
+    "node_modules",
+    "vendor",
+    "bower_components",
+    "dist",
+    "build",
+    "out",
+    "coverage",
+    "tmp",
+    "log",
+    "__pycache__",
+})
+
+logger = logging.getLogger(__name__)
+
+class SourceFile(NamedTuple):
+    """
+    A source file discovered by the inventory walk
+    """
+    path: str  # relative to the repository root
+    lang: str  # "ruby" or "typescript"
+
+def detect_lang(name: str) -> Optional[str]:
+    """
+    Map a file name to the language the collectors understand
+    """
+    if name.endswith(".rb"):
+        return "ruby"
+    if fnmatch.fnmatch(name, "*.ts*"):
+        return "typescript"
+    return None
+
+def inventory_lang(path: str) -> Optional[str]:
+    """
+    The language build_inventory lists a "/"-separated repo-relative path
+    under, or None when the walk would skip it
+    """
+    parts = path.split("/")
+    if any(part.startswith(".") for part in parts) or any(part in IGNORED_DIRS for part in parts[:-1]):
+        return None
+    return detect_lang(parts[-1])
+
+def build_inventory(root: str) -> List[SourceFile]:
+    """
+    Walk the repository once with os.scandir and list every analysable file
+
+    Ignored and hidden directories are pruned without being entered, and the
+    result is sorted by path so every scan sees files in the same order.
+    """
+    files = []
+    stack = [""]
+
+    while stack:
+        rel_dir = stack.pop()
+        try:
+            with os.scandir(os.path.join(root, rel_dir)) as it:
+                entries = list(it)
+        except OSError as e:
+            logger.warning("Error listing %s: %s", os.path.join(root, rel_dir), e)
+            continue
+
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in IGNORED_DIRS:
+                        stack.append(rel_path)
+                    continue
+                if not entry.is_file():
+                    continue
+            except OSError:
+                continue
+
+            lang = detect_lang(entry.name)
+            if lang:
+                files.append(SourceFile(rel_path, lang))
+
+    files.sort()
+    return files
+
+def decode_source(data: Union[bytes, memoryview]) -> str:
+    """
+    Decode file bytes (or a mapping of them) the way the collectors expect
+
+    Newlines are normalized like text-mode open() would, so line numbers
+    match what an editor shows.
+    """
+    text = str(data, "utf-8", "ignore")
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
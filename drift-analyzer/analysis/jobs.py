@@ -0,0 +1,258 @@
+import multiprocessing
+import os
+import pickle
+import queue
+import signal
+import subprocess
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+# Job lifecycle states; the last four are terminal
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TIMED_OUT = "timed_out"
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED, TIMED_OUT)
+
+class QueueFullError(Exception):
+    """
+    Raised when a job is submitted while the queue is at its depth limit
+    """
+
+def _run_in_child(conn, func: Callable[..., Any], kwargs: Dict[str, Any]) -> None:
+    """
+    Worker process entry point: run the job and send back its outcome
+
+    The job leads a session of its own, so _terminate reaches the parser
+    pool and git processes it starts along with it.
+    """
+    if hasattr(os, "setsid"):
+        os.setsid()
+    try:
+        conn.send(("ok", func(**kwargs)))
+    except subprocess.CalledProcessError as e:
+        conn.send(("error", f"Git operation failed: {e.stderr}"))
+    except Exception as e:
+        conn.send(("error", f"Analysis failed: {str(e)}"))
+    finally:
+        conn.close()
+
+def _terminate(process) -> None:
+    """
+    Send SIGTERM to a job process and everything it started
+    """
+    if hasattr(os, "killpg"):
+        try:
+            # Only a job that has called setsid leads a group of its own pid
+            if os.getpgid(process.pid) == process.pid:
+                os.killpg(process.pid, signal.SIGTERM)
+                return
+        except OSError:
+            pass
+    process.terminate()
+
+class JobManager:
+    """
+    Runs analysis jobs in a bounded pool of worker processes
+
+    Each job runs in its own child process so a job that exceeds its timeout
+    or is cancelled mid-run can be terminated outright. At most `workers`
+    jobs run at once and at most `queue_depth` more may wait. Finished jobs
+    are kept for polling for `retention_seconds`, and while no more than
+    `retention` of them, holding no more than `retention_bytes` of pickled
+    results, have finished since; the newest finished job is always kept.
+    on_result, if given, is called in this process with each successful
+    job's result.
+    """
+
+    def __init__(self, workers: Optional[int] = None, queue_depth: Optional[int] = None,
+                 timeout: Optional[float] = None, retention: Optional[int] = None,
+                 retention_bytes: Optional[int] = None, retention_seconds: Optional[float] = None,
+                 on_result: Optional[Callable[[Any], None]] = None):
+        self.workers = workers or int(os.environ.get("DRIFT_JOB_WORKERS", os.cpu_count() or 1))
+        self.queue_depth = queue_depth or int(os.environ.get("DRIFT_JOB_QUEUE_DEPTH", 100))
+        self.timeout = timeout or float(os.environ.get("DRIFT_JOB_TIMEOUT", 900))
+        self.retention = retention or int(os.environ.get("DRIFT_JOB_RETENTION", 1000))
+        self.retention_bytes = retention_bytes or int(os.environ.get("DRIFT_JOB_RETENTION_BYTES", 256 * 1024 * 1024))
+        self.retention_seconds = retention_seconds or float(os.environ.get("DRIFT_JOB_RETENTION_SECONDS", 3600))
+        self.on_result = on_result
+
+        # spawn keeps children clear of locks held by the server's threads
+        self._context = multiprocessing.get_context("spawn")
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._processes: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._pending = 0
+        self._threads = [threading.Thread(target=self._worker, daemon=True, name=f"drift-job-{i}")
+                         for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, func: Callable[..., Any], **kwargs: Any) -> Dict[str, Any]:
+        """
+        Queue func(**kwargs) to run in a worker process and return the job record
+        """
+        with self._lock:
+            if self._pending >= self.queue_depth:
+                raise QueueFullError(f"Job queue is full ({self.queue_depth} jobs waiting)")
+            job_id = uuid.uuid4().hex
+            job = {
+                "id": job_id,
+                "status": QUEUED,
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "result": None,
+                "error": None,
+            }
+            self._jobs[job_id] = job
+            self._pending += 1
+            job["_call"] = (func, kwargs)
+        self._queue.put(job_id)
+        return self._public(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Return a snapshot of a job, or None if it is unknown or expired
+        """
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(job_id)
+            return self._public(job) if job else None
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Cancel a queued or running job; finished jobs are left untouched
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job["status"] == QUEUED:
+                self._finish(job, CANCELLED)
+                self._pending -= 1
+            elif job["status"] == RUNNING:
+                # The worker thread notices the dead process and records it
+                job["_cancel"] = True
+                process = self._processes.get(job_id)
+                if process is not None:
+                    _terminate(process)
+            return self._public(job)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Count jobs per status
+        """
+        with self._lock:
+            self._expire()
+            counts = {status: 0 for status in (QUEUED, RUNNING) + FINISHED_STATES}
+            for job in self._jobs.values():
+                counts[job["status"]] += 1
+            return counts
+
+    def shutdown(self) -> None:
+        """
+        Stop the worker threads and terminate any running job processes
+        """
+        with self._lock:
+            for process in self._processes.values():
+                _terminate(process)
+        for _ in self._threads:
+            self._queue.put(None)
+
+    def _worker(self) -> None:
+        while True:
+            job_id = self._queue.get()
+            if job_id is None:
+                return
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None or job["status"] != QUEUED:
+                    continue
+                self._pending -= 1
+                job["status"] = RUNNING
+                job["started_at"] = time.time()
+                func, kwargs = job.pop("_call")
+            self._run(job, func, kwargs)
+
+    def _run(self, job: Dict[str, Any], func: Callable[..., Any], kwargs: Dict[str, Any]) -> None:
+        receiver, sender = self._context.Pipe(duplex=False)
+        # Not a daemon: jobs may start their own parser process pool
+        process = self._context.Process(target=_run_in_child, args=(sender, func, kwargs))
+        with self._lock:
+            if job.get("_cancel"):
+                self._finish(job, CANCELLED)
+                return
+            process.start()
+            self._processes[job["id"]] = process
+        sender.close()
+
+        outcome = None
+        size = 0
+        timed_out = False
+        try:
+            # Read before joining: a large result would otherwise block the
+            # child on a full pipe
+            if receiver.poll(self.timeout):
+                data = receiver.recv_bytes()
+                size = len(data)
+                outcome = pickle.loads(data)
+            else:
+                timed_out = True
+        except EOFError:
+            pass
+        finally:
+            receiver.close()
+            if outcome is None and process.is_alive():
+                _terminate(process)
+            process.join()
+
+        with self._lock:
+            self._processes.pop(job["id"], None)
+            if job.get("_cancel"):
+                self._finish(job, CANCELLED)
+            elif timed_out:
+                self._finish(job, TIMED_OUT, error=f"Job exceeded the {self.timeout:g}s timeout")
+            elif outcome is None:
+                self._finish(job, FAILED, error=f"Worker process exited with code {process.exitcode}")
+            elif outcome[0] == "ok":
+                job["_size"] = size
+                self._finish(job, SUCCEEDED, result=outcome[1])
+            else:
+                self._finish(job, FAILED, error=outcome[1])
+        if outcome is not None and outcome[0] == "ok" and self.on_result is not None:
+            self.on_result(outcome[1])
+
+    def _finish(self, job: Dict[str, Any], status: str, result: Any = None, error: Optional[str] = None) -> None:
+        # Caller holds self._lock
+        job.pop("_call", None)
+        job["status"] = status
+        job["finished_at"] = time.time()
+        job["result"] = result
+        job["error"] = error
+        self._expire()
+
+    def _expire(self) -> None:
+        # Caller holds self._lock. Drop finished jobs, oldest first, past the
+        # retention age, count or result bytes
+        finished = sorted((j for j in self._jobs.values() if j["status"] in FINISHED_STATES),
+                          key=lambda j: j["finished_at"])
+        count = len(finished)
+        total = sum(j.get("_size", 0) for j in finished)
+        cutoff = time.time() - self.retention_seconds
+        for j in finished[:-1]:
+            if j["finished_at"] >= cutoff and count <= self.retention and total <= self.retention_bytes:
+                break
+            del self._jobs[j["id"]]
+            count -= 1
+            total -= j.get("_size", 0)
+
+    @staticmethod
+    def _public(job: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: value for key, value in job.items() if not key.startswith("_")}
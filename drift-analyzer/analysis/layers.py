@@ -0,0 +1,204 @@
+import functools
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional, Pattern, Tuple
+
+# Match case-insensitively where the filesystem does, like fnmatch did
+_FLAGS = re.IGNORECASE if os.path.normcase("A") == "a" else 0
+
+# Matchers are reused across scans, so bound the per-directory memo
+_MAX_CACHED_DIRS = 100_000
+
+def _split_top_level(text: str, sep: str) -> List[str]:
+    """
+    Split text on sep, ignoring separators nested inside braces
+    """
+    parts = []
+    depth = 0
+    start = 0
+    for i, c in enumerate(text):
+        if c == "{":
+            depth += 1
+        elif c == "}" and depth:
+            depth -= 1
+        elif c == sep and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return parts
+
+def _matching_brace(pattern: str, start: int) -> int:
+    depth = 0
+    for i in range(start, len(pattern)):
+        if pattern[i] == "{":
+            depth += 1
+        elif pattern[i] == "}":
+            depth -= 1
+            if depth == 0:
+                return i
+    return -1
+
+def glob_to_regex(pattern: str, globstar: bool) -> str:
+    """
+    Translate a layer glob into a regex source string
+
+    Both modes support [...] classes and {a,b} brace alternatives. With
+    globstar, `*` and `?` stay within one path segment and `**` spans
+    directories (`**/` matches zero or more of them). Without it, `*` and
+    `?` may also match `/`, which is what fnmatch always did.
+    """
+    star = "[^/]*" if globstar else ".*"
+    question = "[^/]" if globstar else "."
+    out = []
+    i = 0
+    n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == "*":
+            if pattern.startswith("**", i) and globstar:
+                if pattern.startswith("**/", i):
+                    out.append("(?:.*/)?")
+                    i += 3
+                else:
+                    out.append(".*")
+                    i += 2
+                continue
+            while i < n and pattern[i] == "*":
+                i += 1
+            out.append(star)
+            continue
+        if c == "/" and globstar and pattern[i:] == "/**":
+            out.append("(?:/.*)?")
+            break
+        if c == "?":
+            out.append(question)
+        elif c == "[":
+            j = i + 1
+            if j < n and pattern[j] == "!":
+                j += 1
+            if j < n and pattern[j] == "]":
+                j += 1
+            end = pattern.find("]", j)
+            if end == -1:
+                out.append("\\[")
+            else:
+                body = pattern[i + 1:end].replace("\\", "\\\\")
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                elif body.startswith("^"):
+                    body = "\\" + body
+                out.append(f"[{body}]")
+                i = end
+        elif c == "{":
+            end = _matching_brace(pattern, i)
+            if end == -1:
+                out.append("\\{")
+            else:
+                alternatives = _split_top_level(pattern[i + 1:end], ",")
+                out.append("(?:" + "|".join(glob_to_regex(alt, globstar) for alt in alternatives) + ")")
+                i = end
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+class _CompiledPattern:
+    """
+    One layer pattern, split into directory and file-name halves when the
+    file-name half can never match a `/`
+    """
+
+    def __init__(self, layer_index: int, pattern: str):
+        self.layer_index = layer_index
+        globstar = "**" in pattern
+        self.full_source = glob_to_regex(pattern, globstar)
+        self.dir_re: Optional[Pattern] = None
+        self.base_source: Optional[str] = None
+
+        parts = _split_top_level(pattern, "/")
+        base = parts[-1]
+        if len(parts) > 1 and "**" not in base and "/" not in base:
+            dir_glob = "/".join(parts[:-1])
+            base_source = glob_to_regex(base, globstar)
+            # Without globstar a wildcard in the file name could still span
+            # directories, so only literal names can be split off
+            if globstar or not re.search(r"[*?\[]", base):
+                self.dir_re = re.compile(glob_to_regex(dir_glob, globstar), _FLAGS)
+                self.base_source = base_source
+
+class LayerMatcher:
+    """
+    The `layers` config compiled for fast first-match-wins lookups
+
+    Patterns with `**` use globstar semantics; all others keep the fnmatch
+    meaning they always had. Results are memoized per directory: each
+    directory is tested once against the directory half of every pattern,
+    and the patterns that survive are combined into a single regex shared by
+    every directory with the same survivors.
+    """
+
+    def __init__(self, layers: List[Dict[str, Any]]):
+        self.names = [layer["name"] for layer in layers]
+        self.patterns = [
+            _CompiledPattern(layer_index, pattern.replace("\\", "/"))
+            for layer_index, layer in enumerate(layers)
+            for pattern in layer["patterns"]
+        ]
+        self._dir_cache: Dict[str, Tuple[Optional[Pattern], List[int]]] = {}
+        self._combined: Dict[Tuple[int, ...], Pattern] = {}
+
+    def match(self, path: str) -> str:
+        """
+        Return the first layer whose patterns match path, or "unknown"
+        """
+        # Normalize path separators to forward slashes for consistent pattern matching
+        normalized_path = path.replace("\\", "/")
+        directory = normalized_path.rpartition("/")[0]
+
+        entry = self._dir_cache.get(directory)
+        if entry is None:
+            if len(self._dir_cache) >= _MAX_CACHED_DIRS:
+                self._dir_cache.clear()
+            entry = self._dir_cache[directory] = self._compile_directory(directory)
+        combined, layer_by_group = entry
+        if combined is None:
+            return "unknown"
+        found = combined.fullmatch(normalized_path)
+        if found is None:
+            return "unknown"
+        return self.names[layer_by_group[found.lastindex - 1]]
+
+    def _compile_directory(self, directory: str) -> Tuple[Optional[Pattern], List[int]]:
+        candidates = tuple(
+            i for i, pattern in enumerate(self.patterns)
+            if pattern.dir_re is None or pattern.dir_re.fullmatch(directory)
+        )
+        if not candidates:
+            return None, []
+
+        combined = self._combined.get(candidates)
+        if combined is None:
+            # Alternation tries branches left to right, so the first
+            # pattern (in config order) that matches wins
+            branches = []
+            for i in candidates:
+                pattern = self.patterns[i]
+                if pattern.base_source is not None:
+                    # The directory half already matched; test the file name
+                    source = f"(?:.*/)?{pattern.base_source}"
+                else:
+                    source = pattern.full_source
+                branches.append(f"({source})")
+            combined = self._combined[candidates] = re.compile("|".join(branches), _FLAGS)
+        return combined, [self.patterns[i].layer_index for i in candidates]
+
+@functools.lru_cache(maxsize=32)
+def _cached_matcher(layers_key: str) -> LayerMatcher:
+    return LayerMatcher(json.loads(layers_key))
+
+def compile_layers(layers: List[Dict[str, Any]]) -> LayerMatcher:
+    """
+    Compile a layers config, reusing the matcher for configs seen recently
+    """
+    return _cached_matcher(json.dumps(layers, sort_keys=True))
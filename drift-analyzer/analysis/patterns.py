@@ -0,0 +1,150 @@
+import functools
+import logging
+import re
+import threading
+from typing import Dict, List, Optional, Pattern, Sequence, Tuple, Union
+
+# Patterns that cannot share one alternation: backreferences would point at
+# the wrong group once renumbered, and global inline flags are only legal at
+# the very start of an expression
+_SOLO_RE = re.compile(r"\\[1-9]|\(\?P=|^\(\?[aiLmsux]+\)")
+
+logger = logging.getLogger(__name__)
+
+# Regex passes made by PatternSet.scan, per thread
+_counts = threading.local()
+
+def regex_evaluations() -> int:
+    """
+    How many regex passes PatternSet.scan has made in this thread so far
+    """
+    return getattr(_counts, "evaluations", 0)
+
+class PatternSet:
+    """
+    Many regexes searched with a single pass over the text
+
+    Patterns are joined into one alternation with a named group each, so a
+    file is scanned once no matter how many patterns apply to it. Because an
+    alternation reports only one pattern per position, any pattern not yet
+    seen gets another pass over just the remaining ones; that only happens
+    when something matched, and stops as soon as a pass finds nothing new.
+    A binary set compiles the same patterns as bytes regexes, to scan raw
+    or memory-mapped file content; see compile_binary_pattern_set.
+    """
+
+    def __init__(self, patterns: Sequence[str], binary: bool = False):
+        self.patterns = list(patterns)
+        self.binary = binary
+        self._solo: List[Tuple[int, Pattern]] = []
+        self._individual: Dict[int, Pattern] = {}
+        shared = []
+        for index, pattern in enumerate(self.patterns):
+            try:
+                compiled = self._individual[index] = re.compile(pattern.encode("ascii") if binary else pattern)
+            except re.error as e:
+                # Log error but keep scanning with the valid patterns
+                logger.warning("Invalid pattern %r: %s", pattern, e)
+                continue
+            if _SOLO_RE.search(pattern):
+                self._solo.append((index, compiled))
+            else:
+                shared.append(index)
+        self._shared = tuple(shared)
+        self._alternations: Dict[Tuple[int, ...], Tuple[Optional[Pattern], Dict[int, int]]] = {}
+
+        try:
+            self._combined(self._shared)
+        except re.error:
+            # e.g. two patterns define the same group name
+            self._solo += [(index, self._individual[index]) for index in self._shared]
+            self._shared = ()
+
+    def _combined(self, indexes: Tuple[int, ...]) -> Tuple[Optional[Pattern], Dict[int, int]]:
+        entry = self._alternations.get(indexes)
+        if entry is None:
+            if not indexes:
+                return None, {}
+            source = "|".join(f"(?P<_p{index}>{self.patterns[index]})" for index in indexes)
+            combined = re.compile(source.encode("ascii") if self.binary else source)
+            # The wrapping group closes last, so lastindex identifies the pattern
+            entry = (combined, {combined.groupindex[f"_p{index}"]: index for index in indexes})
+            if len(self._alternations) >= 64:
+                self._alternations.clear()
+            self._alternations[indexes] = entry
+        return entry
+
+    def scan(self, content: Union[str, bytes, memoryview]) -> Dict[int, int]:
+        """
+        Map the index of every pattern found in content to the line number
+        of its first occurrence
+        """
+        found = {}
+        evaluations = 0
+        remaining = self._shared
+        while remaining:
+            combined, pattern_by_group = self._combined(remaining)
+            evaluations += 1
+            new = set()
+            for match in combined.finditer(content):
+                new.add(pattern_by_group[match.lastindex])
+                if len(new) == len(remaining):
+                    break
+            if not new:
+                break
+            for index in new:
+                found[index] = None
+            remaining = tuple(index for index in remaining if index not in new)
+
+        evaluations += len(self._solo)
+        for index, compiled in self._solo:
+            match = compiled.search(content)
+            if match:
+                found[index] = _line_of(content, match.start())
+
+        for index, line in found.items():
+            if line is None:
+                # An alternation may have shadowed this pattern's earliest
+                # occurrence, so look it up on its own
+                found[index] = _line_of(content, self._individual[index].search(content).start())
+                evaluations += 1
+        _counts.evaluations = regex_evaluations() + evaluations
+        return found
+
+def _line_of(content, position: int) -> int:
+    if isinstance(content, str):
+        return content.count("\n", 0, position) + 1
+    # Count lines the way decode_source normalizes them
+    prefix = content[:position]
+    return prefix.count(b"\n") + prefix.count(b"\r") - prefix.count(b"\r\n") + 1
+
+@functools.lru_cache(maxsize=256)
+def compile_pattern_set(patterns: Tuple[str, ...]) -> PatternSet:
+    """
+    Build (or reuse) the PatternSet for a tuple of patterns
+    """
+    return PatternSet(patterns)
+
+@functools.lru_cache(maxsize=256)
+def compile_binary_pattern_set(patterns: Tuple[str, ...]) -> Optional[PatternSet]:
+    """
+    Build (or reuse) a binary PatternSet for a tuple of patterns
+
+    Returns None when some pattern is not plain ASCII or only compiles as a
+    str regex (e.g. one using \\u escapes); such content has to be decoded
+    and scanned with compile_pattern_set. Classes like \\w and \\s match
+    ASCII characters only in a binary set.
+    """
+    for pattern in patterns:
+        if not pattern.isascii():
+            return None
+        try:
+            re.compile(pattern)
+        except re.error:
+            # Invalid either way; PatternSet logs and drops it
+            continue
+        try:
+            re.compile(pattern.encode("ascii"))
+        except re.error:
+            return None
+    return PatternSet(patterns, binary=True)
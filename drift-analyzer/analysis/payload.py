@@ -0,0 +1,73 @@
+from typing import Any, Dict, List, Optional
+
+from .graph import EdgeGraph
+
+# Columns of the compact payload, per section. Every column except
+# line_number holds indexes into the shared string table.
+COMPACT_COLUMNS = {
+    "nodes": ("path", "module_name", "layer", "lang"),
+    "edges": ("from_path", "to_path", "edge_type", "line_number"),
+    "violations": ("rule_code", "severity", "node_path", "details", "suggestion", "edge_type", "line_number"),
+}
+NUMERIC_COLUMNS = {"line_number"}
+
+def compact_result(result: Dict[str, Any], graph: Optional[EdgeGraph] = None) -> Dict[str, Any]:
+    """
+    Convert an analysis result into the columnar "compact" payload
+
+    Each section becomes a dict of equal-length column lists, and every
+    string is stored once in "strings" and referred to by index, so a path
+    shared by many edges and violations is sent only once. Missing values
+    are null. When the edges are in an EdgeGraph, pass it as graph instead
+    of result["edges"]: its string table and columns are used as they are.
+    """
+    strings: List[str] = list(graph.strings) if graph is not None else []
+    ids: Dict[str, int] = dict(graph.ids) if graph is not None else {}
+
+    def intern(value: Optional[str]) -> Optional[int]:
+        if value is None:
+            return None
+        string_id = ids.get(value)
+        if string_id is None:
+            string_id = ids[value] = len(strings)
+            strings.append(value)
+        return string_id
+
+    payload: Dict[str, Any] = {"format": "compact", "strings": strings}
+    for section, columns in COMPACT_COLUMNS.items():
+        if section == "edges" and graph is not None:
+            payload[section] = {
+                "from_path": graph.from_ids.tolist(),
+                "to_path": graph.to_ids.tolist(),
+                "edge_type": graph.type_ids.tolist(),
+                "line_number": [line or None for line in graph.lines]
+            }
+            continue
+        records = result.get(section, [])
+        payload[section] = {
+            column: [record.get(column) for record in records] if column in NUMERIC_COLUMNS
+            else [intern(record.get(column)) for record in records]
+            for column in columns
+        }
+    payload["metrics"] = result.get("metrics", {})
+    return payload
+
+def expand_result(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Turn a compact payload back into the usual lists of records
+    """
+    strings = payload["strings"]
+    result: Dict[str, Any] = {}
+    for section, columns in COMPACT_COLUMNS.items():
+        table = payload[section]
+        records = []
+        for row in zip(*(table[column] for column in columns)):
+            record = {}
+            for column, value in zip(columns, row):
+                if value is None:
+                    continue
+                record[column] = value if column in NUMERIC_COLUMNS else strings[value]
+            records.append(record)
+        result[section] = records
+    result["metrics"] = payload["metrics"]
+    return result
@@ -0,0 +1,207 @@
+from array import array
+from collections import deque
+from typing import Dict, List, Optional
+
+from .graph import EdgeGraph
+
+class Reachability:
+    """
+    The file-level dependency graph condensed into strongly connected
+    components, with the layers reachable from each component
+
+    Components come from an iterative Tarjan pass, which emits them in
+    reverse topological order, so a single pass in emission order can OR
+    every component's successors into its own reach set. Reach sets are
+    ints used as bitsets with one bit per layer, which keeps the whole
+    computation linear in files and edges. Vertices are the graph's string
+    ids; files in excluded_layer are dropped with all their edges, which
+    answers "can X reach Y without going through Z".
+    """
+
+    def __init__(self, graph: EdgeGraph, excluded_layer: Optional[int] = None):
+        self.graph = graph
+        n = len(graph.strings)
+        layer_ids = graph.layer_ids
+        self.bit_of: Dict[int, int] = {}
+        for layer in layer_ids:
+            if layer >= 0 and layer not in self.bit_of:
+                self.bit_of[layer] = len(self.bit_of)
+
+        kept = [
+            i for i, (from_id, to_id) in enumerate(zip(graph.from_ids, graph.to_ids))
+            if excluded_layer is None or (layer_ids[from_id] != excluded_layer and layer_ids[to_id] != excluded_layer)
+        ]
+        self.offsets, self.targets, self.edge_ids = _adjacency(n, kept, graph.from_ids, graph.to_ids)
+        self.reverse_offsets, self.sources, self.reverse_edge_ids = _adjacency(n, kept, graph.to_ids, graph.from_ids)
+        self.excluded_layer = excluded_layer
+
+        self.component, count = _tarjan(n, self.offsets, self.targets)
+        self.reach = self._component_reach(count)
+        self._paths: Dict[int, array] = {}
+
+    def _component_reach(self, count: int) -> List[int]:
+        n = len(self.component)
+        reach = [0] * count
+        members: List[List[int]] = [[] for _ in range(count)]
+        for vertex in range(n):
+            component = self.component[vertex]
+            members[component].append(vertex)
+            layer = self.graph.layer_ids[vertex]
+            if layer >= 0 and layer != self.excluded_layer:
+                reach[component] |= 1 << self.bit_of[layer]
+
+        # Every successor component was emitted, and so finished, earlier
+        offsets, targets = self.offsets, self.targets
+        for component in range(count):
+            bits = reach[component]
+            for vertex in members[component]:
+                for position in range(offsets[vertex], offsets[vertex + 1]):
+                    successor = self.component[targets[position]]
+                    if successor != component:
+                        bits |= reach[successor]
+            reach[component] = bits
+        return reach
+
+    def reaches(self, vertex: int, layer: int) -> bool:
+        """
+        Whether the file with string id vertex can reach a file in layer
+        (itself included)
+        """
+        bit = self.bit_of.get(layer)
+        if bit is None or self.graph.layer_ids[vertex] == self.excluded_layer:
+            return False
+        return bool(self.reach[self.component[vertex]] >> bit & 1)
+
+    def layer_reach(self) -> Dict[int, int]:
+        """
+        Map each layer id to the bitset of layers its files can reach
+        """
+        reach: Dict[int, int] = {}
+        for vertex, layer in enumerate(self.graph.layer_ids):
+            if layer >= 0 and layer != self.excluded_layer:
+                reach[layer] = reach.get(layer, 0) | self.reach[self.component[vertex]]
+        return reach
+
+    def path_to_layer(self, vertex: int, layer: int) -> List[int]:
+        """
+        Edge indexes of a shortest path from vertex to a file in layer, or
+        [] when there is none (or vertex is already in layer)
+        """
+        next_edge = self._paths.get(layer)
+        if next_edge is None:
+            next_edge = self._paths[layer] = self._next_edges(layer)
+        path = []
+        while next_edge[vertex] >= 0:
+            path.append(next_edge[vertex])
+            vertex = self.graph.to_ids[next_edge[vertex]]
+        return path
+
+    def _next_edges(self, layer: int) -> array:
+        """
+        One backwards breadth-first search from every file in layer; each
+        vertex that can reach one gets the first edge of a shortest path
+        """
+        n = len(self.component)
+        next_edge = array("i", [-1]) * n
+        seen = bytearray(n)
+        queue = deque()
+        for vertex, vertex_layer in enumerate(self.graph.layer_ids):
+            if vertex_layer == layer:
+                seen[vertex] = 1
+                queue.append(vertex)
+        while queue:
+            vertex = queue.popleft()
+            for position in range(self.reverse_offsets[vertex], self.reverse_offsets[vertex + 1]):
+                source = self.sources[position]
+                if not seen[source]:
+                    seen[source] = 1
+                    next_edge[source] = self.reverse_edge_ids[position]
+                    queue.append(source)
+        return next_edge
+
+    def describe_path(self, edge_indexes: List[int]) -> str:
+        """
+        A path as "a → b → c"
+        """
+        strings = self.graph.strings
+        hops = [strings[self.graph.from_ids[edge_indexes[0]]]]
+        hops += [strings[self.graph.to_ids[i]] for i in edge_indexes]
+        return " → ".join(hops)
+
+def _adjacency(n: int, edge_indexes: List[int], from_ids: array, to_ids: array):
+    """
+    Compressed adjacency lists: the neighbours of v are
+    targets[offsets[v]:offsets[v + 1]], reached through edge_ids[...]
+    """
+    offsets = array("i", [0]) * (n + 1)
+    for i in edge_indexes:
+        offsets[from_ids[i] + 1] += 1
+    for v in range(n):
+        offsets[v + 1] += offsets[v]
+    fill = offsets[:-1]
+    targets = array("i", [0]) * len(edge_indexes)
+    edge_ids = array("i", [0]) * len(edge_indexes)
+    for i in edge_indexes:
+        position = fill[from_ids[i]]
+        fill[from_ids[i]] = position + 1
+        targets[position] = to_ids[i]
+        edge_ids[position] = i
+    return offsets, targets, edge_ids
+
+def _tarjan(n: int, offsets: array, targets: array):
+    """
+    Iterative Tarjan: the component id of every vertex, and the number of
+    components, numbered in reverse topological order
+    """
+    index = array("i", [-1]) * n
+    low = array("i", [0]) * n
+    on_stack = bytearray(n)
+    component = array("i", [-1]) * n
+    stack: List[int] = []
+    counter = 0
+    count = 0
+
+    for root in range(n):
+        if index[root] != -1:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = 1
+        work = [(root, offsets[root])]
+        while work:
+            vertex, position = work[-1]
+            end = offsets[vertex + 1]
+            descended = False
+            while position < end:
+                successor = targets[position]
+                position += 1
+                if index[successor] == -1:
+                    work[-1] = (vertex, position)
+                    index[successor] = low[successor] = counter
+                    counter += 1
+                    stack.append(successor)
+                    on_stack[successor] = 1
+                    work.append((successor, offsets[successor]))
+                    descended = True
+                    break
+                if on_stack[successor] and index[successor] < low[vertex]:
+                    low[vertex] = index[successor]
+            if descended:
+                continue
+
+            work.pop()
+            if low[vertex] == index[vertex]:
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = 0
+                    component[member] = count
+                    if member == vertex:
+                        break
+                count += 1
+            if work:
+                parent = work[-1][0]
+                if low[vertex] < low[parent]:
+                    low[parent] = low[vertex]
+
+    return component, count
@@ -0,0 +1,249 @@
+import logging
+import mmap
+import os
+import re
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Pattern, Tuple, Union
+
+from .gitstore import GitTree
+from .layers import glob_to_regex
+
+# Files larger than this are skipped unless DRIFT_MAX_FILE_BYTES says
+# otherwise (0 disables the cap)
+MAX_FILE_BYTES = 1024 ** 2
+
+# Bytes at the start of a file looked at to classify it
+SNIFF_BYTES = 8192
+
+# A sniffed head at least this long whose lines average more than
+# MINIFIED_LINE_BYTES is treated as minified
+MINIFIED_MIN_BYTES = 1024
+MINIFIED_LINE_BYTES = 300
+
+# Build artefacts the *.ts* inventory glob also picks up
+GENERATED_SUFFIXES = (".tsbuildinfo", ".map")
+
+# Markers code generators put in the comment a file starts with: an
+# @generated tag, or Go's "Code generated ... DO NOT EDIT." line
+_GENERATED_MARKER_RE = re.compile(rb"(?<![\w@])@generated\b|^Code generated .* DO NOT EDIT\b")
+
+# Line comment leaders, and the parts of block comments, of Ruby and TypeScript
+_LINE_COMMENT_RE = re.compile(rb"(?://+|#+)\s*")
+
+Buffer = Union[bytes, mmap.mmap]
+
+# What the collectors read files from: a checkout's root directory, or a
+# commit's tree in the object store
+Source = Union[str, GitTree]
+
+logger = logging.getLogger(__name__)
+
+def max_file_bytes() -> int:
+    """
+    The size cap: DRIFT_MAX_FILE_BYTES, else MAX_FILE_BYTES
+    """
+    return int(os.environ.get("DRIFT_MAX_FILE_BYTES", MAX_FILE_BYTES))
+
+def sniff(head: Buffer) -> Optional[str]:
+    """
+    Classify a file from its first SNIFF_BYTES bytes: "binary", "minified",
+    "generated", or None for ordinary source
+    """
+    head = head[:SNIFF_BYTES]
+    if b"\0" in head:
+        return "binary"
+    if len(head) >= MINIFIED_MIN_BYTES and len(head) / (head.count(b"\n") + 1) > MINIFIED_LINE_BYTES:
+        return "minified"
+    if has_generated_header(head):
+        return "generated"
+    return None
+
+def has_generated_header(head: Buffer) -> bool:
+    """
+    Whether the comment lines a file starts with (after any blank lines)
+    carry a generator's marker; the first line of code ends the search, so
+    a file that only mentions generated code is still analysed
+    """
+    block_end = None
+    for line in bytes(head).lstrip(b"\xef\xbb\xbf").splitlines():
+        line = line.strip()
+        if block_end == b"=end":
+            if line == block_end:
+                block_end = None
+            text = line
+        elif block_end is not None:
+            if block_end in line:
+                block_end = None
+            text = line.strip(b"/*").strip()
+        elif not line:
+            continue
+        elif line.startswith(b"/*"):
+            if b"*/" not in line[2:]:
+                block_end = b"*/"
+            text = line.strip(b"/*").strip()
+        elif line == b"=begin":
+            block_end = b"=end"
+            continue
+        else:
+            match = _LINE_COMMENT_RE.match(line)
+            if match is None:
+                return False
+            text = line[match.end():]
+        if _GENERATED_MARKER_RE.search(text):
+            return True
+    return False
+
+def skip_reason(path: str, data: Buffer, max_bytes: Optional[int] = None) -> Optional[str]:
+    """
+    Why a file's content should not be analysed, or None to analyse it
+
+    "generated" for known build artefacts by name, "too_large" above the
+    size cap, else whatever sniff finds in the head.
+    """
+    if path.endswith(GENERATED_SUFFIXES):
+        return "generated"
+    if max_bytes is None:
+        max_bytes = max_file_bytes()
+    if max_bytes and len(data) > max_bytes:
+        return "too_large"
+    return sniff(data)
+
+def parse_gitattributes(text: str) -> List[Tuple[Pattern, bool]]:
+    """
+    The linguist-generated rules of a root .gitattributes, as (path regex,
+    generated) pairs in file order; the last matching rule wins
+    """
+    rules = []
+    for line in text.splitlines():
+        fields = line.split()
+        if not fields or fields[0].startswith("#"):
+            continue
+        generated = None
+        for attr in fields[1:]:
+            if attr in ("linguist-generated", "linguist-generated=true"):
+                generated = True
+            elif attr in ("-linguist-generated", "!linguist-generated", "linguist-generated=false"):
+                generated = False
+        if generated is None:
+            continue
+        pattern = fields[0]
+        if pattern.endswith("/"):
+            # Directory patterns do not apply to files in gitattributes
+            continue
+        if "/" in pattern.rstrip("/"):
+            source = glob_to_regex(pattern.lstrip("/"), True)
+        else:
+            # A bare name matches at any depth
+            source = "(?:.*/)?" + glob_to_regex(pattern, True)
+        rules.append((re.compile(source), generated))
+    return rules
+
+def is_generated(attributes: List[Tuple[Pattern, bool]], path: str) -> bool:
+    """
+    Whether parsed .gitattributes rules mark path linguist-generated
+    """
+    generated = False
+    normalized = path.replace("\\", "/")
+    for pattern, value in attributes:
+        if pattern.fullmatch(normalized):
+            generated = value
+    return generated
+
+class SourceReader:
+    """
+    Reads repository files for the collectors, skipping the ones that are
+    not worth analysing
+
+    Files in a checkout are memory-mapped, so regexes can search them in
+    place (see compile_binary_pattern_set) without a copy or a decode; files
+    of a GitTree come from its object store as bytes. Files above the size
+    cap are skipped from their size alone; binary, minified and generated
+    ones from their first few KB, from their name, or from a
+    `linguist-generated` attribute in the root .gitattributes. Counts of
+    skipped files, by reason, are kept in `skipped`.
+    """
+
+    def __init__(self, root: Source, max_bytes: Optional[int] = None):
+        self.root = root
+        self.max_bytes = max_file_bytes() if max_bytes is None else max_bytes
+        self.skipped = {}
+        self._attributes = []
+        if isinstance(root, GitTree):
+            text = root.read_text(".gitattributes")
+            if text is not None:
+                self._attributes = parse_gitattributes(text)
+            return
+        try:
+            with open(os.path.join(root, ".gitattributes"), encoding="utf-8", errors="ignore") as f:
+                self._attributes = parse_gitattributes(f.read())
+        except OSError:
+            pass
+
+    def is_generated(self, path: str) -> bool:
+        """
+        Whether the root .gitattributes marks path linguist-generated
+        """
+        return is_generated(self._attributes, path)
+
+    @contextmanager
+    def open(self, path: str) -> Iterator[Optional[Buffer]]:
+        """
+        Map a checkout's file read-only (or read a GitTree's blob) for the
+        duration of the block
+
+        Yields None when the file cannot be read or is skipped. Empty files
+        cannot be mapped and come back as b"".
+        """
+        if path.endswith(GENERATED_SUFFIXES) or self.is_generated(path):
+            yield self._skip("generated")
+            return
+        if isinstance(self.root, GitTree):
+            yield self._read_blob(path)
+            return
+        try:
+            f = open(os.path.join(self.root, path), "rb")
+        except OSError as e:
+            logger.warning("Error reading %s: %s", path, e)
+            yield None
+            return
+        with f:
+            data = None
+            try:
+                size = os.fstat(f.fileno()).st_size
+                if size and not (self.max_bytes and size > self.max_bytes):
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError) as e:
+                logger.warning("Error reading %s: %s", path, e)
+                yield None
+                return
+            if data is None:
+                yield self._skip("too_large") if size else b""
+                return
+            with data:
+                reason = sniff(data)
+                yield self._skip(reason) if reason else data
+
+    def read(self, path: str) -> Optional[bytes]:
+        """
+        The bytes of a file, or None when it cannot be read or is skipped
+        """
+        with self.open(path) as data:
+            return bytes(data) if data is not None else None
+
+    def _read_blob(self, path: str) -> Optional[bytes]:
+        size = self.root.size(path)
+        if size is None:
+            logger.warning("Error reading %s: not in tree %s", path, self.root.commit)
+            return None
+        if self.max_bytes and size > self.max_bytes:
+            return self._skip("too_large")
+        data = self.root.read(path)
+        if data is None:
+            logger.warning("Error reading %s: blob missing from %s", path, self.root.git_dir)
+            return None
+        reason = sniff(data)
+        return self._skip(reason) if reason else data
+
+    def _skip(self, reason: str) -> None:
+        self.skipped[reason] = self.skipped.get(reason, 0) + 1
+        return None
@@ -0,0 +1,235 @@
+import os
+import re
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+# Everything the constant scan has to recognize or step over; the code in
+# between (method calls, locals, operators) is skipped by the regex engine
+# without reaching Python, and the leading character class lets it pass
+# over most positions without trying each alternative. Comments, strings,
+# heredoc openers, %-literals and symbols are listed first so constants
+# and keywords inside them are never seen. Matching bytes lets mapped files
+# be scanned without decoding them.
+_TOKEN_RE = re.compile(rb"""(?=[\#=_<"'`%:A-Z\nbcdefimuw])(?:
+    (?P<comment>\#[^\n]*)
+  | (?P<doc>^=begin\b.*?(?:^=end\b[^\n]*|\Z))
+  | (?P<data>^__END__$)
+  | (?P<heredoc><<[~-]?(?P<quote>['"`]?)(?P<tag>[A-Za-z_]\w*)(?P=quote))
+  | (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'|`(?:[^`\\]|\\.)*`)
+  | (?P<literal>%[qQwWiIsrx]?(?:\[[^\]]*\]|\([^)]*\)|\{[^}]*\}|<[^>]*>|\|[^|]*\|))
+  | (?<![:\w])(?P<symbol>:(?:[A-Za-z_]\w*[?!=]?|"(?:[^"\\]|\\.)*"))
+  | (?<![\w@$:.])(?P<const>(?:::)?[A-Z]\w*(?:::[A-Z]\w*)*)(?!\w|:(?!:))
+  | (?<![\w@$.])(?P<keyword>class|module|def|end|do|begin|case|for|if|unless|while|until)(?![\w?!]|:(?!:))
+  | (?P<newline>\n)
+)""", re.M | re.S | re.X)
+
+# Keywords that open a block only at the start of a statement or
+# expression; elsewhere they are modifiers (`return if done`)
+_CONDITIONALS = {b"if", b"unless", b"while", b"until"}
+
+# Loops whose optional `do` does not open a second block
+_LOOPS = {b"while", b"until", b"for"}
+
+# Code before a conditional on its line that makes it start an expression:
+# nothing, an operator or opening bracket, or a keyword such as `then`
+_EXPRESSION_START_RE = re.compile(rb"(?:^|[;=(\[{,|&!?:]|(?<![\w@$.])(?:then|else|do|begin|and|or|not))[ \t]*$")
+
+# After `class`: a singleton class, or the name being defined
+_CLASS_NAME_RE = re.compile(rb"[ \t]*(?:(?P<singleton><<)|(?P<name>(?:::)?[A-Z]\w*(?:::[A-Z]\w*)*))")
+
+# A Ruby 3 endless method (`def name(args) = value`) has no `end`
+_ENDLESS_DEF_RE = re.compile(rb"[ \t]+(?:self\.)?[^\s(=;]+(?:\([^)\n]*\)\s*|\s+)=(?![=~>(])")
+
+# Splits CamelCase for the file name Rails expects a constant in
+_WORD_BOUNDARY_RE = re.compile(r"(?<=[a-z0-9])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])")
+
+def scan_constants(content: Union[str, bytes, Any]) -> Tuple[List[str], List[List[Any]]]:
+    """
+    Find the constants one Ruby file defines and the ones it refers to, in
+    a single pass
+
+    Returns (definitions, references). Definitions are the fully qualified
+    names of every `class` and `module`, with lexical nesting applied
+    (`module Admin; class UsersController` defines
+    "Admin::UsersController"). References are [name, line number, scope]
+    for the first use of each name from each scope, where scope is the
+    qualified name of the innermost enclosing class or module ("" at top
+    level) and a name starting with "::" is absolute. Comments, strings,
+    heredocs, %-literals and symbols are skipped. Blocks are paired with
+    their `end` by keyword, so nesting is tracked without relying on
+    indentation.
+    """
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    definitions: List[str] = []
+    defined: Set[str] = set()
+    references: List[List[Any]] = []
+    seen: Set[Tuple[str, str]] = set()
+
+    # One entry per open block: the qualified name for a class or module,
+    # None for any other block
+    stack: List[Optional[str]] = []
+    scope = ""
+    # The superclass of `class Foo < Bar` resolves outside Foo
+    header_scope: Optional[str] = None
+    line = 1
+    line_start = 0
+    loop_line = 0
+    # Heredoc bodies start on the next line: (tag, squiggly or dashed)
+    heredocs: List[Tuple[bytes, bool]] = []
+
+    position = 0
+    while True:
+        match = _TOKEN_RE.search(content, position)
+        if match is None:
+            break
+        kind = match.lastgroup
+        token = match.group(kind)
+        position = match.end()
+
+        if kind == "newline":
+            line += 1
+            line_start = position
+            header_scope = None
+            if heredocs:
+                position, skipped = _skip_heredocs(content, position, heredocs)
+                line += skipped
+                line_start = position
+                heredocs = []
+        elif kind == "const":
+            name = token.decode("ascii")
+            ref_scope = scope if header_scope is None else header_scope
+            if (name, ref_scope) not in seen:
+                seen.add((name, ref_scope))
+                references.append([name, line, ref_scope])
+        elif kind == "keyword":
+            if token == b"end":
+                if stack and stack.pop() is not None:
+                    scope = next((name for name in reversed(stack) if name is not None), "")
+            elif token in (b"class", b"module"):
+                header = _CLASS_NAME_RE.match(content, position)
+                if header is None or header.group("singleton"):
+                    # `class << self`, or a dynamic name: a plain block
+                    stack.append(None)
+                    continue
+                name = header.group("name").decode("ascii")
+                qualified = name[2:] if name.startswith("::") else (f"{scope}::{name}" if scope else name)
+                stack.append(qualified)
+                if qualified not in defined:
+                    defined.add(qualified)
+                    definitions.append(qualified)
+                header_scope = scope
+                scope = qualified
+                position = header.end()
+            elif token == b"def":
+                if not _ENDLESS_DEF_RE.match(content, position):
+                    stack.append(None)
+            elif token == b"do":
+                if loop_line != line:
+                    stack.append(None)
+            elif token not in _CONDITIONALS or _EXPRESSION_START_RE.search(content[line_start:match.start()]):
+                stack.append(None)
+                if token in _LOOPS:
+                    loop_line = line
+        elif kind == "heredoc":
+            heredocs.append((match.group("tag"), token[2:3] in (b"~", b"-")))
+        elif kind == "data":
+            break
+        else:
+            line += token.count(b"\n")
+    return definitions, references
+
+def _skip_heredocs(content: bytes, position: int, heredocs: List[Tuple[bytes, bool]]) -> Tuple[int, int]:
+    """
+    Step over the bodies of the heredocs opened on the line ending at
+    position; returns where scanning resumes and the lines skipped
+    """
+    lines = 0
+    for tag, indented in heredocs:
+        terminator = re.compile((rb"^[ \t]*" if indented else rb"^") + re.escape(tag) + rb"[ \t]*\r?$", re.M)
+        end = terminator.search(content, position)
+        if end is None:
+            # Unterminated: the rest of the file is the body
+            return len(content), 0
+        lines += content[position:end.end()].count(b"\n") + 1
+        position = end.end() + 1
+    return position, lines
+
+class RubyIndex:
+    """
+    Where each Ruby constant is defined, built once per scan from every
+    file's definitions and shared by all reference lookups
+
+    A constant defined (or reopened) in several files belongs to the first
+    one, unless a later file is named the way Rails autoloading expects
+    (Admin::UsersController in admin/users_controller.rb) and the first is
+    not. Namespaces only ever written as part of a longer name (`class
+    Admin::UsersController` without a `module Admin`) are known too, so
+    references through them still resolve.
+    """
+
+    def __init__(self):
+        self.paths: Dict[str, str] = {}
+        self.namespaces: Set[str] = set()
+
+    def add(self, path: str, definitions: List[str]) -> None:
+        """
+        Record the constants one file defines
+        """
+        for name in definitions:
+            current = self.paths.get(name)
+            if current is None or (not _conventional(current, name) and _conventional(path, name)):
+                self.paths[name] = path
+            parts = name.split("::")
+            for end in range(1, len(parts)):
+                self.namespaces.add("::".join(parts[:end]))
+
+    def lookup(self, name: str, scope: str) -> Optional[str]:
+        """
+        The file defining name as referenced from scope, or None for
+        constants defined outside the repo
+
+        The first segment is looked up lexically, innermost scope first,
+        then the rest of the name under it. When the full name is not
+        defined (a constant assigned inside a class, say), the deepest
+        defined namespace of it is used instead.
+        """
+        if name.startswith("::"):
+            name = name[2:]
+            bases = [""]
+        else:
+            bases = _enclosing(scope)
+        parts = name.split("::")
+        for base in bases:
+            head = f"{base}::{parts[0]}" if base else parts[0]
+            if head not in self.paths and head not in self.namespaces:
+                continue
+            for end in range(len(parts), 0, -1):
+                candidate = "::".join([head] + parts[1:end])
+                if candidate in self.paths:
+                    return self.paths[candidate]
+            return None
+        return None
+
+    def resolve_targets(self, rp: str, references: List[List[Any]]) -> Iterator[Tuple[str, int]]:
+        """
+        (target path, line number) for each other file rp's references
+        resolve to, once per target at its first reference
+        """
+        targets = set()
+        for name, line, scope in references:
+            path = self.lookup(name, scope)
+            if path is not None and path != rp and path not in targets:
+                targets.add(path)
+                yield path, line
+
+def _enclosing(scope: str) -> List[str]:
+    # "A::B" -> ["A::B", "A", ""]
+    bases = [""]
+    if scope:
+        parts = scope.split("::")
+        bases = ["::".join(parts[:end]) for end in range(len(parts), 0, -1)] + bases
+    return bases
+
+def _conventional(path: str, name: str) -> bool:
+    expected = _WORD_BOUNDARY_RE.sub("_", name.rsplit("::", 1)[-1]).lower() + ".rb"
+    return os.path.basename(path) == expected
@@ -0,0 +1,80 @@
+from typing import Any, Dict, List, Tuple
+
+from .patterns import compile_pattern_set
+
+class RuleIndex:
+    """
+    Architecture rules compiled into lookup tables
+
+    Edges are matched against forbidden_dependencies and must_route_via with
+    one (from_layer, to_layer) lookup each, and disallowed_apis are grouped
+    by layer, so checking costs O(edges + nodes) rather than
+    O(rules x edges). Rule indexes are kept so violations can still be
+    reported in rule order.
+    """
+
+    def __init__(self, rules: Dict[str, Any]):
+        self.forbidden_dependencies = list(rules.get("forbidden_dependencies", []))
+        self.must_route_via = list(rules.get("must_route_via", []))
+        self.disallowed_apis = list(rules.get("disallowed_apis", []))
+
+        self.forbidden_by_pair: Dict[Tuple[str, str], List[int]] = {}
+        for index, rule in enumerate(self.forbidden_dependencies):
+            self.forbidden_by_pair.setdefault((rule["from"], rule["to"]), []).append(index)
+
+        # Transitive route rules cover direct edges too, so they are only
+        # checked against the whole graph
+        self.routes_by_pair: Dict[Tuple[str, str], List[int]] = {}
+        self.transitive_routes: List[int] = []
+        for index, rule in enumerate(self.must_route_via):
+            if rule.get("transitive"):
+                self.transitive_routes.append(index)
+            else:
+                self.routes_by_pair.setdefault((rule["from"], rule["to"]), []).append(index)
+
+        self.no_layer_cycles = bool(rules.get("no_layer_cycles"))
+        self.layer_names = [layer["name"] for layer in rules.get("layers", [])]
+
+        self.api_rules_by_layer: Dict[str, List[int]] = {}
+        self.api_patterns_by_layer: Dict[str, List[str]] = {}
+        for index, rule in enumerate(self.disallowed_apis):
+            self.api_rules_by_layer.setdefault(rule["layer"], []).append(index)
+            patterns = self.api_patterns_by_layer.setdefault(rule["layer"], [])
+            for pattern in rule["patterns"]:
+                if pattern not in patterns:
+                    patterns.append(pattern)
+        # Compile each layer's single-scan pattern set up front
+        for patterns in self.api_patterns_by_layer.values():
+            compile_pattern_set(tuple(patterns))
+
+    @property
+    def has_graph_rules(self) -> bool:
+        """
+        Whether any rule needs the whole graph rather than single edges
+        """
+        return bool(self.transitive_routes) or self.no_layer_cycles
+
+    def api_patterns(self, layer: str) -> List[str]:
+        """
+        The disallowed API patterns that apply to a layer, in rule order
+        """
+        return self.api_patterns_by_layer.get(layer, [])
+
+    def api_hits(self, layer: str, matched: Dict[str, int]) -> List[Tuple[int, str, int]]:
+        """
+        Pick (rule index, first matching pattern, its line) for every rule
+        on the layer, given the line each matched pattern was found on
+        """
+        hits = []
+        for index in self.api_rules_by_layer.get(layer, ()):
+            for pattern in self.disallowed_apis[index]["patterns"]:
+                if pattern in matched:
+                    hits.append((index, pattern, matched[pattern]))
+                    break
+        return hits
+
+def compile_rules(rules: Dict[str, Any]) -> RuleIndex:
+    """
+    Build the lookup tables for a rules dictionary
+    """
+    return RuleIndex(rules)
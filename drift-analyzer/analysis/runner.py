@@ -0,0 +1,499 @@
+import asyncio
+import functools
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
+from typing import Any, Dict, Iterator, List, Optional
+
+from .aggregate import VIEW_FORMATS, aggregate_result
+from .cache import FactCache, ResultCache, result_key
+from .gitstore import BlobReader, GitTree, HostLimiter, MirrorStore, rev_list
+from .history import HistoryWalker
+from .inventory import inventory_lang
+from .layers import compile_layers
+from .payload import compact_result
+from .scan import (FACTS_VERSION, ScanResult, collect_file_facts, collect_nodes, iter_analysis, make_node,
+                   make_resolver, scan_facts, scan_repo)
+from .shards import configured_peers, partition, post_shard
+from .telemetry import Telemetry
+
+logger = logging.getLogger(__name__)
+
+# Longest commit list one range analysis will walk
+RANGE_MAX_COMMITS = 5000
+
+# Streamed records are passed from the scan process in lists of this many,
+# with at most STREAM_QUEUE_BATCHES lists waiting for a slow client
+STREAM_BATCH_RECORDS = 500
+STREAM_QUEUE_BATCHES = 16
+
+# Seconds between checks that a streaming scan process is still running
+STREAM_POLL_SECONDS = 1.0
+
+# Per-process singletons; every worker process opens its own handles
+_fact_cache = None
+_mirror_store = None
+_result_cache = None
+_scan_executor = None
+_stream_manager = None
+
+def get_fact_cache() -> FactCache:
+    """
+    Open the shared per-file fact cache on first use
+    """
+    global _fact_cache
+    if _fact_cache is None:
+        _fact_cache = FactCache()
+    return _fact_cache
+
+def get_result_cache() -> ResultCache:
+    """
+    Open the shared analysis result cache on first use
+    """
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = ResultCache()
+    return _result_cache
+
+def get_mirror_store() -> MirrorStore:
+    """
+    Open the shared bare-mirror store on first use
+    """
+    global _mirror_store
+    if _mirror_store is None:
+        _mirror_store = MirrorStore()
+    return _mirror_store
+
+def get_scan_executor() -> Executor:
+    """
+    Start the pool of scan processes on first use
+
+    DRIFT_SCAN_WORKERS processes (default: CPU count) open the same mirror
+    store and caches as this process, so scans run outside the server
+    process and its event loop. Each gets its share of the parser
+    processes (see pool_settings), so concurrent scans do not start a
+    parser per CPU each.
+    """
+    global _scan_executor
+    if _scan_executor is None:
+        processes = int(os.environ.get("DRIFT_SCAN_WORKERS", 0)) or os.cpu_count() or 1
+        _scan_executor = ProcessPoolExecutor(
+            max_workers=processes, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_open_stores, initargs=(pool_settings(processes),))
+    return _scan_executor
+
+def get_stream_manager():
+    """
+    Start the process that hosts the queues streamed records travel through
+    from scan processes, on first use
+    """
+    global _stream_manager
+    if _stream_manager is None:
+        _stream_manager = multiprocessing.get_context("spawn").Manager()
+    return _stream_manager
+
+def shutdown_scan_executor() -> None:
+    global _scan_executor, _stream_manager
+    if _scan_executor is not None:
+        _scan_executor.shutdown(wait=False, cancel_futures=True)
+        _scan_executor = None
+    if _stream_manager is not None:
+        _stream_manager.shutdown()
+        _stream_manager = None
+
+def store_settings() -> Dict[str, Any]:
+    """
+    Where this process's mirror store and caches live
+    """
+    store, results = get_mirror_store(), get_result_cache()
+    return {
+        "mirrors": (store.root, store.max_bytes),
+        "results": (results.path, results.max_bytes),
+        "facts": get_fact_cache().path,
+    }
+
+def pool_settings(processes: int) -> Dict[str, Any]:
+    """
+    store_settings for a pool of processes that each scan, with the parser
+    processes each may start: DRIFT_PARSE_WORKERS when set, else an even
+    share of the CPUs (at least one)
+    """
+    parse_workers = int(os.environ.get("DRIFT_PARSE_WORKERS", 0)) or (os.cpu_count() or 1) // processes
+    return dict(store_settings(), parse_workers=max(parse_workers, 1))
+
+def _open_stores(settings: Dict[str, Any]) -> None:
+    global _fact_cache, _mirror_store, _result_cache
+    if "parse_workers" in settings:
+        # Read by resolve_workers when a request does not set workers
+        os.environ["DRIFT_PARSE_WORKERS"] = str(settings["parse_workers"])
+    _mirror_store = MirrorStore(*settings["mirrors"])
+    _result_cache = ResultCache(*settings["results"])
+    _fact_cache = FactCache(settings["facts"])
+
+def run_analysis(repo_url: str, ref: str, rules: Dict[str, Any], token: Optional[str] = None,
+                 mode: str = "full", workers: Optional[int] = None, result_format: str = "records",
+                 telemetry: Optional[Telemetry] = None, view: Optional[Dict[str, Any]] = None,
+                 shards: Optional[int] = None, shard_by: str = "hash", fetched: bool = False) -> Dict[str, Any]:
+    """
+    Fetch ref into the mirror store and analyze its tree straight from the
+    object store, without a checkout
+
+    ref is resolved to a commit SHA first, and the result is cached under
+    (repository, SHA, rules), so repeated requests for one commit are served
+    from the result cache and concurrent ones share a single scan.
+    result_format "compact" returns the columnar payload from
+    compact_result; "layers" and "directories" return the aggregated graph
+    from aggregate_result, with view holding its depth, prefix, offset and
+    limit. Views are cut from the cached records result, so drilling into
+    a subtree or paging costs no rescan. With shards, or with peers in
+    DRIFT_PEERS, the files are collected by run_sharded_scan instead of in
+    this process; the result is the same. The metrics gain "timings" and "counters" for this
+    call (see Telemetry), added to telemetry when one is given. Git
+    failures surface as subprocess.CalledProcessError. fetched says ref is
+    a SHA the caller has just fetched with token (see run_analysis_async),
+    so it is neither fetched nor timed again.
+    """
+    if telemetry is None:
+        telemetry = Telemetry()
+    computed = []
+    store = get_mirror_store()
+    with telemetry.stage("total"):
+        if fetched:
+            sha = ref
+        else:
+            with telemetry.stage("fetch"):
+                sha = store.fetch(repo_url, ref, token)
+        stored_format = "records" if result_format in VIEW_FORMATS else result_format
+        key = result_key(repo_url, sha, rules, f"{mode}:{stored_format}", FACTS_VERSION)
+
+        def analyze() -> Dict[str, Any]:
+            computed.append(True)
+            with store.tree(repo_url, sha, token) as tree:
+                peers = configured_peers()
+                if shards or peers:
+                    scan = run_sharded_scan(repo_url, tree, rules, token=token, mode=mode,
+                                            shards=shards or len(peers), shard_by=shard_by, peers=peers,
+                                            workers=workers, telemetry=telemetry)
+                else:
+                    cache = get_fact_cache() if mode == "incremental" else None
+                    scan = scan_repo(tree, rules, cache=cache, workers=workers, telemetry=telemetry)
+            with telemetry.stage("serialize"):
+                if stored_format == "compact":
+                    return compact_result({"nodes": scan.nodes, "violations": scan.violations,
+                                           "metrics": scan.metrics}, scan.graph)
+                return scan.as_dict()
+
+        result = get_result_cache().get_or_compute(key, analyze)
+        if result_format in VIEW_FORMATS:
+            with telemetry.stage("aggregate"):
+                result = aggregate_result(result, rules, result_format, **(view or {}))
+    telemetry.count("result_cache_hits" if not computed else "result_cache_misses")
+
+    # Results may be shared with other callers, so copy before adding this call's numbers
+    result = dict(result)
+    result["metrics"] = dict(result["metrics"], **telemetry.as_metrics())
+    return result
+
+async def run_analysis_async(repo_url: str, ref: str, rules: Dict[str, Any], token: Optional[str] = None,
+                             mode: str = "full", workers: Optional[int] = None, result_format: str = "records",
+                             limiter: Optional[HostLimiter] = None, view: Optional[Dict[str, Any]] = None,
+                             shards: Optional[int] = None, shard_by: str = "hash") -> Dict[str, Any]:
+    """
+    run_analysis for the event loop: ref is fetched with non-blocking git
+    (see MirrorStore.fetch_async), then the scan runs in a scan process
+    """
+    telemetry = Telemetry()
+    with telemetry.stage("fetch"):
+        sha = await get_mirror_store().fetch_async(repo_url, ref, token, limiter)
+    return await asyncio.get_running_loop().run_in_executor(get_scan_executor(), functools.partial(
+        run_analysis, repo_url, sha, rules, token=token, mode=mode, workers=workers,
+        result_format=result_format, telemetry=telemetry, view=view, shards=shards, shard_by=shard_by,
+        fetched=True))
+
+def run_sharded_scan(repo_url: str, tree: GitTree, rules: Dict[str, Any], token: Optional[str] = None,
+                     mode: str = "full", shards: int = 1, shard_by: str = "hash",
+                     peers: Optional[List[str]] = None, workers: Optional[int] = None,
+                     telemetry: Optional[Telemetry] = None) -> ScanResult:
+    """
+    scan_repo as a coordinator: the files of tree are split into shards
+    (see shards.partition), each shard is parsed by another analyzer, and
+    the collected facts are merged and resolved here in one pass
+
+    Shards are dealt round-robin to the peer base URLs, which collect them
+    through POST /shards/collect from their own mirror of the repository;
+    without peers, local scan processes stand in for them. A shard whose
+    peer fails is collected in this process instead. Imports, constant
+    references and every rule are resolved once, on the merged facts (see
+    scan_facts), so edges across shards are found as in a single scan.
+    """
+    if telemetry is None:
+        telemetry = Telemetry()
+    with telemetry.stage("walk"):
+        inventory = tree.inventory()
+    with telemetry.stage("collect_nodes"):
+        nodes = collect_nodes(tree, rules, inventory)
+    parts = partition([node["path"] for node in nodes], shards, shard_by)
+    telemetry.count("shards", len(parts))
+
+    facts: Dict[str, Dict[str, Any]] = {}
+    failed = []
+    with telemetry.stage("parse"):
+        if peers:
+            with ThreadPoolExecutor(max_workers=len(parts)) as threads:
+                futures = [threads.submit(post_shard, peers[index % len(peers)], {
+                    "git": {"repo_url": repo_url, "ref": tree.commit, "token": token},
+                    "rules": rules, "paths": paths, "mode": mode,
+                }) for index, paths in enumerate(parts)]
+                for index, (paths, future) in enumerate(zip(parts, futures)):
+                    try:
+                        collected = future.result()
+                    except Exception as e:
+                        logger.warning("Shard %d failed on %s, collecting it locally: %s",
+                                       index, peers[index % len(peers)], e)
+                        failed.append(paths)
+                        continue
+                    facts.update(collected["facts"])
+                    telemetry.merge(collected["counters"])
+        else:
+            processes = min(len(parts), os.cpu_count() or 1)
+            with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"),
+                                     initializer=_open_stores, initargs=(pool_settings(processes),)) as pool:
+                for collected in pool.map(_collect_tree_shard, [tree.subset(paths) for paths in parts],
+                                          parts, [rules] * len(parts), [mode] * len(parts)):
+                    facts.update(collected["facts"])
+                    telemetry.merge(collected["counters"])
+        for paths in failed:
+            collected = _collect_shard(tree, paths, rules, mode, workers)
+            facts.update(collected["facts"])
+            telemetry.merge(collected["counters"])
+
+    counters = telemetry.as_metrics()["counters"]
+    stats = {"hits": counters.get("cache_hits", 0), "misses": counters.get("cache_misses", 0)}
+    return scan_facts(nodes, facts, make_resolver(tree, inventory), rules,
+                      stats if mode == "incremental" else None, telemetry)
+
+def collect_shard(repo_url: str, sha: str, rules: Dict[str, Any], paths: List[str], token: Optional[str] = None,
+                  mode: str = "full", workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Parse the files at paths of commit sha for a coordinator
+
+    Returns {"facts": parse_source facts by path, "counters": telemetry
+    counters}. Files that are not sources, or are skipped, have no facts.
+    """
+    with get_mirror_store().tree(repo_url, sha, token) as tree:
+        return _collect_shard(tree, paths, rules, mode, workers)
+
+async def collect_shard_async(repo_url: str, sha: str, rules: Dict[str, Any], paths: List[str],
+                              token: Optional[str] = None, mode: str = "full",
+                              limiter: Optional[HostLimiter] = None) -> Dict[str, Any]:
+    """
+    collect_shard for the event loop: sha is fetched with non-blocking git,
+    then parsed in a scan process
+    """
+    sha = await get_mirror_store().fetch_async(repo_url, sha, token, limiter)
+    return await asyncio.get_running_loop().run_in_executor(get_scan_executor(), functools.partial(
+        collect_shard, repo_url, sha, rules, paths, token=token, mode=mode))
+
+def _collect_tree_shard(tree: GitTree, paths: List[str], rules: Dict[str, Any], mode: str) -> Dict[str, Any]:
+    # A local stand-in for a peer, in a process that owns its copy of the tree
+    with tree:
+        return _collect_shard(tree, paths, rules, mode, workers=1)
+
+def _collect_shard(tree: GitTree, paths: List[str], rules: Dict[str, Any], mode: str,
+                   workers: Optional[int]) -> Dict[str, Any]:
+    telemetry = Telemetry()
+    matcher = compile_layers(rules.get("layers", []))
+    nodes = [make_node(path, inventory_lang(path), matcher) for path in paths if inventory_lang(path)]
+    cache = get_fact_cache() if mode == "incremental" else None
+    facts = collect_file_facts(tree, nodes, rules, cache, workers=workers, telemetry=telemetry)
+    return {"facts": facts, "counters": telemetry.as_metrics()["counters"]}
+
+def stream_analysis(repo_url: str, ref: str, rules: Dict[str, Any], token: Optional[str] = None,
+                    mode: str = "full", workers: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Fetch ref and return an iterator over the iter_analysis records of its tree
+
+    The fetch happens before this returns, so git failures still raise
+    CalledProcessError here instead of partway through a response. The
+    mirror stays leased until the iterator is exhausted or closed. A
+    failure during the scan ends the stream with an "error" record. The
+    metrics record gains "timings" and "counters" as in run_analysis.
+    """
+    records = _stream_records(repo_url, ref, rules, token, mode, workers)
+    first = next(records)
+    return itertools.chain([first], records)
+
+def _stream_records(repo_url: str, ref: str, rules: Dict[str, Any], token: Optional[str],
+                    mode: str, workers: Optional[int]) -> Iterator[Dict[str, Any]]:
+    telemetry = Telemetry()
+    with ExitStack() as stack:
+        with telemetry.stage("fetch"):
+            tree = stack.enter_context(get_mirror_store().tree(repo_url, ref, token))
+        cache = get_fact_cache() if mode == "incremental" else None
+        try:
+            for record in iter_analysis(tree, rules, cache=cache, workers=workers, telemetry=telemetry):
+                if record["type"] == "metrics":
+                    record.update(telemetry.as_metrics())
+                yield record
+        except Exception as e:
+            # Headers are already sent, so report the failure in-band
+            logger.exception("Streaming analysis failed: %s", e)
+            yield {"type": "error", "detail": f"Analysis failed: {str(e)}"}
+
+async def stream_analysis_async(repo_url: str, ref: str, rules: Dict[str, Any], token: Optional[str] = None,
+                                mode: str = "full", workers: Optional[int] = None,
+                                limiter: Optional[HostLimiter] = None) -> Iterator[Dict[str, Any]]:
+    """
+    stream_analysis for the event loop: ref is fetched with non-blocking
+    git, then the scan runs in a scan process and sends its records back
+    through a queue (see get_stream_manager)
+
+    The first records are waited for on a thread, so a failure to open the
+    tree still raises here; the iterator returned only waits on the queue,
+    for the caller to drain off the loop. Closing it early stops the scan.
+    """
+    sha = await get_mirror_store().fetch_async(repo_url, ref, token, limiter)
+    return await asyncio.to_thread(_open_stream, repo_url, sha, rules, token, mode, workers)
+
+def _open_stream(repo_url: str, sha: str, rules: Dict[str, Any], token: Optional[str], mode: str,
+                 workers: Optional[int]) -> Iterator[Dict[str, Any]]:
+    manager = get_stream_manager()
+    batches, stop = manager.Queue(STREAM_QUEUE_BATCHES), manager.Event()
+    future = get_scan_executor().submit(_produce_records, batches, stop, repo_url, sha, rules, token, mode, workers)
+    first = _next_batch(batches, future)
+    if isinstance(first, BaseException):
+        raise first
+    return _drain_records(batches, stop, future, first)
+
+def _produce_records(batches, stop, repo_url: str, sha: str, rules: Dict[str, Any], token: Optional[str],
+                     mode: str, workers: Optional[int]) -> None:
+    """
+    Scan process side of a stream: put the records in batches, then None;
+    an exception raised before the first record is put in their place
+    """
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=STREAM_POLL_SECONDS)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    try:
+        records = _stream_records(repo_url, sha, rules, token, mode, workers)
+        batch = [next(records)]
+    except Exception as e:
+        put(e)
+        return
+    try:
+        for record in records:
+            batch.append(record)
+            if len(batch) >= STREAM_BATCH_RECORDS:
+                if not put(batch):
+                    return
+                batch = []
+        if put(batch):
+            put(None)
+    finally:
+        # Releases the mirror lease when the client went away mid-scan
+        records.close()
+
+def _next_batch(batches, future):
+    # Wait for the next batch, noticing a scan process that died without
+    # sending one
+    while True:
+        try:
+            return batches.get(timeout=STREAM_POLL_SECONDS)
+        except queue.Empty:
+            if future.done():
+                try:
+                    return batches.get_nowait()
+                except queue.Empty:
+                    error = future.exception()
+                    return error or RuntimeError("Scan process ended without finishing the stream")
+
+def _drain_records(batches, stop, future, batch: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    try:
+        while batch is not None:
+            if isinstance(batch, BaseException):
+                logger.error("Streaming analysis failed: %s", batch)
+                yield {"type": "error", "detail": f"Analysis failed: {str(batch)}"}
+                return
+            yield from batch
+            batch = _next_batch(batches, future)
+    finally:
+        stop.set()
+
+def range_max_commits() -> int:
+    """
+    The longest commit list one range analysis walks: DRIFT_RANGE_MAX_COMMITS,
+    else RANGE_MAX_COMMITS
+    """
+    return int(os.environ.get("DRIFT_RANGE_MAX_COMMITS", RANGE_MAX_COMMITS))
+
+def check_range_length(commits: List[str]) -> None:
+    """
+    Raise ValueError for a range longer than range_max_commits()
+    """
+    max_commits = range_max_commits()
+    if len(commits) > max_commits:
+        raise ValueError(f"Range has {len(commits)} commits; at most {max_commits} can be analyzed at once")
+
+def run_range_analysis(repo_url: str, base: str, rules: Dict[str, Any], commits: Optional[List[str]] = None,
+                       head: Optional[str] = None, token: Optional[str] = None,
+                       workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Analyze base in full, then walk commits (or the first-parent history
+    from base to head) applying only each commit's changed blobs
+
+    Returns the base metrics and, per commit, its metrics with the
+    violations it added and removed. Raises ValueError for more than
+    DRIFT_RANGE_MAX_COMMITS commits; git failures surface as
+    subprocess.CalledProcessError.
+    """
+    if head is None:
+        # Before fetching anything for an over-long list
+        check_range_length(commits or [])
+    store = get_mirror_store()
+    git_dir = store.git_dir(repo_url)
+    if head is not None:
+        # Fetching head first usually brings base along with it
+        head_sha = store.fetch(repo_url, head, token)
+        base_sha = store.fetch(repo_url, base, token)
+        shas = rev_list(git_dir, base_sha, head_sha)
+        check_range_length(shas)
+    else:
+        shas = [store.fetch(repo_url, ref, token) for ref in reversed(commits or [])][::-1]
+        base_sha = store.fetch(repo_url, base, token)
+
+    with store.tree(repo_url, base_sha, token) as tree, BlobReader(git_dir) as blobs:
+        walker = HistoryWalker(git_dir, rules, get_fact_cache(), blobs)
+        base_result = walker.load(base_sha, tree, workers)
+        return {
+            "base": base_result,
+            "commits": [walker.advance(sha) for sha in shas]
+        }
+
+async def run_range_analysis_async(repo_url: str, base: str, rules: Dict[str, Any], commits: Optional[List[str]] = None,
+                                   head: Optional[str] = None, token: Optional[str] = None,
+                                   workers: Optional[int] = None,
+                                   limiter: Optional[HostLimiter] = None) -> Dict[str, Any]:
+    """
+    run_range_analysis for the event loop: every ref is fetched with
+    non-blocking git first, so the walk in a scan process needs no network
+    """
+    if head is None:
+        check_range_length(commits or [])
+    store = get_mirror_store()
+    if head is not None:
+        head = await store.fetch_async(repo_url, head, token, limiter)
+    else:
+        commits = [await store.fetch_async(repo_url, ref, token, limiter) for ref in reversed(commits or [])][::-1]
+    base = await store.fetch_async(repo_url, base, token, limiter)
+    return await asyncio.get_running_loop().run_in_executor(get_scan_executor(), functools.partial(
+        run_range_analysis, repo_url, base, rules, commits=commits, head=head, token=token, workers=workers))
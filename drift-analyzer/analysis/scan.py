@@ -1,236 +1,801 @@
-import glob
+import hashlib
+import json
+import logging
+import multiprocessing
 import os
-import re
-import yaml
-from typing import List, Dict, Any
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import ExitStack, nullcontext
+from typing import List, Dict, Any, Iterator, NamedTuple, Optional, Tuple, Union
 
-def analyze_repo(root: str, rules: Dict[str, Any]) -> Dict[str, Any]:
+from .cache import FactCache, git_blob_sha, read_blob_shas
+from .gitstore import GitTree
+from .graph import EdgeGraph
+from .reach import Reachability
+from .inventory import SourceFile, build_inventory, decode_source
+from .layers import LayerMatcher, compile_layers
+from .patterns import compile_binary_pattern_set, compile_pattern_set, regex_evaluations
+from .reader import Buffer, Source, SourceReader
+from .rules import compile_rules
+from .ruby import RubyIndex, scan_constants
+from .telemetry import Telemetry
+from .typescript import TsResolver, scan_imports
+
+# Bump whenever parse_source changes what it extracts, so cached facts
+# from an older analyzer are not reused
+FACTS_VERSION = 5
+
+# ActiveRecord reads and writes; each kind found in a Ruby file becomes one
+# DATABASE edge
+RUBY_DB_PATTERNS = (
+    r'\.where\(|\.find\(|ActiveRecord::Base',
+    r'\.create\(|\.update\(|\.destroy\(',
+)
+
+# Below this many files to parse, process pool startup costs more than it saves
+PARALLEL_MIN_FILES = 2000
+
+# Files parsed per batch when streaming; a batch's records are sent before
+# the next batch is read
+STREAM_BATCH_FILES = 2000
+
+logger = logging.getLogger(__name__)
+
+class ScanResult(NamedTuple):
+    """
+    An analysis with its edges still in integer columns
+    """
+    nodes: List[Dict[str, str]]
+    graph: EdgeGraph
+    violations: List[Dict[str, Any]]
+    metrics: Dict[str, Any]
+
+    def as_dict(self) -> Dict[str, Any]:
+        """
+        The public result shape, with one dict per edge
+        """
+        return {
+            "nodes": self.nodes,
+            "edges": self.graph.edge_dicts(),
+            "violations": self.violations,
+            "metrics": self.metrics
+        }
+
+def analyze_repo(root: Source, rules: Dict[str, Any], cache: Optional[FactCache] = None,
+                 workers: Optional[int] = None) -> Dict[str, Any]:
     """
     Analyze a repository for architecture drift violations
     
     Args:
-        root: Path to the repository root
+        root: Path to the repository root, or a GitTree to analyze a commit
+            without checking it out
         rules: Architecture rules dictionary
+        cache: Optional per-file fact cache; files whose blob is already
+            cached are not read or parsed again (incremental mode)
+        workers: Parser processes for large repos (see parse_files). The
+            parser processes are spawned, so they import the calling
+            script's main module again: call analyze_repo under an
+            `if __name__ == "__main__":` guard, or pass workers=1
         
     Returns:
         Dictionary containing analysis results
     """
-    nodes = collect_nodes(root, rules)
-    edges = collect_ts_import_edges(root) + collect_ruby_db_calls(root)
-    violations = check_rules(nodes, edges, rules, root)
+    return scan_repo(root, rules, cache, workers).as_dict()
+
+def scan_repo(root: Source, rules: Dict[str, Any], cache: Optional[FactCache] = None,
+              workers: Optional[int] = None, telemetry: Optional[Telemetry] = None) -> ScanResult:
+    """
+    Run analyze_repo, leaving the edges in an EdgeGraph
+    
+    With telemetry, each stage is timed and the files, bytes, regex passes
+    and cache lookups are counted into it.
+    """
+    stage = telemetry.stage if telemetry is not None else _no_stage
+    with stage("walk"):
+        inventory = list_sources(root)
+    with stage("collect_nodes"):
+        nodes = collect_nodes(root, rules, inventory)
+    stats = {"hits": 0, "misses": 0}
+    with stage("parse"):
+        facts = collect_file_facts(root, nodes, rules, cache, stats, workers, telemetry=telemetry)
+    resolver = make_resolver(root, inventory)
+    del inventory
+    return scan_facts(nodes, facts, resolver, rules, stats if cache is not None else None, telemetry)
+
+def scan_facts(nodes: List[Dict[str, str]], facts: Dict[str, Dict[str, Any]], resolver: TsResolver,
+               rules: Dict[str, Any], cache_stats: Optional[Dict[str, int]] = None,
+               telemetry: Optional[Telemetry] = None) -> ScanResult:
+    """
+    The edges, violations and metrics of scan_repo, from facts already
+    collected for every node
+    
+    Imports and constant references are resolved here, against the whole
+    repo, so the facts may come from several collectors (see
+    runner.run_sharded_scan). facts is emptied once it is no longer needed.
+    """
+    stage = telemetry.stage if telemetry is not None else _no_stage
+    with stage("edges"):
+        graph = EdgeGraph()
+        graph.set_layers(nodes)
+        build_edges(nodes, facts, resolver, graph, build_ruby_index(nodes, facts))
+    with stage("check_rules"):
+        api_hits = collect_api_hits(nodes, facts, rules)
+        skipped = len(nodes) - len(facts)
+        facts.clear()
+        violations = check_rules(nodes, graph, rules, api_hits=api_hits)
+    
+    metrics = build_metrics(
+        {"nodes": len(nodes), "edges": len(graph), "violations": len(violations), "skipped": skipped},
+        cache_stats
+    )
+    return ScanResult(nodes, graph, violations, metrics)
+
+def iter_analysis(root: Source, rules: Dict[str, Any], cache: Optional[FactCache] = None,
+                  workers: Optional[int] = None, batch_size: Optional[int] = None,
+                  telemetry: Optional[Telemetry] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Analyze a repository as a stream of records
+    
+    Yields a {"type": "node", ...} record per node, then "edge" and
+    "violation" records batch by batch as files are parsed, and a final
+    "metrics" record. Only the node list is kept for the whole scan, so
+    memory does not grow with the number of edges or violations; rules
+    that need the whole graph (see check_graph_rules) also keep every edge,
+    in integer columns, and their violations come just before the metrics.
+    The records hold the same data as analyze_repo returns, but edges and
+    violations come out per batch rather than grouped by kind and rule.
+    Ruby constant references can point at files in later batches, so only
+    their unresolved names are kept per batch; their edges and violations
+    follow the last batch.
+    With telemetry, stages are timed (summed over batches, not counting
+    time spent waiting on the consumer) and counted as in scan_repo.
+    """
+    if not batch_size:
+        batch_size = int(os.environ.get("DRIFT_STREAM_BATCH_FILES", STREAM_BATCH_FILES))
+    stage = telemetry.stage if telemetry is not None else _no_stage
+    with stage("walk"):
+        inventory = list_sources(root)
+    with stage("collect_nodes"):
+        nodes = collect_nodes(root, rules, inventory)
+    resolver = make_resolver(root, inventory)
+    del inventory
+    graph = EdgeGraph()
+    graph.set_layers(nodes)
+    full_graph = graph.sharing_strings() if compile_rules(rules).has_graph_rules else None
+    
+    for node in nodes:
+        yield {"type": "node", **node}
+    
+    stats = {"hits": 0, "misses": 0}
+    counts = {"nodes": len(nodes), "edges": 0, "violations": 0, "skipped": 0}
+    ruby_index = RubyIndex()
+    references = {}
+    with ExitStack() as stack:
+        # One pool for every batch, rather than paying its startup per batch
+        pool = None
+        workers = resolve_workers(workers)
+        min_files = int(os.environ.get("DRIFT_PARALLEL_MIN_FILES", PARALLEL_MIN_FILES))
+        if workers > 1 and len(nodes) >= min_files:
+            pool = stack.enter_context(ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")))
+        
+        for start in range(0, len(nodes), batch_size):
+            batch = nodes[start:start + batch_size]
+            with stage("parse"):
+                facts = collect_file_facts(root, batch, rules, cache, stats, workers, pool, telemetry)
+            counts["skipped"] += len(batch) - len(facts)
+            with stage("edges"):
+                graph.clear_edges()
+                build_edges(batch, facts, resolver, graph)
+                for node in batch:
+                    if node["lang"] == "ruby" and node["path"] in facts:
+                        ruby_index.add(node["path"], facts[node["path"]]["defines"])
+                        if facts[node["path"]]["references"]:
+                            references[node["path"]] = facts[node["path"]]["references"]
+            with stage("check_rules"):
+                api_hits = collect_api_hits(batch, facts, rules)
+                del facts
+                violations = check_rules(batch, graph, rules, root, api_hits=api_hits, graph_rules=False)
+            
+            for edge in graph.iter_edges():
+                yield {"type": "edge", **edge}
+            counts["edges"] += len(graph)
+            for violation in violations:
+                yield {"type": "violation", **violation}
+                counts["violations"] += 1
+            if full_graph is not None:
+                full_graph.extend(graph)
+    
+    with stage("edges"):
+        graph.clear_edges()
+        ruby_nodes = [node for node in nodes if node["path"] in references]
+        add_constant_edges(ruby_nodes, references, ruby_index, graph)
+        del references
+    with stage("check_rules"):
+        violations = check_rules(ruby_nodes, graph, rules, root, api_hits={}, graph_rules=False)
+    for edge in graph.iter_edges():
+        yield {"type": "edge", **edge}
+    counts["edges"] += len(graph)
+    for violation in violations:
+        yield {"type": "violation", **violation}
+        counts["violations"] += 1
+    if full_graph is not None:
+        full_graph.extend(graph)
+    
+    if full_graph is not None:
+        with stage("check_rules"):
+            violations = check_graph_rules(nodes, full_graph, rules)
+        for violation in violations:
+            yield {"type": "violation", **violation}
+            counts["violations"] += 1
     
+    yield {"type": "metrics", **build_metrics(counts, stats if cache is not None else None)}
+
+def build_metrics(counts: Dict[str, int], cache_stats: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+    """
+    Summarize node, edge and violation counts into the metrics block
+
+    counts["skipped"] is the number of nodes whose file was not analysed:
+    skipped by SourceReader (binary, minified, generated or too large) or
+    unreadable.
+    """
     # Calculate drift score (0 = no violations, 1 = all edges are violations)
-    drift_score = len(violations) / max(len(edges), 1)
+    drift_score = counts["violations"] / max(counts["edges"], 1)
     
-    return {
-        "nodes": nodes,
-        "edges": edges,
-        "violations": violations,
-        "metrics": {
-            "drift_score": round(drift_score, 3),
-            "counts": {
-                "nodes": len(nodes),
-                "edges": len(edges),
-                "violations": len(violations)
-            }
-        }
+    metrics = {
+        "drift_score": round(drift_score, 3),
+        "counts": counts
     }
+    if cache_stats is not None:
+        metrics["cache"] = cache_stats
+    return metrics
 
-def collect_nodes(root: str, rules: Dict[str, Any]) -> List[Dict[str, str]]:
+def collect_nodes(root: Source, rules: Dict[str, Any], inventory: Optional[List[SourceFile]] = None) -> List[Dict[str, str]]:
     """
     Collect all source code files and assign them to architectural layers
     """
+    if inventory is None:
+        inventory = list_sources(root)
+    matcher = compile_layers(rules.get("layers", []))
     files = []
     
-    # Collect Ruby files
-    ruby_files = glob.glob(os.path.join(root, "**", "*.rb"), recursive=True)
-    for p in ruby_files:
-        rp = os.path.relpath(p, root)
-        layer = assign_layer(rp, rules.get("layers", []))
-        files.append({
-            "path": rp,
-            "module_name": rp.replace("/", ".").replace(".rb", ""),
-            "layer": layer,
-            "lang": "ruby"
-        })
-    
-    # Collect TypeScript/JavaScript files
-    ts_files = glob.glob(os.path.join(root, "**", "*.ts*"), recursive=True)
-    for p in ts_files:
-        rp = os.path.relpath(p, root)
-        layer = assign_layer(rp, rules.get("layers", []))
-        files.append({
-            "path": rp,
-            "module_name": rp.replace("/", ".").replace(".ts", "").replace(".tsx", ""),
-            "layer": layer,
-            "lang": "typescript"
-        })
+    # Ruby files first, then TypeScript/JavaScript files
+    for lang in ("ruby", "typescript"):
+        for source in inventory:
+            if source.lang == lang:
+                files.append(make_node(source.path, lang, matcher))
     
     return files
 
+def list_sources(root: Source) -> List[SourceFile]:
+    """
+    The inventory of a checkout (see build_inventory) or of a GitTree
+    """
+    return root.inventory() if isinstance(root, GitTree) else build_inventory(root)
+
+def make_resolver(root: Source, inventory: List[SourceFile]) -> TsResolver:
+    """
+    A TsResolver over the inventoried files, reading tsconfigs from root
+    """
+    known_paths = {source.path for source in inventory}
+    if isinstance(root, GitTree):
+        return TsResolver("", known_paths, read_text=root.read_text)
+    return TsResolver(root, known_paths)
+
+def make_node(rp: str, lang: str, matcher: LayerMatcher) -> Dict[str, str]:
+    """
+    Build the node for one source file
+    """
+    if lang == "ruby":
+        module_name = rp.replace("/", ".").replace(".rb", "")
+    else:
+        module_name = rp.replace("/", ".").replace(".ts", "").replace(".tsx", "")
+    return {
+        "path": rp,
+        "module_name": module_name,
+        "layer": matcher.match(rp),
+        "lang": lang
+    }
+
+def parse_source(lang: str, content: Union[str, Buffer], api_patterns: List[str]) -> Dict[str, Any]:
+    """
+    Extract everything the analysis needs from one file's content
+    
+    The result depends only on the content and the given patterns, never on
+    the file's path or the rest of the repo, so it can be cached by blob.
+    Ruby DB-call detection and the disallowed API patterns share a single
+    PatternSet scan. api_patterns lists [pattern, first line] for each hit.
+    For Ruby, defines and references are the constants the file defines
+    and uses (see ruby.scan_constants); they are resolved to files only
+    once every file's definitions are known (see build_ruby_index).
+    content may be raw bytes or a mapped file; Ruby files are then scanned
+    without being decoded (see scan_patterns).
+    """
+    db_patterns = RUBY_DB_PATTERNS if lang == "ruby" else ()
+    if lang == "typescript" and not isinstance(content, str):
+        content = decode_source(content)
+    found = scan_patterns(db_patterns + tuple(api_patterns), content)
+    defines, references = scan_constants(content) if lang == "ruby" else ([], [])
+    return {
+        "imports": scan_ts_imports(content) if lang == "typescript" else [],
+        "defines": defines,
+        "references": references,
+        "db_calls": sum(1 for index in range(len(db_patterns)) if index in found),
+        "api_patterns": [[api_patterns[index - len(db_patterns)], found[index]]
+                         for index in sorted(found) if index >= len(db_patterns)]
+    }
+
+def scan_patterns(patterns: Tuple[str, ...], content: Union[str, Buffer]) -> Dict[int, int]:
+    """
+    PatternSet.scan for str, bytes or mapped content
+    
+    Bytes are searched in place when every pattern can be (see
+    compile_binary_pattern_set), and decoded first otherwise.
+    """
+    if not isinstance(content, str):
+        pattern_set = compile_binary_pattern_set(patterns)
+        if pattern_set is not None:
+            return pattern_set.scan(content)
+        content = decode_source(content)
+    return compile_pattern_set(patterns).scan(content)
+
+def collect_file_facts(root: Source, nodes: List[Dict[str, str]], rules: Dict[str, Any],
+                       cache: Optional[FactCache] = None, stats: Optional[Dict[str, int]] = None,
+                       workers: Optional[int] = None, pool: Optional[Executor] = None,
+                       telemetry: Optional[Telemetry] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Parse every node's file at most once, reusing cached facts where possible
+    
+    Returns the parse_source facts keyed by node path. Files that cannot be
+    read, or that SourceReader skips, are left out. workers, pool and
+    telemetry are passed on to parse_files.
+    """
+    if stats is None:
+        stats = {"hits": 0, "misses": 0}
+    index = compile_rules(rules)
+    facts = {}
+    
+    # With a cache, work out every key first so all lookups are one batch
+    keys = {}
+    cached = {}
+    contents = {}
+    if cache is not None:
+        blob_shas = root.blob_shas() if isinstance(root, GitTree) else read_blob_shas(root)
+        reader = SourceReader(root)
+        for node in nodes:
+            sha = blob_shas.get(node["path"])
+            if sha is None:
+                data = reader.read(node["path"])
+                if data is None:
+                    continue
+                sha = git_blob_sha(data)
+                contents[node["path"]] = data
+                if telemetry is not None:
+                    telemetry.merge({"files_read": 1, "bytes_read": len(data)})
+            keys[node["path"]] = fact_key(node["lang"], sha, index.api_patterns(node.get("layer", "unknown")))
+        if telemetry is not None and reader.skipped:
+            telemetry.count("files_skipped", sum(reader.skipped.values()))
+        cached = cache.get_many(set(keys.values()))
+    
+    pending = []
+    for node in nodes:
+        path = node["path"]
+        key = keys.get(path)
+        if key in cached:
+            facts[path] = cached[key]
+            stats["hits"] += 1
+        elif cache is None or key is not None:
+            pending.append((path, node["lang"], index.api_patterns(node.get("layer", "unknown"))))
+    
+    hits, misses = stats["hits"], stats["misses"]
+    parsed = parse_files(root, pending, contents, workers, pool, telemetry)
+    fresh = {}
+    for path, _, _ in pending:
+        if path in parsed:
+            facts[path] = parsed[path]
+            stats["misses"] += 1
+            if path in keys:
+                fresh[keys[path]] = parsed[path]
+    if telemetry is not None and cache is not None:
+        telemetry.merge({"cache_hits": stats["hits"] - hits, "cache_misses": stats["misses"] - misses})
+    
+    if cache is not None:
+        cache.put_many(fresh)
+    
+    return facts
+
+def fact_key(lang: str, sha: str, api_patterns: List[str]) -> str:
+    """
+    The FactCache key for parsing blob sha as lang with the given patterns
+    """
+    patterns_digest = hashlib.sha1(json.dumps(api_patterns).encode("utf-8")).hexdigest() if api_patterns else ""
+    return f"{FACTS_VERSION}:{lang}:{sha}:{patterns_digest}"
+
+def resolve_workers(workers: Optional[int] = None) -> int:
+    """
+    Number of parser processes to use: the explicit setting, else
+    DRIFT_PARSE_WORKERS, else one per CPU
+
+    Always 1 while this process is a spawned child still importing the
+    parent's main module, where starting a pool would fail; a script that
+    analyzes at module level without a __main__ guard then parses serially
+    in its workers instead of crashing.
+    """
+    if getattr(multiprocessing.current_process(), "_inheriting", False):
+        return 1
+    if not workers:
+        workers = int(os.environ.get("DRIFT_PARSE_WORKERS", 0)) or os.cpu_count() or 1
+    return max(workers, 1)
+
+def parse_files(root: Source, items: List[Tuple[str, str, List[str]]], contents: Optional[Dict[str, bytes]] = None,
+                workers: Optional[int] = None, pool: Optional[Executor] = None,
+                telemetry: Optional[Telemetry] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Parse (path, lang, api_patterns) items, spreading them over a process
+    pool when there are enough files to repay its startup cost
+    
+    Below DRIFT_PARALLEL_MIN_FILES files, or with a single worker, parsing
+    stays in this process. A caller that parses in batches can pass its own
+    pool, which is then always used. Results are keyed by path, so callers
+    assemble output in their own order and it is identical to a serial run.
+    Counts of files and bytes read, files skipped and regex passes,
+    including those made by parser processes, are added to telemetry.
+    """
+    workers = resolve_workers(workers)
+    if not items:
+        return {}
+    if pool is None:
+        min_files = int(os.environ.get("DRIFT_PARALLEL_MIN_FILES", PARALLEL_MIN_FILES))
+        if workers == 1 or len(items) < min_files:
+            parsed, counts = _parse_chunk(root, items, contents)
+            if telemetry is not None:
+                telemetry.merge(counts)
+            return parsed
+    
+    # Several chunks per worker keep the pool busy when file sizes vary
+    chunk_size = max(len(items) // (workers * 4), 64)
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    if isinstance(root, GitTree):
+        # Send each parser process only its chunk's part of the listing
+        sources = [root.subset(path for path, _, _ in chunk) for chunk in chunks]
+    else:
+        sources = [root] * len(chunks)
+    if pool is not None:
+        return _map_chunks(pool, sources, chunks, telemetry)
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks)),
+                             mp_context=multiprocessing.get_context("spawn")) as pool:
+        return _map_chunks(pool, sources, chunks, telemetry)
+
+def _map_chunks(pool: Executor, sources: List[Source], chunks: List[List[Tuple[str, str, List[str]]]],
+                telemetry: Optional[Telemetry] = None) -> Dict[str, Dict[str, Any]]:
+    parsed = {}
+    for chunk_facts, counts in pool.map(_parse_source_chunk, sources, chunks):
+        parsed.update(chunk_facts)
+        if telemetry is not None:
+            telemetry.merge(counts)
+    return parsed
+
+def _parse_source_chunk(root: Source, items: List[Tuple[str, str, List[str]]]) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, int]]:
+    """
+    _parse_chunk in a parser process, which owns its copy of a GitTree
+    """
+    if isinstance(root, GitTree):
+        with root:
+            return _parse_chunk(root, items)
+    return _parse_chunk(root, items)
+
+def _parse_chunk(root: Source, items: List[Tuple[str, str, List[str]]],
+                 contents: Optional[Dict[str, bytes]] = None) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, int]]:
+    """
+    Parse items; returns the facts by path and the files_read, bytes_read,
+    files_skipped and regex_evaluations counts
+    
+    Files are read through a SourceReader unless contents already holds
+    their bytes.
+    """
+    parsed = {}
+    counts = {"files_read": 0, "bytes_read": 0}
+    evaluations = regex_evaluations()
+    reader = SourceReader(root)
+    for path, lang, api_patterns in items:
+        data = contents.pop(path, None) if contents else None
+        if data is not None:
+            _parse_into(parsed, path, lang, data, api_patterns)
+            continue
+        with reader.open(path) as data:
+            if data is None:
+                continue
+            counts["files_read"] += 1
+            counts["bytes_read"] += len(data)
+            _parse_into(parsed, path, lang, data, api_patterns)
+    counts["files_skipped"] = sum(reader.skipped.values())
+    counts["regex_evaluations"] = regex_evaluations() - evaluations
+    return parsed, counts
+
+def _parse_into(parsed: Dict[str, Dict[str, Any]], path: str, lang: str, data: Buffer, api_patterns: List[str]) -> None:
+    try:
+        parsed[path] = parse_source(lang, data, api_patterns)
+    except Exception as e:
+        # Log error but continue processing
+        logger.warning("Error processing %s: %s", path, e)
+
+def build_edges(nodes: List[Dict[str, str]], facts: Dict[str, Dict[str, Any]], resolver: TsResolver,
+                graph: EdgeGraph, ruby_index: Optional[RubyIndex] = None) -> None:
+    """
+    Add per-file facts to graph as edges: TypeScript imports first, then
+    Ruby DB calls, then (given ruby_index) Ruby constant references
+    """
+    for node in nodes:
+        if node["lang"] == "typescript" and node["path"] in facts:
+            for to_path, line_num in resolver.resolve_targets(node["path"], facts[node["path"]]["imports"]):
+                graph.add_edge(node["path"], to_path, "import", line_num)
+    for node in nodes:
+        if node["lang"] == "ruby" and node["path"] in facts:
+            for _ in range(facts[node["path"]]["db_calls"]):
+                graph.add_edge(node["path"], "DATABASE", "db_call")
+    if ruby_index is not None:
+        references = {node["path"]: facts[node["path"]]["references"]
+                      for node in nodes if node["lang"] == "ruby" and node["path"] in facts}
+        add_constant_edges(nodes, references, ruby_index, graph)
+
+def build_ruby_index(nodes: List[Dict[str, str]], facts: Dict[str, Dict[str, Any]]) -> RubyIndex:
+    """
+    Index the constants every Ruby file defines, once per scan, so each
+    reference is a dictionary lookup rather than a search
+    """
+    ruby_index = RubyIndex()
+    for node in nodes:
+        if node["lang"] == "ruby" and node["path"] in facts:
+            ruby_index.add(node["path"], facts[node["path"]]["defines"])
+    return ruby_index
+
+def add_constant_edges(nodes: List[Dict[str, str]], references: Dict[str, List[List[Any]]],
+                       ruby_index: RubyIndex, graph: EdgeGraph) -> None:
+    """
+    Add a "constant" edge from each Ruby node to every other file whose
+    constants it references (see RubyIndex.resolve_targets)
+    """
+    for node in nodes:
+        if node["path"] in references:
+            for to_path, line_num in ruby_index.resolve_targets(node["path"], references[node["path"]]):
+                graph.add_edge(node["path"], to_path, "constant", line_num)
+
+def collect_api_hits(nodes: List[Dict[str, str]], facts: Dict[str, Dict[str, Any]], rules: Dict[str, Any]) -> Dict[str, List[Tuple[int, str, int]]]:
+    """
+    Map node paths to the disallowed_apis rules their facts violate
+    """
+    index = compile_rules(rules)
+    api_hits = {}
+    for node in nodes:
+        file_facts = facts.get(node["path"])
+        if file_facts and file_facts["api_patterns"]:
+            api_hits[node["path"]] = index.api_hits(node.get("layer", "unknown"), dict(file_facts["api_patterns"]))
+    return api_hits
+
 def assign_layer(path: str, layers: List[Dict[str, Any]]) -> str:
     """
     Assign a file path to an architectural layer based on patterns
+    
+    See LayerMatcher for the pattern syntax; the first matching layer wins.
+    """
+    return compile_layers(layers).match(path)
+
+def scan_ts_imports(content: str) -> List[List[Any]]:
     """
-    # Normalize path separators to forward slashes for consistent pattern matching
-    normalized_path = path.replace('\\', '/')
+    Extract [specifier, line number] pairs from the content of one TypeScript file
     
-    for layer in layers:
-        for pattern in layer["patterns"]:
-            # Normalize pattern separators too
-            normalized_pattern = pattern.replace('\\', '/')
-            if glob.fnmatch.fnmatch(normalized_path, normalized_pattern):
-                return layer["name"]
-    return "unknown"
+    See typescript.scan_imports for the statements recognized.
+    """
+    return scan_imports(content)
 
-def collect_ts_import_edges(root: str) -> List[Dict[str, str]]:
+def collect_ruby_constant_edges(root: Source, inventory: Optional[List[SourceFile]] = None) -> List[Dict[str, Any]]:
     """
-    Collect TypeScript import dependencies
+    Collect Ruby file-to-file dependencies from constant references
     """
-    edges = []
+    if inventory is None:
+        inventory = list_sources(root)
+    reader = SourceReader(root)
+    ruby_index = RubyIndex()
+    references = {}
     
-    for p in glob.glob(os.path.join(root, "**", "*.ts*"), recursive=True):
-        rp = os.path.relpath(p, root)
-        
-        try:
-            with open(p, "r", encoding="utf-8", errors="ignore") as f:
-                for line_num, line in enumerate(f, 1):
-                    # Match import statements
-                    import_match = re.match(r'^\s*import\s+.*from\s+[\'"](.+)[\'"]', line)
-                    if import_match:
-                        spec = import_match.group(1)
-                        
-                        # Handle relative imports
-                        if spec.startswith("."):
-                            target = os.path.normpath(os.path.join(os.path.dirname(rp), spec))
-                            
-                            # Resolve file extensions
-                            if not target.endswith((".ts", ".tsx")):
-                                for ext in (".ts", ".tsx", ".d.ts", "/index.ts", "/index.tsx"):
-                                    if os.path.exists(os.path.join(root, target + ext)):
-                                        target = target + ext
-                                        break
-                            
-                            edges.append({
-                                "from_path": rp,
-                                "to_path": target,
-                                "edge_type": "import",
-                                "line_number": line_num
-                            })
-                        
-                        # Handle absolute imports (from node_modules or aliases)
-                        elif not spec.startswith("/"):
-                            edges.append({
-                                "from_path": rp,
-                                "to_path": f"EXTERNAL:{spec}",
-                                "edge_type": "import",
-                                "line_number": line_num
-                            })
-        except Exception as e:
-            # Log error but continue processing
-            print(f"Error processing {p}: {e}")
-    
-    return edges
-
-def collect_ruby_db_calls(root: str) -> List[Dict[str, str]]:
-    """
-    Collect Ruby database access patterns
-    """
-    edges = []
-    
-    for p in glob.glob(os.path.join(root, "**", "*.rb"), recursive=True):
-        rp = os.path.relpath(p, root)
-        
-        try:
-            with open(p, "r", encoding="utf-8", errors="ignore") as f:
-                content = f.read()
-                
-                # Check for ActiveRecord patterns
-                if re.search(r'\.where\(|\.find\(|ActiveRecord::Base', content):
-                    edges.append({
-                        "from_path": rp,
-                        "to_path": "DATABASE",
-                        "edge_type": "db_call"
-                    })
-                
-                # Check for direct model calls
-                if re.search(r'\.create\(|\.update\(|\.destroy\(', content):
-                    edges.append({
-                        "from_path": rp,
-                        "to_path": "DATABASE",
-                        "edge_type": "db_call"
-                    })
-        except Exception as e:
-            # Log error but continue processing
-            print(f"Error processing {p}: {e}")
-    
-    return edges
-
-def check_rules(nodes: List[Dict[str, str]], edges: List[Dict[str, str]], rules: Dict[str, Any], root: str = "") -> List[Dict[str, Any]]:
+    for source in inventory:
+        if source.lang != "ruby":
+            continue
+        with reader.open(source.path) as data:
+            if data is not None:
+                defines, references[source.path] = scan_constants(data)
+                ruby_index.add(source.path, defines)
+    
+    return [{
+        "from_path": rp,
+        "to_path": to_path,
+        "edge_type": "constant",
+        "line_number": line_num
+    } for rp, file_references in references.items()
+        for to_path, line_num in ruby_index.resolve_targets(rp, file_references)]
+
+def check_rules(nodes: List[Dict[str, str]], edges: Union[List[Dict[str, Any]], EdgeGraph], rules: Dict[str, Any],
+                root: Source = "", api_hits: Optional[Dict[str, List[Tuple[int, str, int]]]] = None,
+                graph_rules: bool = True) -> List[Dict[str, Any]]:
     """
     Check edges against architecture rules and generate violations
+    
+    edges is either a list of edge dicts or an EdgeGraph, whose node layers
+    may cover more nodes than the ones given (as when checking one batch).
+    api_hits are the disallowed API matches from collect_file_facts; without
+    them the node files are read from root. graph_rules=False skips the
+    rules that need the whole graph (see check_graph_rules), for callers
+    checking one batch of edges at a time.
     """
-    violations = []
+    index = compile_rules(rules)
+    graph = edges if isinstance(edges, EdgeGraph) else EdgeGraph.from_edges(nodes, edges)
     
-    # Create a map of file paths to layers
-    layer_map = {node["path"]: node.get("layer", "unknown") for node in nodes}
+    # One pass over the edges, comparing interned layer ids; matches are
+    # bucketed per rule so violations still come out rule by rule, in edge
+    # order within each rule
+    forbidden_hits = [[] for _ in index.forbidden_dependencies]
+    route_hits = [[] for _ in index.must_route_via]
+    forbidden_by_pair = _pairs_by_id(index.forbidden_by_pair, graph)
+    routes_by_pair = _pairs_by_id(index.routes_by_pair, graph)
+    if forbidden_by_pair or routes_by_pair:
+        layer_ids = graph.layer_ids
+        for edge_index, (from_id, to_id) in enumerate(zip(graph.from_ids, graph.to_ids)):
+            pair = (layer_ids[from_id], layer_ids[to_id])
+            for rule_index in forbidden_by_pair.get(pair, ()):
+                forbidden_hits[rule_index].append(edge_index)
+            for rule_index in routes_by_pair.get(pair, ()):
+                route_hits[rule_index].append(edge_index)
+    
+    violations = []
     
     # Check forbidden dependencies
-    for forbidden_dep in rules.get("forbidden_dependencies", []):
-        for edge in edges:
-            from_layer = layer_map.get(edge["from_path"])
-            to_layer = layer_map.get(edge["to_path"])
-            
-            if (from_layer == forbidden_dep["from"] and 
-                to_layer == forbidden_dep["to"]):
-                violations.append({
-                    "rule_code": "FORBIDDEN_DEP",
-                    "severity": "high",
-                    "node_path": edge["from_path"],
-                    "details": f"Direct dependency from {forbidden_dep['from']} to {forbidden_dep['to']}: {edge['from_path']} → {edge['to_path']}",
-                    "suggestion": "Route via allowed layer (see must_route_via rules).",
-                    "edge_type": edge.get("edge_type", "unknown")
-                })
+    for forbidden_dep, matched_edges in zip(index.forbidden_dependencies, forbidden_hits):
+        for edge in map(graph.edge, matched_edges):
+            violations.append({
+                "rule_code": "FORBIDDEN_DEP",
+                "severity": "high",
+                "node_path": edge["from_path"],
+                "details": f"Direct dependency from {forbidden_dep['from']} to {forbidden_dep['to']}: {edge['from_path']} → {edge['to_path']}",
+                "suggestion": "Route via allowed layer (see must_route_via rules).",
+                "edge_type": edge.get("edge_type", "unknown")
+            })
     
     # Check must_route_via rules
-    for route_rule in rules.get("must_route_via", []):
-        for edge in edges:
-            from_layer = layer_map.get(edge["from_path"])
-            to_layer = layer_map.get(edge["to_path"])
-            
-            if (from_layer == route_rule["from"] and 
-                to_layer == route_rule["to"]):
+    for route_rule, matched_edges in zip(index.must_route_via, route_hits):
+        for edge in map(graph.edge, matched_edges):
+            violations.append({
+                "rule_code": "BYPASS_LAYER",
+                "severity": "medium",
+                "node_path": edge["from_path"],
+                "details": f"Direct {route_rule['from']} → {route_rule['to']} edge (should go via {route_rule['via']})",
+                "suggestion": f"Introduce {route_rule['via']} boundary layer.",
+                "edge_type": edge.get("edge_type", "unknown")
+            })
+    
+    if graph_rules:
+        violations.extend(check_graph_rules(nodes, graph, rules))
+    
+    # Check disallowed APIs (file contents are only read here when the
+    # caller did not already collect the hits during its own pass)
+    if index.disallowed_apis:
+        if api_hits is None:
+            api_nodes = [node for node in nodes if node.get("layer", "unknown") in index.api_rules_by_layer]
+            api_hits = collect_api_hits(api_nodes, collect_file_facts(root, api_nodes, rules, workers=1), rules)
+        
+        hits_by_rule = [[] for _ in index.disallowed_apis]
+        for node in nodes:
+            for rule_index, pattern, line_number in api_hits.get(node["path"], ()):
+                hits_by_rule[rule_index].append((node["path"], pattern, line_number))
+        
+        for matched_nodes in hits_by_rule:
+            for node_path, pattern, line_number in matched_nodes:
                 violations.append({
-                    "rule_code": "BYPASS_LAYER",
+                    "rule_code": "DISALLOWED_API",
                     "severity": "medium",
-                    "node_path": edge["from_path"],
-                    "details": f"Direct {route_rule['from']} → {route_rule['to']} edge (should go via {route_rule['via']})",
-                    "suggestion": f"Introduce {route_rule['via']} boundary layer.",
-                    "edge_type": edge.get("edge_type", "unknown")
+                    "node_path": node_path,
+                    "details": f"Pattern `{pattern}` matched in {node_path}",
+                    "suggestion": "Move database access to appropriate service/repository layer.",
+                    "edge_type": "api_usage",
+                    "line_number": line_number
                 })
     
-    # Check disallowed APIs
-    for disallowed_api in rules.get("disallowed_apis", []):
+    return violations
+
+def check_graph_rules(nodes: List[Dict[str, str]], graph: EdgeGraph, rules: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Check the rules that depend on paths through the whole graph
+    
+    A must_route_via rule with `transitive: true` flags every file in its
+    `from` layer that can reach its `to` layer, directly or through other
+    files, without passing through a file in `via`. `no_layer_cycles: true`
+    flags every pair of declared layers whose files reach each other.
+    Reachability comes from one SCC condensation per distinct `via` layer
+    (see Reachability), so each check is linear in files and edges.
+    """
+    index = compile_rules(rules)
+    if not index.has_graph_rules:
+        return []
+    violations = []
+    reachability: Dict[Optional[int], Reachability] = {}
+    
+    def reach_without(layer_id: Optional[int]) -> Reachability:
+        if layer_id not in reachability:
+            reachability[layer_id] = Reachability(graph, excluded_layer=layer_id)
+        return reachability[layer_id]
+    
+    for rule_index in index.transitive_routes:
+        route_rule = index.must_route_via[rule_index]
+        from_id = graph.ids.get(route_rule["from"])
+        to_id = graph.ids.get(route_rule["to"])
+        if from_id is None or to_id is None:
+            continue
+        reach = reach_without(graph.ids.get(route_rule["via"]))
         for node in nodes:
-            if node.get("layer") == disallowed_api["layer"]:
-                file_path = os.path.join(root, node["path"]) if root else node["path"]
-                if os.path.exists(file_path):
-                    try:
-                        with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-                            content = f.read()
-                            
-                        for pattern in disallowed_api["patterns"]:
-                            if re.search(pattern, content):
-                                violations.append({
-                                    "rule_code": "DISALLOWED_API",
-                                    "severity": "medium",
-                                    "node_path": node["path"],
-                                    "details": f"Pattern `{pattern}` matched in {node['path']}",
-                                    "suggestion": "Move database access to appropriate service/repository layer.",
-                                    "edge_type": "api_usage"
-                                })
-                                break
-                    except Exception as e:
-                        print(f"Error checking disallowed APIs in {file_path}: {e}")
+            if node.get("layer", "unknown") != route_rule["from"]:
+                continue
+            vertex = graph.ids[node["path"]]
+            if not reach.reaches(vertex, to_id):
+                continue
+            path = reach.path_to_layer(vertex, to_id)
+            if not path:
+                continue
+            violations.append({
+                "rule_code": "BYPASS_LAYER",
+                "severity": "medium",
+                "node_path": node["path"],
+                "details": f"{route_rule['from']} reaches {route_rule['to']} without going through {route_rule['via']}: {reach.describe_path(path)}",
+                "suggestion": f"Introduce {route_rule['via']} boundary layer.",
+                "edge_type": graph.strings[graph.type_ids[path[0]]]
+            })
+    
+    if index.no_layer_cycles:
+        reach = reach_without(None)
+        layer_reach = reach.layer_reach()
+        # A layer whose files are all gone (as after a deletion in
+        # HistoryWalker) is still interned but has no bit
+        declared = [(name, graph.ids[name]) for name in index.layer_names
+                    if name in graph.ids and graph.ids[name] in reach.bit_of]
+        for position, (first, first_id) in enumerate(declared):
+            for second, second_id in declared[position + 1:]:
+                if first_id == second_id:
+                    continue
+                if not (layer_reach.get(first_id, 0) >> reach.bit_of[second_id] & 1
+                        and layer_reach.get(second_id, 0) >> reach.bit_of[first_id] & 1):
+                    continue
+                # Witness: the first file of each layer (in node order)
+                # with a path into the other
+                forward = _first_path(nodes, graph, reach, first, second_id)
+                backward = _first_path(nodes, graph, reach, second, first_id)
+                if not forward or not backward:
+                    continue
+                violations.append({
+                    "rule_code": "LAYER_CYCLE",
+                    "severity": "high",
+                    "node_path": graph.strings[graph.from_ids[forward[0]]],
+                    "details": f"Dependency cycle between {first} and {second}: {reach.describe_path(forward)} and {reach.describe_path(backward)}",
+                    "suggestion": f"Break the cycle so that only one of {first} and {second} depends on the other.",
+                    "edge_type": graph.strings[graph.type_ids[forward[0]]]
+                })
     
     return violations
+
+def _first_path(nodes: List[Dict[str, str]], graph: EdgeGraph, reach: Reachability, layer: str, target: int) -> List[int]:
+    for node in nodes:
+        if node.get("layer", "unknown") == layer:
+            path = reach.path_to_layer(graph.ids[node["path"]], target)
+            if path:
+                return path
+    return []
+
+def _pairs_by_id(by_pair: Dict[Tuple[str, str], List[int]], graph: EdgeGraph) -> Dict[Tuple[int, int], List[int]]:
+    """
+    Re-key a (from_layer, to_layer) rule table by the graph's layer ids,
+    dropping layers no node belongs to
+    """
+    return {
+        (graph.ids[from_layer], graph.ids[to_layer]): rule_indexes
+        for (from_layer, to_layer), rule_indexes in by_pair.items()
+        if from_layer in graph.ids and to_layer in graph.ids
+    }
+
+def _no_stage(name: str):
+    return nullcontext()
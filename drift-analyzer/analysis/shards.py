@@ -0,0 +1,65 @@
+import json
+import os
+import urllib.request
+import zlib
+from typing import Any, Dict, List
+
+# How files are split between shards: by a hash of the path, which
+# balances any tree, or by top-level directory, which keeps each package
+# of a monorepo on one collector
+SHARD_STRATEGIES = ("hash", "prefix")
+
+# Seconds to wait for a peer to collect its shard
+PEER_TIMEOUT = 600
+
+def configured_peers() -> List[str]:
+    """
+    The analyzer base URLs listed in DRIFT_PEERS, separated by commas
+    """
+    return [peer.strip().rstrip("/") for peer in os.environ.get("DRIFT_PEERS", "").split(",") if peer.strip()]
+
+def partition(paths: List[str], count: int, by: str = "hash") -> List[List[str]]:
+    """
+    Split paths into at most count non-empty shards
+
+    "hash" places each path by its CRC32, so the same file always lands in
+    the same shard. "prefix" keeps the files of each top-level directory
+    together and deals the directories, largest first, to the shard with
+    the fewest files so far. Paths keep their order within a shard.
+    """
+    if by not in SHARD_STRATEGIES:
+        raise ValueError(f"Unknown shard strategy: {by}")
+    count = max(1, min(count, len(paths)))
+    if by == "hash":
+        shards = [[] for _ in range(count)]
+        for path in paths:
+            shards[zlib.crc32(path.encode("utf-8")) % count].append(path)
+        return [shard for shard in shards if shard]
+
+    groups: Dict[str, List[str]] = {}
+    for path in paths:
+        groups.setdefault(path.replace("\\", "/").split("/", 1)[0], []).append(path)
+    sizes = [0] * count
+    assignment = [[] for _ in range(count)]
+    for name in sorted(groups, key=lambda name: (-len(groups[name]), name)):
+        smallest = sizes.index(min(sizes))
+        assignment[smallest].append(name)
+        sizes[smallest] += len(groups[name])
+    shard_of = {name: index for index, names in enumerate(assignment) for name in names}
+    shards = [[] for _ in range(count)]
+    for path in paths:
+        shards[shard_of[path.replace("\\", "/").split("/", 1)[0]]].append(path)
+    return [shard for shard in shards if shard]
+
+def post_shard(peer: str, body: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Ask the analyzer at peer to collect one shard (POST /shards/collect)
+
+    Raises OSError (including urllib's HTTPError) when the peer cannot be
+    reached or answers with an error.
+    """
+    request = urllib.request.Request(f"{peer}/shards/collect", data=json.dumps(body).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"}, method="POST")
+    timeout = float(os.environ.get("DRIFT_PEER_TIMEOUT", PEER_TIMEOUT))
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
@@ -0,0 +1,109 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Mapping, Tuple
+
+# Upper bounds, in seconds, of the stage latency histogram buckets
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+class Telemetry:
+    """
+    Stage timings and counters for one analysis
+
+    Stages are timed with `with telemetry.stage(name):`; a stage entered
+    more than once (a streamed scan parses batch by batch) adds up. The
+    counters are files_read, bytes_read, regex_evaluations, cache_hits and
+    cache_misses, plus whatever else callers count.
+    """
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+    def count(self, name: str, amount: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def merge(self, counts: Mapping[str, int]) -> None:
+        """
+        Add counts gathered elsewhere, e.g. by a parser process
+        """
+        for name, amount in counts.items():
+            self.count(name, amount)
+
+    def as_metrics(self) -> Dict[str, Any]:
+        """
+        The "timings" (seconds per stage) and "counters" result metrics
+        """
+        return {
+            "timings": {name: round(seconds, 6) for name, seconds in self.timings.items()},
+            "counters": dict(self.counters)
+        }
+
+class MetricsRegistry:
+    """
+    Process-wide totals behind GET /metrics, in Prometheus text format
+
+    Holds a latency histogram per stage, a total per counter and a count of
+    requests per endpoint and outcome. Values arrive as result metrics
+    (see Telemetry.as_metrics), so analyses that ran in job processes are
+    recorded by the server process once their results come back.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # stage -> (bucket counts, sum, count)
+        self._stages: Dict[str, Tuple[list, float, int]] = {}
+        self._counters: Dict[str, int] = {}
+        self._requests: Dict[Tuple[str, str], int] = {}
+
+    def observe(self, metrics: Mapping[str, Any]) -> None:
+        """
+        Record the timings and counters of one analysis result's metrics
+        """
+        with self._lock:
+            for stage, seconds in metrics.get("timings", {}).items():
+                buckets, total, count = self._stages.get(stage) or ([0] * len(STAGE_BUCKETS), 0.0, 0)
+                for i, bound in enumerate(STAGE_BUCKETS):
+                    if seconds <= bound:
+                        buckets[i] += 1
+                self._stages[stage] = (buckets, total + seconds, count + 1)
+            for name, amount in metrics.get("counters", {}).items():
+                self._counters[name] = self._counters.get(name, 0) + amount
+
+    def count_request(self, endpoint: str, outcome: str) -> None:
+        with self._lock:
+            self._requests[(endpoint, outcome)] = self._requests.get((endpoint, outcome), 0) + 1
+
+    def render(self) -> str:
+        """
+        Every metric in the Prometheus text exposition format
+        """
+        lines = []
+        with self._lock:
+            lines.append("# HELP drift_stage_seconds Time spent in each analysis stage")
+            lines.append("# TYPE drift_stage_seconds histogram")
+            for stage, (buckets, total, count) in sorted(self._stages.items()):
+                for bound, bucket_count in zip(STAGE_BUCKETS, buckets):
+                    lines.append(f'drift_stage_seconds_bucket{{stage="{stage}",le="{bound:g}"}} {bucket_count}')
+                lines.append(f'drift_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}')
+                lines.append(f'drift_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+                lines.append(f'drift_stage_seconds_count{{stage="{stage}"}} {count}')
+            for name, amount in sorted(self._counters.items()):
+                lines.append(f"# TYPE drift_{name}_total counter")
+                lines.append(f"drift_{name}_total {amount}")
+            lines.append("# HELP drift_requests_total Analysis requests by endpoint and outcome")
+            lines.append("# TYPE drift_requests_total counter")
+            for (endpoint, outcome), count in sorted(self._requests.items()):
+                lines.append(f'drift_requests_total{{endpoint="{endpoint}",outcome="{outcome}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+# The server's registry
+REGISTRY = MetricsRegistry()
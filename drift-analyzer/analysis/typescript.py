@@ -0,0 +1,311 @@
+import json
+import logging
+import os
+import re
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+# Keywords that can start a statement naming a module. `export` only counts
+# when a re-export list or `*` follows. The character before a match is
+# checked separately: a leading lookbehind would stop the regex engine
+# from searching for the literal words.
+_KEYWORD_RE = re.compile(r"(?:import|require|export(?=\s+(?:type\s+)?[*{]))(?![\w$])")
+_NOT_BEFORE_KEYWORD = re.compile(r"[\w$.]")
+
+# Runs of code, complete string literals and comments. Matched up to a
+# keyword, it stops short of it when the keyword sits inside a string or
+# comment. Quoted strings cannot span lines, so a stray apostrophe in JSX
+# text is stepped over on its own.
+_SKIP_RE = re.compile(r"""(?:
+    [^'"`/]+
+  | '(?:[^'\\\n]|\\.)*'
+  | "(?:[^"\\\n]|\\.)*"
+  | `(?:[^`\\]|\\.)*`
+  | //[^\n]*(?=\n)
+  | /\*.*?\*/
+  | /(?![/*])
+)*""", re.S | re.X)
+_TOKEN_RE = re.compile(r"""
+    '(?:[^'\\\n]|\\.)*'
+  | "(?:[^"\\\n]|\\.)*"
+  | `(?:[^`\\]|\\.)*`
+  | //[^\n]*
+  | /\*.*?(?:\*/|\Z)
+""", re.S | re.X)
+
+# A module specifier in quotes
+_SPEC = r"""(?:'(?P<spec>[^'\n]*)'|"(?P<dspec>[^"\n]*)")"""
+
+# What must follow each keyword for the statement to name a module. Import
+# and export lists may span lines.
+_CALL_RE = re.compile(r"""\s*\(\s*(?:""" + _SPEC + r"""|`(?P<tspec>[^`\\$]*)`)""")
+_IMPORT_RE = re.compile(
+    r"""\s*(?:type\s+)?(?:[\w$]+\s*,?\s*)?(?:\*\s*as\s+[\w$]+\s*|\{[^{}]*\}\s*)?from\s*""" + _SPEC
+    + r"""|\s*""" + _SPEC.replace("spec>", "bare>")
+)
+_EXPORT_RE = re.compile(
+    r"""\s+(?:type\s+)?(?:\*(?:\s*as\s+[\w$]+)?|\{[^{}]*\})\s*from\s*""" + _SPEC
+)
+
+# What a relative or aliased target may be missing, tried in this order
+RESOLVE_SUFFIXES = (".ts", ".tsx", ".d.ts", "/index.ts", "/index.tsx")
+
+# ESM-style TypeScript imports name the compiled file (./util.js) while the
+# repo holds the source (./util.ts)
+_COMPILED_EXTENSIONS = {".js": (".ts", ".tsx"), ".jsx": (".tsx",), ".mjs": (".mts",), ".cjs": (".cts",)}
+
+CONFIG_NAMES = ("tsconfig.json", "jsconfig.json")
+
+logger = logging.getLogger(__name__)
+
+def _in_code(content: str, position: int, target: int) -> Tuple[bool, int]:
+    """
+    Skip from position (known to be in code) towards target; report whether
+    target is in code, and where skipping stopped
+    """
+    while True:
+        position = _SKIP_RE.match(content, position, target).end()
+        if position >= target:
+            return True, position
+        # A string or comment runs past target, or a quote is unterminated
+        token = _TOKEN_RE.match(content, position)
+        position = token.end() if token else position + 1
+        if position > target:
+            return False, position
+
+def scan_imports(content: str) -> List[List[Any]]:
+    """
+    Extract [specifier, line number] pairs for every module a TypeScript
+    file depends on
+
+    Recognizes `import ... from`, side-effect `import '...'`, `export ...
+    from`, `import type`, `require('...')` and `import('...')` with string
+    arguments, including statements spread over several lines. Keywords in
+    comments and strings are ignored. The line number is the one the
+    statement starts on.
+    """
+    found = []
+    position = 0
+    for keyword in _KEYWORD_RE.finditer(content):
+        if keyword.start() < position:
+            continue
+        if keyword.start() and _NOT_BEFORE_KEYWORD.match(content, keyword.start() - 1):
+            # Part of a longer name, or a property such as module.require
+            continue
+        in_code, position = _in_code(content, position, keyword.start())
+        if not in_code:
+            continue
+
+        word = keyword.group()
+        if word == "require":
+            statement = _CALL_RE.match(content, keyword.end())
+        elif word == "import":
+            statement = _CALL_RE.match(content, keyword.end()) or _IMPORT_RE.match(content, keyword.end())
+        else:
+            statement = _EXPORT_RE.match(content, keyword.end())
+        position = keyword.end()
+        if statement is not None:
+            found.append((next(value for value in statement.groups() if value is not None), keyword.start()))
+            position = statement.end()
+
+    # Positions only increase, so lines are counted incrementally
+    imports = []
+    line = 1
+    position = 0
+    for spec, start in found:
+        line += content.count("\n", position, start)
+        position = start
+        imports.append([spec, line])
+    return imports
+
+def lookup_targets(path: str) -> Set[str]:
+    """
+    Every target TsResolver.lookup could find path for; the inverse of its
+    candidate list, so adding or removing path can only change lookups of
+    these targets
+    """
+    targets = {path}
+    stem, ext = os.path.splitext(path)
+    for compiled, sources in _COMPILED_EXTENSIONS.items():
+        if ext in sources:
+            targets.add(stem + compiled)
+    for suffix in RESOLVE_SUFFIXES:
+        suffix = suffix.replace("/", os.sep)
+        if path.endswith(suffix):
+            targets.add(path[:-len(suffix)] or ".")
+        elif suffix.startswith(os.sep) and path == suffix[1:]:
+            targets.add(".")
+    return targets
+
+def _strip_jsonc(text: str) -> str:
+    """
+    Drop the comments and trailing commas tsconfig files allow
+    """
+    keep_strings = lambda m: m.group(1) or ""
+    text = re.sub(r'("(?:[^"\\]|\\.)*")|//[^\n]*|/\*.*?\*/', keep_strings, text, flags=re.S)
+    return re.sub(r'("(?:[^"\\]|\\.)*")|,(?=\s*[}\]])', keep_strings, text)
+
+class TsResolver:
+    """
+    Resolves import specifiers against the files of one repository
+
+    Candidates are checked against the inventory set rather than stat'ed on
+    disk. Non-relative specifiers go through the `paths` and `baseUrl` of
+    the nearest tsconfig.json (or jsconfig.json), following relative
+    `extends`; each config is read once per resolver, and the config for
+    each directory is memoized, so build one resolver per scan. Configs are
+    read from root, or through read_text (path to content, None when there
+    is no such file) when the files are not checked out.
+    """
+
+    def __init__(self, root: str, known_paths: Set[str], read_text: Optional[Callable[[str], Optional[str]]] = None):
+        self.root = root
+        self.known_paths = known_paths
+        self.read_text = read_text or self._read_file
+        self._dir_configs: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._configs: Dict[str, Optional[Dict[str, Any]]] = {}
+        # When set, every target passed to lookup is added to it
+        self.probed: Optional[Set[str]] = None
+
+    def resolve(self, rp: str, imports: List[List[Any]]) -> List[Dict[str, Any]]:
+        """
+        Turn one file's [specifier, line] pairs into import edges
+        """
+        return [{
+            "from_path": rp,
+            "to_path": to_path,
+            "edge_type": "import",
+            "line_number": line_num
+        } for to_path, line_num in self.resolve_targets(rp, imports)]
+
+    def resolve_targets(self, rp: str, imports: List[List[Any]]) -> Iterator[Tuple[str, int]]:
+        """
+        Yield (target path, line) for each of one file's [specifier, line]
+        pairs that names a module
+        """
+        for spec, line_num in imports:
+            # Handle relative imports
+            if spec.startswith("."):
+                target = os.path.normpath(os.path.join(os.path.dirname(rp), spec))
+                # Unresolvable targets keep their literal path
+                to_path = self.lookup(target) or target
+            # Absolute paths are not module specifiers
+            elif spec.startswith("/"):
+                continue
+            else:
+                # Aliases, then node_modules and other external packages
+                to_path = self._resolve_alias(rp, spec) or f"EXTERNAL:{spec}"
+            yield to_path, line_num
+
+    def lookup(self, target: str) -> Optional[str]:
+        """
+        The inventoried file a normalized, extension-less or compiled-file
+        target refers to, if any
+        """
+        if self.probed is not None:
+            self.probed.add(target)
+        if target in self.known_paths:
+            return target
+        stem, ext = os.path.splitext(target)
+        for source_ext in _COMPILED_EXTENSIONS.get(ext, ()):
+            if stem + source_ext in self.known_paths:
+                return stem + source_ext
+        for suffix in RESOLVE_SUFFIXES:
+            candidate = os.path.normpath(target + suffix)
+            if candidate in self.known_paths:
+                return candidate
+        return None
+
+    def _resolve_alias(self, rp: str, spec: str) -> Optional[str]:
+        config = self._config_for(os.path.dirname(rp))
+        if config is None:
+            return None
+
+        paths, paths_base = config["paths"]
+        substitutions = paths.get(spec)
+        if substitutions is None:
+            # The wildcard pattern with the longest prefix wins
+            best = None
+            for pattern in paths:
+                prefix, star, suffix = pattern.partition("*")
+                if (star and spec.startswith(prefix) and spec.endswith(suffix)
+                        and len(spec) >= len(prefix) + len(suffix)
+                        and (best is None or len(prefix) > len(best[0]))):
+                    best = (prefix, pattern, spec[len(prefix):len(spec) - len(suffix)])
+            if best is not None:
+                substitutions = [s.replace("*", best[2], 1) for s in paths[best[1]]]
+
+        for substitution in substitutions or ():
+            found = self.lookup(os.path.normpath(os.path.join(paths_base, substitution)))
+            if found:
+                return found
+        if config["base_url"] is not None:
+            return self.lookup(os.path.normpath(os.path.join(config["base_url"], spec)))
+        return None
+
+    def _config_for(self, directory: str) -> Optional[Dict[str, Any]]:
+        if directory in self._dir_configs:
+            return self._dir_configs[directory]
+        config = None
+        for name in CONFIG_NAMES:
+            path = os.path.join(directory, name)
+            if path in self._configs or self.read_text(path) is not None:
+                config = self._load_config(path)
+                break
+        else:
+            if directory:
+                config = self._config_for(os.path.dirname(directory))
+        self._dir_configs[directory] = config
+        return config
+
+    def _load_config(self, path: str, seen: Tuple[str, ...] = ()) -> Optional[Dict[str, Any]]:
+        """
+        Read a config's baseUrl and paths, merged over what it extends, with
+        directories made relative to the repository root
+        """
+        if path in self._configs:
+            return self._configs[path]
+        self._configs[path] = None
+        try:
+            text = self.read_text(path)
+            if text is None:
+                return None
+            data = json.loads(_strip_jsonc(text))
+        except ValueError as e:
+            # Log error but resolve as if there were no config
+            logger.warning("Error reading %s: %s", path, e)
+            return None
+
+        config_dir = os.path.dirname(path)
+        config = {"base_url": None, "paths": ({}, config_dir)}
+        extends = data.get("extends") if isinstance(data, dict) else None
+        for parent in extends if isinstance(extends, list) else [extends]:
+            # Only configs inside the repository can be followed
+            if isinstance(parent, str) and parent.startswith("."):
+                parent_path = os.path.normpath(os.path.join(config_dir, parent))
+                if not parent_path.endswith(".json"):
+                    parent_path += ".json"
+                if not parent_path.startswith("..") and parent_path not in seen:
+                    inherited = self._load_config(parent_path, seen + (path,))
+                    if inherited is not None:
+                        config = dict(inherited)
+
+        options = data.get("compilerOptions", {}) if isinstance(data, dict) else {}
+        if isinstance(options.get("baseUrl"), str):
+            config["base_url"] = os.path.normpath(os.path.join(config_dir, options["baseUrl"]))
+        if isinstance(options.get("paths"), dict):
+            paths = {pattern: targets for pattern, targets in options["paths"].items() if isinstance(targets, list)}
+            config["paths"] = (paths, config_dir)
+        # paths are relative to baseUrl when there is one, else to the
+        # config that declares them
+        if config["base_url"] is not None:
+            config["paths"] = (config["paths"][0], config["base_url"])
+
+        self._configs[path] = config
+        return config
+
+    def _read_file(self, path: str) -> Optional[str]:
+        try:
+            with open(os.path.join(self.root, path), "r", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
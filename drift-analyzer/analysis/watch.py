@@ -0,0 +1,429 @@
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .cache import FactCache, git_blob_sha, read_blob_shas
+from .history import HistoryWalker
+from .inventory import IGNORED_DIRS, inventory_lang
+from .typescript import CONFIG_NAMES
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two scans of the tree by the polling watcher
+POLL_INTERVAL = 0.5
+
+# Seconds to keep collecting events after the first one, so the files an
+# editor writes in one save arrive as one update
+SETTLE_DELAY = 0.01
+
+# inotify(7) event bits
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_Q_OVERFLOW = 0x4000
+_IN_IGNORED = 0x8000
+_IN_ISDIR = 0x40000000
+_WATCH_MASK = _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+_EVENT = struct.Struct("iIII")
+
+def is_watched(path: str) -> bool:
+    """
+    Whether a "/"-separated repo-relative path can change the analysis: a
+    source file, a tsconfig or the root .gitattributes
+    """
+    if path == ".gitattributes":
+        return True
+    if inventory_lang(path) is not None:
+        return True
+    parts = path.split("/")
+    return (parts[-1] in CONFIG_NAMES and not any(part.startswith(".") or part in IGNORED_DIRS for part in parts[:-1]))
+
+def walk_watched(root: str, rel_dir: str = "") -> Iterator[Tuple[str, os.DirEntry]]:
+    """
+    Yield ("/"-separated path, DirEntry) for every watched file below
+    rel_dir, pruning hidden and ignored directories like build_inventory
+    """
+    stack = [rel_dir]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(os.path.join(root, current)) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        for entry in entries:
+            path = f"{current}/{entry.name}" if current else entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if not entry.name.startswith(".") and entry.name not in IGNORED_DIRS:
+                        stack.append(path)
+                elif entry.is_file() and is_watched(path):
+                    yield path, entry
+            except OSError:
+                continue
+
+class _WorkingTreeBlobs:
+    """
+    The BlobReader a LiveGraph hands to HistoryWalker: blob SHAs map back
+    to the file they were hashed from, and content just hashed is kept
+    until its first read so a changed file is read from disk once
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.paths: Dict[str, str] = {}
+        self.pending: Dict[str, bytes] = {}
+
+    def remember(self, sha: str, path: str, data: Optional[bytes] = None) -> None:
+        self.paths[sha] = path
+        if data is not None:
+            self.pending[sha] = data
+
+    def read(self, sha: str) -> Optional[bytes]:
+        data = self.pending.pop(sha, None)
+        if data is not None or sha not in self.paths:
+            return data
+        return _read(self.root, self.paths[sha])
+
+class LiveGraph(HistoryWalker):
+    """
+    The analysis of a working tree, kept in memory and updated file by file
+
+    load() analyzes the checkout once; update() then takes the paths a
+    watcher reports, hashes them, and re-parses and re-checks only the
+    files whose content changed, through the same per-file bookkeeping
+    HistoryWalker uses between commits. Files git already has are not read
+    at load time to get their blob SHAs, so with a FactCache a reload of
+    an unchanged checkout parses nothing.
+    """
+
+    def __init__(self, root: str, rules: Dict[str, Any], cache: Optional[FactCache] = None):
+        super().__init__(root, rules, cache, _WorkingTreeBlobs(root))
+        self.root = root
+        self.attributes_sha: Optional[str] = None
+
+    def load(self, workers: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Analyze the whole working tree and return its metrics
+        """
+        known = read_blob_shas(self.root)
+        entries = []
+        for path, _ in walk_watched(self.root):
+            rp = path.replace("/", os.sep)
+            sha = known.get(rp)
+            if sha is None:
+                data = _read(self.root, rp)
+                if data is None:
+                    continue
+                sha = git_blob_sha(data)
+            self.blobs.remember(sha, rp)
+            if path == ".gitattributes":
+                self.attributes_sha = sha
+            entries.append(("100644", sha, path))
+        return {"metrics": self._load(entries, self.root, workers)}
+
+    def update(self, paths: Iterable[str]) -> Optional[Dict[str, Any]]:
+        """
+        Bring the graph up to date with the "/"-separated paths a watcher
+        reported as changed; returns the metrics with the violations added
+        and removed, or None when no watched content changed
+
+        A path that no longer exists removes the file, or everything under
+        it when it was a directory.
+        """
+        entries = []
+        for path in set(paths):
+            rp = path.replace("/", os.sep)
+            full = os.path.join(self.root, rp)
+            if os.path.isdir(full):
+                continue
+            data = _read(self.root, rp) if is_watched(path) else None
+            if data is None:
+                prefix = rp + os.sep
+                gone = [known for known in list(self.nodes) + list(self.configs)
+                        if known == rp or known.startswith(prefix)]
+                if path == ".gitattributes" and self.attributes_sha is not None:
+                    self.attributes_sha = None
+                    gone.append(rp)
+                entries.extend(("100644", None, known.replace(os.sep, "/")) for known in gone)
+                continue
+            sha = git_blob_sha(data)
+            if sha in (self.shas.get(rp), self.configs.get(rp)) or (path == ".gitattributes" and sha == self.attributes_sha):
+                continue
+            if path == ".gitattributes":
+                self.attributes_sha = sha
+            self.blobs.remember(sha, rp, data)
+            entries.append(("100644", sha, path))
+        if not entries:
+            return None
+        return self._advance(entries)
+
+    def rescan(self) -> Optional[Dict[str, Any]]:
+        """
+        update() with every path that may have changed, found by walking the
+        tree, for when the watcher lost events
+        """
+        present = {path for path, _ in walk_watched(self.root)}
+        known = {path.replace(os.sep, "/") for path in list(self.nodes) + list(self.configs)}
+        return self.update(present | known | {".gitattributes"})
+
+    def current_violations(self) -> List[Dict[str, Any]]:
+        """
+        Every current violation, per-file ones in path order, then the
+        graph-wide ones
+        """
+        violations = [violation for path in self._ordered_paths() for violation in self.violations.get(path, ())]
+        return violations + self.graph_violations
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        The current violations and metrics, for a client that starts watching
+        """
+        return {"violations": self.current_violations(), "metrics": self._metrics({"hits": 0, "misses": 0})}
+
+class PollingWatcher:
+    """
+    Reports changed files by walking the tree and comparing each watched
+    file's modification time and size, every POLL_INTERVAL seconds; the
+    fallback where inotify is not available
+    """
+
+    def __init__(self, root: str, interval: float = POLL_INTERVAL):
+        self.root = root
+        self.interval = interval
+        self.state = self._stat_tree()
+
+    def poll(self, timeout: Optional[float] = None) -> Set[str]:
+        """
+        Wait up to timeout seconds (one interval by default) and return the
+        paths that changed meanwhile
+        """
+        time.sleep(self.interval if timeout is None else min(self.interval, timeout))
+        state = self._stat_tree()
+        changed = {path for path, signature in state.items() if self.state.get(path) != signature}
+        changed.update(path for path in self.state if path not in state)
+        self.state = state
+        return changed
+
+    def close(self) -> None:
+        pass
+
+    def _stat_tree(self) -> Dict[str, Tuple[int, int]]:
+        state = {}
+        for path, entry in walk_watched(self.root):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            state[path] = (stat.st_mtime_ns, stat.st_size)
+        return state
+
+class InotifyWatcher:
+    """
+    Reports changed files from Linux inotify events, with one watch per
+    directory (hidden and ignored ones excepted)
+
+    Directories created later are watched as they appear and their files
+    reported. When the kernel queue overflows, poll() returns None and
+    the caller rescans. Raises OSError when inotify is unavailable or the
+    watch limit (fs.inotify.max_user_watches) is too low for the tree.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        library = ctypes.util.find_library("c")
+        if library is None or not hasattr(ctypes.CDLL(library), "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self.libc = ctypes.CDLL(library, use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs: Dict[int, str] = {}
+        try:
+            self._watch_tree("")
+        except OSError:
+            self.close()
+            raise
+
+    def poll(self, timeout: Optional[float] = None) -> Optional[Set[str]]:
+        """
+        Wait up to timeout seconds (forever when None) for events and return
+        the changed paths, or None after an event queue overflow
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        time.sleep(SETTLE_DELAY)
+        changed: Set[str] = set()
+        overflow = False
+        for wd, mask, name in self._read_events():
+            if mask & _IN_Q_OVERFLOW:
+                overflow = True
+                continue
+            if mask & _IN_IGNORED:
+                self.dirs.pop(wd, None)
+                continue
+            directory = self.dirs.get(wd)
+            if directory is None:
+                continue
+            path = f"{directory}/{name}" if directory else name
+            if mask & _IN_ISDIR:
+                if name.startswith(".") or name in IGNORED_DIRS:
+                    continue
+                if mask & (_IN_CREATE | _IN_MOVED_TO):
+                    changed.update(self._watch_tree(path))
+                else:
+                    changed.add(path)
+            elif mask & (_IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_MOVED_FROM | _IN_DELETE) and is_watched(path):
+                changed.add(path)
+        return None if overflow else changed
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def _watch_tree(self, rel_dir: str) -> List[str]:
+        """
+        Watch rel_dir and the directories below it; returns the watched
+        files already there
+        """
+        stack = [rel_dir]
+        while stack:
+            current = stack.pop()
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(os.path.join(self.root, current)), _WATCH_MASK)
+            if wd < 0:
+                code = ctypes.get_errno()
+                if code in (errno.ENOSPC, errno.ENOMEM):
+                    raise OSError(code, "inotify watch limit reached")
+                continue
+            self.dirs[wd] = current
+            try:
+                with os.scandir(os.path.join(self.root, current)) as it:
+                    for entry in it:
+                        if (entry.is_dir(follow_symlinks=False) and not entry.name.startswith(".")
+                                and entry.name not in IGNORED_DIRS):
+                            stack.append(f"{current}/{entry.name}" if current else entry.name)
+            except OSError:
+                continue
+        return [path for path, _ in walk_watched(self.root, rel_dir)] if rel_dir else []
+
+    def _read_events(self) -> Iterator[Tuple[int, int, str]]:
+        while True:
+            try:
+                buffer = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, _, length = _EVENT.unpack_from(buffer, offset)
+                offset += _EVENT.size
+                name = os.fsdecode(buffer[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                yield wd, mask, name
+
+def open_watcher(root: str):
+    """
+    An InotifyWatcher for root, or a PollingWatcher where inotify cannot be
+    used or DRIFT_WATCH_POLL is set
+    """
+    if not os.environ.get("DRIFT_WATCH_POLL"):
+        try:
+            return InotifyWatcher(root)
+        except OSError as e:
+            logger.warning("Watching %s by polling: %s", root, e)
+    return PollingWatcher(root, float(os.environ.get("DRIFT_WATCH_POLL_INTERVAL", POLL_INTERVAL)))
+
+def apply_changes(graph: LiveGraph, changes: Optional[Set[str]]) -> Optional[Dict[str, Any]]:
+    """
+    Feed one poll() result to graph; returns the update record to publish,
+    with how long the update took, or None when nothing changed
+    """
+    if changes is not None and not changes:
+        return None
+    start = time.perf_counter()
+    update = graph.rescan() if changes is None else graph.update(changes)
+    if update is None:
+        return None
+    return dict(type="update", seconds=round(time.perf_counter() - start, 6), **update)
+
+class WatchSession:
+    """
+    A LiveGraph kept current by a watcher thread, with every update handed
+    to the subscribed callbacks (called on that thread)
+    """
+
+    def __init__(self, root: str, rules: Dict[str, Any], cache: Optional[FactCache] = None):
+        self.root = os.path.abspath(root)
+        self.graph = LiveGraph(self.root, rules, cache)
+        self.watcher = None
+        self.lock = threading.Lock()
+        self.subscribers: List[Callable[[Dict[str, Any]], None]] = []
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self, workers: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Load the graph and start watching; returns the load metrics
+        """
+        # Watch first, so no save between the load and the watch is missed
+        self.watcher = open_watcher(self.root)
+        with self.lock:
+            loaded = self.graph.load(workers)
+        self.thread = threading.Thread(target=self._run, name="drift-watch", daemon=True)
+        self.thread.start()
+        return loaded
+
+    def subscribe(self, callback: Callable[[Dict[str, Any]], None]) -> Tuple[Dict[str, Any], Callable[[], None]]:
+        """
+        Register callback for future updates; returns the current snapshot,
+        taken atomically with the registration, and an unsubscribe function
+        """
+        with self.lock:
+            self.subscribers.append(callback)
+            snapshot = dict(type="snapshot", **self.graph.snapshot())
+
+        def unsubscribe():
+            with self.lock:
+                if callback in self.subscribers:
+                    self.subscribers.remove(callback)
+        return snapshot, unsubscribe
+
+    def close(self) -> None:
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+        if self.watcher is not None:
+            self.watcher.close()
+
+    def _run(self) -> None:
+        while not self.stopped.is_set():
+            changes = self.watcher.poll(0.5)
+            if changes is not None and not changes:
+                continue
+            with self.lock:
+                try:
+                    update = apply_changes(self.graph, changes)
+                except Exception:
+                    logger.exception("Updating the watched graph of %s failed", self.root)
+                    continue
+                subscribers = list(self.subscribers)
+            if update is not None:
+                for callback in subscribers:
+                    callback(update)
+
+def _read(root: str, path: str) -> Optional[bytes]:
+    try:
+        with open(os.path.join(root, path), "rb") as f:
+            return f.read()
+    except OSError:
+        return None
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the drift analyzer on synthetic Rails + TypeScript repos
+
+    python benchmark.py generate DIR --files 20000       # just write a repo
+    python benchmark.py run --files 20000 --output baseline.json
+    python benchmark.py run --files 20000 --compare baseline.json
+    python benchmark.py compare baseline.json current.json
+
+`run` times each stage of the scan pipeline (best of --repeat runs), then
+repeats it once under tracemalloc for each stage's peak memory, and writes
+both to a JSON report. Comparing exits with status 1 when a stage got
+slower or bigger than the threshold allows.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Add the current directory to Python path so we can import analysis.scan
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from analysis.graph import EdgeGraph
+from analysis.inventory import build_inventory
+from analysis.scan import (ScanResult, build_edges, build_metrics, build_ruby_index, check_rules,
+                           collect_api_hits, collect_file_facts, collect_nodes)
+from analysis.typescript import TsResolver
+
+STAGES = ("walk", "collect_nodes", "parse", "edges", "check_rules", "serialize")
+
+RUBY_LAYERS = ("controllers", "services", "repositories", "models", "jobs")
+TS_LAYERS = ("components", "hooks", "services", "api", "utils")
+
+# Stages faster than this are too noisy to flag
+MIN_COMPARED_SECONDS = 0.005
+
+def generate_repo(root: str, files: int = 1000, fan_out: int = 5, rule_count: int = 10,
+                  pattern_count: int = 5, ts_share: float = 0.5, seed: int = 0) -> Dict[str, Any]:
+    """
+    Write a synthetic repo under root and return the rules to analyze it with
+
+    Ruby files are spread over app/<layer>, TypeScript files over
+    frontend/<layer>; each TypeScript file imports fan_out others (mostly
+    relative, some through a tsconfig alias, some external packages), Ruby
+    files refer to up to fan_out other Ruby classes, and some Ruby files
+    make database calls. The rules hold rule_count
+    dependency rules and pattern_count disallowed API patterns per layer.
+    The same arguments always produce the same repo.
+    """
+    rng = random.Random(seed)
+    ts_files = int(files * ts_share)
+    ruby_files = files - ts_files
+
+    ts_paths = []
+    for i in range(ts_files):
+        layer = TS_LAYERS[i % len(TS_LAYERS)]
+        ext = ".tsx" if layer == "components" else ".ts"
+        ts_paths.append(f"frontend/{layer}/module_{i}{ext}")
+
+    def ruby_class(i: int) -> str:
+        return f"{RUBY_LAYERS[i % len(RUBY_LAYERS)].capitalize()}{i}"
+
+    for i in range(ruby_files):
+        layer = RUBY_LAYERS[i % len(RUBY_LAYERS)]
+        lines = [f"class {ruby_class(i)}"]
+        for method in range(rng.randint(3, 12)):
+            lines.append(f"  def method_{method}(id)")
+            roll = rng.random()
+            if roll < 0.15:
+                lines.append(f"    Record{i}.where(id: id)")
+            elif roll < 0.25:
+                lines.append(f"    Record{i}.call_api_{rng.randrange(max(pattern_count, 1))}(id)")
+            elif method < fan_out:
+                lines.append(f"    {ruby_class(rng.randrange(ruby_files))}.new.method_{method}(id)")
+            else:
+                lines.append(f"    helper_{method}(id) + {rng.randint(0, 100)}")
+            lines.append("  end")
+        lines.append("end")
+        _write(root, f"app/{layer}/record_{i}.rb", "\n".join(lines) + "\n")
+
+    for i, path in enumerate(ts_paths):
+        lines = []
+        for j in range(fan_out if ts_paths else 0):
+            target = ts_paths[rng.randrange(len(ts_paths))]
+            stem = os.path.splitext(target)[0]
+            roll = rng.random()
+            if roll < 0.1:
+                lines.append(f"import {{ pkg{j} }} from 'package-{rng.randrange(50)}'")
+            elif roll < 0.3:
+                lines.append(f"import {{ dep{j} }} from '@/{stem[len('frontend/'):]}'")
+            else:
+                relative = os.path.relpath(stem, os.path.dirname(path)).replace(os.sep, "/")
+                if not relative.startswith("."):
+                    relative = "./" + relative
+                lines.append(f"import {{ dep{j} }} from '{relative}'")
+        lines.append("")
+        lines.append(f"// Module {i}: 'import' in a comment is not an import")
+        lines.append(f"export function run{i}(input: number): number {{")
+        for step in range(rng.randint(3, 15)):
+            lines.append(f"  input = input * {step + 1} + {rng.randint(0, 9)}")
+        if rng.random() < 0.1:
+            lines.append(f"  fetchApi{rng.randrange(max(pattern_count, 1))}(input)")
+        lines.append("  return input")
+        lines.append("}")
+        _write(root, path, "\n".join(lines) + "\n")
+
+    _write(root, "tsconfig.json", json.dumps({"compilerOptions": {"baseUrl": ".", "paths": {"@/*": ["frontend/*"]}}}))
+    return synthetic_rules(rule_count, pattern_count, rng)
+
+def synthetic_rules(rule_count: int, pattern_count: int, rng: random.Random) -> Dict[str, Any]:
+    """
+    Layers for every generated directory plus random dependency rules
+    """
+    layers = [{"name": f"rb_{layer}", "patterns": [f"app/{layer}/**/*.rb"]} for layer in RUBY_LAYERS]
+    layers += [{"name": f"ts_{layer}", "patterns": [f"frontend/{layer}/**/*.{{ts,tsx}}"]} for layer in TS_LAYERS]
+    names = [layer["name"] for layer in layers]
+    ts_names = [f"ts_{layer}" for layer in TS_LAYERS]
+
+    forbidden = []
+    routes = []
+    for i in range(rule_count):
+        source, target = rng.sample(ts_names, 2)
+        if i % 2:
+            via = rng.choice([name for name in ts_names if name not in (source, target)])
+            routes.append({"from": source, "to": target, "via": via})
+        else:
+            forbidden.append({"from": source, "to": target})
+
+    disallowed = [{"layer": name, "patterns": [f"\\.call_api_{k}\\(" if name.startswith("rb_") else f"fetchApi{k}\\("
+                                               for k in range(pattern_count)]}
+                  for name in names]
+    return {
+        "layers": layers,
+        "forbidden_dependencies": forbidden,
+        "must_route_via": routes,
+        "disallowed_apis": disallowed if pattern_count else [],
+    }
+
+def _write(root: str, path: str, content: str) -> None:
+    full_path = os.path.join(root, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    with open(full_path, "w") as f:
+        f.write(content)
+
+def run_stages(root: str, rules: Dict[str, Any], workers: int = 1,
+               on_stage: Optional[Callable[[str, Callable[[], Any]], Any]] = None) -> Dict[str, int]:
+    """
+    Run the scan_repo pipeline stage by stage, each through on_stage(name,
+    step), and return the result counts
+    """
+    if on_stage is None:
+        on_stage = lambda name, step: step()
+    inventory = on_stage("walk", lambda: build_inventory(root))
+    nodes = on_stage("collect_nodes", lambda: collect_nodes(root, rules, inventory))
+    facts = on_stage("parse", lambda: collect_file_facts(root, nodes, rules, workers=workers))
+
+    graph = EdgeGraph()
+    def edges():
+        graph.set_layers(nodes)
+        build_edges(nodes, facts, TsResolver(root, {source.path for source in inventory}), graph,
+                    build_ruby_index(nodes, facts))
+    on_stage("edges", edges)
+
+    violations = on_stage("check_rules", lambda: check_rules(
+        nodes, graph, rules, root, api_hits=collect_api_hits(nodes, facts, rules)))
+    counts = {"nodes": len(nodes), "edges": len(graph), "violations": len(violations),
+              "skipped": len(nodes) - len(facts)}
+    result = ScanResult(nodes, graph, violations, build_metrics(counts))
+    on_stage("serialize", lambda: json.dumps(result.as_dict()))
+    return counts
+
+def measure(root: str, rules: Dict[str, Any], repeat: int = 3, workers: int = 1) -> Dict[str, Any]:
+    """
+    Time every stage (best of repeat runs) and measure its peak memory
+    """
+    seconds = {stage: float("inf") for stage in STAGES}
+
+    def timed(name, step):
+        start = time.perf_counter()
+        value = step()
+        seconds[name] = min(seconds[name], time.perf_counter() - start)
+        return value
+
+    for _ in range(repeat):
+        counts = run_stages(root, rules, workers, timed)
+
+    # A separate pass, since tracing allocations slows everything down;
+    # parser processes are not traced, so parse runs in this process
+    peaks = {}
+    def traced(name, step):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        value = step()
+        peaks[name] = tracemalloc.get_traced_memory()[1] - before
+        return value
+
+    tracemalloc.start()
+    try:
+        run_stages(root, rules, 1, traced)
+    finally:
+        tracemalloc.stop()
+
+    files = counts["nodes"]
+    return {
+        "counts": counts,
+        "stages": {
+            stage: {
+                "seconds": round(seconds[stage], 6),
+                "files_per_second": round(files / seconds[stage], 1) if seconds[stage] else None,
+                "peak_bytes": peaks[stage],
+            } for stage in STAGES
+        },
+        "total_seconds": round(sum(seconds.values()), 6),
+    }
+
+def compare_reports(baseline: Dict[str, Any], current: Dict[str, Any],
+                    threshold: float = 0.1) -> List[Tuple[str, str, float, float]]:
+    """
+    List (stage, metric, baseline, current) for every stage whose time or
+    peak memory grew by more than threshold (0.1 = 10%)
+    """
+    regressions = []
+    for stage, before in baseline["stages"].items():
+        after = current["stages"].get(stage)
+        if after is None:
+            continue
+        if after["seconds"] >= MIN_COMPARED_SECONDS and after["seconds"] > before["seconds"] * (1 + threshold):
+            regressions.append((stage, "seconds", before["seconds"], after["seconds"]))
+        if after["peak_bytes"] > before["peak_bytes"] * (1 + threshold):
+            regressions.append((stage, "peak_bytes", before["peak_bytes"], after["peak_bytes"]))
+    return regressions
+
+def print_report(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    print(f"{report['counts']['nodes']} files, {report['counts']['edges']} edges, "
+          f"{report['counts']['violations']} violations")
+    for stage, numbers in report["stages"].items():
+        line = f"  {stage:<14} {numbers['seconds'] * 1000:10.1f} ms {numbers['peak_bytes'] / 1024 ** 2:9.1f} MiB"
+        before = baseline["stages"].get(stage) if baseline else None
+        if before and before["seconds"]:
+            line += f"  {(numbers['seconds'] / before['seconds'] - 1) * 100:+6.1f}% time"
+        print(line)
+    print(f"  {'total':<14} {report['total_seconds'] * 1000:10.1f} ms")
+
+def check_regressions(baseline: Dict[str, Any], report: Dict[str, Any], threshold: float) -> int:
+    if baseline.get("config") != report.get("config"):
+        print("Warning: the reports were made with different settings")
+    regressions = compare_reports(baseline, report, threshold)
+    for stage, metric, before, after in regressions:
+        print(f"REGRESSION {stage} {metric}: {before} -> {after}")
+    if not regressions:
+        print(f"No regressions beyond {threshold:.0%}")
+    return 1 if regressions else 0
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the drift analyzer on synthetic repositories")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def repo_options(command):
+        command.add_argument("--files", type=int, default=5000)
+        command.add_argument("--fan-out", type=int, default=5, help="imports per TypeScript file")
+        command.add_argument("--rules", type=int, default=10, help="dependency rules")
+        command.add_argument("--patterns", type=int, default=5, help="disallowed API patterns per layer")
+        command.add_argument("--ts-share", type=float, default=0.5, help="fraction of TypeScript files")
+        command.add_argument("--seed", type=int, default=0)
+
+    generate = commands.add_parser("generate", help="write a synthetic repo and its rules")
+    generate.add_argument("directory")
+    repo_options(generate)
+
+    run = commands.add_parser("run", help="benchmark the pipeline on a synthetic repo")
+    repo_options(run)
+    run.add_argument("--repeat", type=int, default=3)
+    run.add_argument("--workers", type=int, default=1, help="parser processes for the timed runs")
+    run.add_argument("--output", help="write the JSON report here")
+    run.add_argument("--compare", help="baseline report to check for regressions")
+    run.add_argument("--threshold", type=float, default=0.1)
+
+    compare = commands.add_parser("compare", help="check a report against a baseline")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--threshold", type=float, default=0.1)
+
+    args = parser.parse_args(argv)
+    if args.command == "compare":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        print_report(current, baseline)
+        return check_regressions(baseline, current, args.threshold)
+
+    config = {"files": args.files, "fan_out": args.fan_out, "rules": args.rules,
+              "patterns": args.patterns, "ts_share": args.ts_share, "seed": args.seed}
+    if args.command == "generate":
+        rules = generate_repo(args.directory, args.files, args.fan_out, args.rules, args.patterns,
+                              args.ts_share, args.seed)
+        with open(os.path.join(args.directory, "architecture.json"), "w") as f:
+            json.dump(rules, f, indent=2)
+        print(f"Wrote {args.files} files and architecture.json to {args.directory}")
+        return 0
+
+    root = tempfile.mkdtemp(prefix="drift-bench-")
+    try:
+        rules = generate_repo(root, args.files, args.fan_out, args.rules, args.patterns, args.ts_share, args.seed)
+        report = measure(root, rules, args.repeat, args.workers)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    report["config"] = dict(config, repeat=args.repeat, workers=args.workers)
+    report["environment"] = {"python": platform.python_version(), "platform": platform.platform(),
+                             "cpus": os.cpu_count()}
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return check_regressions(baseline, report, args.threshold) if baseline else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
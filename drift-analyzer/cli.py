@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Command-line entry point of the drift analyzer, for CI jobs and pre-commit
+hooks
+
+    drift-analyze check                              # the checkout in the current directory
+    drift-analyze check --since origin/main          # only files changed since a ref
+    drift-analyze check --changed-files a.rb b.ts    # only the listed files, against HEAD (pre-commit)
+    drift-analyze watch                              # re-check on every save
+    drift-analyze watch --serve --port 8000          # ... pushed as server-sent events
+    drift-analyze serve --port 8000                  # the HTTP service
+
+`check` analyzes an existing checkout against its architecture.yml, reusing
+the facts of unchanged files from a per-repository cache, prints the
+violations as JSON (or one line each with --format text) and exits with
+status 1 when any of them is new. `watch` loads the checkout into memory
+once and prints, as JSON lines, a snapshot of its violations followed by
+the violations added and removed whenever saved files change them.
+FastAPI and uvicorn are imported by `serve` and `watch --serve` alone, so
+a check starts without them.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+# Add the current directory to Python path so we can import analysis.scan
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import yaml
+
+from analysis.cache import FactCache
+from analysis.gitstore import GitTree, run_git
+from analysis.history import violation_key
+from analysis.scan import analyze_repo
+from analysis.watch import WatchSession
+
+# Rules files looked for in the checkout root, in order, without --rules
+RULES_FILES = ("architecture.yml", "architecture.yaml", "architecture.json")
+
+def default_cache_dir(root: str) -> str:
+    """
+    The per-repository fact cache: inside the git directory when root is in
+    a checkout (at its top or below, as in a monorepo), so it needs no
+    ignore entry, else .drift-cache (skipped by the walk like every dot
+    directory)
+    """
+    try:
+        git_dir = run_git(["rev-parse", "--git-dir"], cwd=root).strip()
+    except (subprocess.CalledProcessError, OSError):
+        return os.path.join(root, ".drift-cache")
+    return os.path.join(root, git_dir, "drift-cache")
+
+def load_rules(root: str, path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Read the rules from path, else from the first of RULES_FILES in root;
+    JSON files load as YAML
+    """
+    if path is None:
+        path = next((os.path.join(root, name) for name in RULES_FILES if os.path.isfile(os.path.join(root, name))), None)
+        if path is None:
+            raise FileNotFoundError(f"No rules file ({', '.join(RULES_FILES)}) in {root}; pass --rules")
+    with open(path, encoding="utf-8") as f:
+        return yaml.safe_load(f) or {}
+
+def changed_since(root: str, ref: str) -> Set[str]:
+    """
+    Paths below root that differ between ref and the working tree, untracked
+    files included, relative to root with os.sep separators
+    """
+    output = run_git(["diff", "--relative", "--name-only", "-z", "--no-renames", ref, "--"], cwd=root)
+    output += run_git(["ls-files", "--others", "--exclude-standard", "-z"], cwd=root)
+    return {path.replace("/", os.sep) for path in output.split("\0") if path}
+
+def head_commit(root: str) -> Optional[str]:
+    """
+    The commit HEAD points at, or None before the first commit or outside
+    a repository
+    """
+    try:
+        return run_git(["rev-parse", "--verify", "--quiet", "HEAD^{commit}"], cwd=root).strip() or None
+    except (subprocess.CalledProcessError, OSError):
+        return None
+
+def relative_paths(root: str, paths: Iterable[str]) -> Set[str]:
+    """
+    paths (relative to the current directory, or absolute) relative to root
+    """
+    return {os.path.relpath(os.path.abspath(path), root) for path in paths}
+
+def check(root: str, rules: Dict[str, Any], changed: Optional[Set[str]] = None, since: Optional[str] = None,
+          cache: Optional[FactCache] = None, workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Analyze the checkout at root and sort its violations into new and
+    existing ones
+
+    The whole checkout is analyzed, since imports, constants and the
+    graph-wide rules reach across files, but with a cache only the files
+    whose content is not cached yet are parsed. With changed, only the
+    violations of those files are reported. With since (a commit), the
+    commit is analyzed from the object store as well, and the violations it
+    already had are existing; otherwise every reported violation is new.
+    root may be a subdirectory of its repository, which is then analyzed
+    on its own at since as well.
+    """
+    result = analyze_repo(root, rules, cache=cache, workers=workers)
+    violations = result["violations"]
+    if changed is not None:
+        violations = [violation for violation in violations if violation.get("node_path") in changed]
+
+    baseline: Dict[str, int] = {}
+    if since is not None:
+        prefix = run_git(["rev-parse", "--show-prefix"], cwd=root).strip()
+        with GitTree(root, since, prefix=prefix) as tree:
+            for violation in analyze_repo(tree, rules, cache=cache, workers=workers)["violations"]:
+                key = violation_key(violation)
+                baseline[key] = baseline.get(key, 0) + 1
+
+    new, existing = [], []
+    for violation in violations:
+        key = violation_key(violation)
+        if baseline.get(key):
+            baseline[key] -= 1
+            existing.append(violation)
+        else:
+            new.append(violation)
+    return {"new": new, "existing": existing, "metrics": result["metrics"]}
+
+def format_violation(violation: Dict[str, Any]) -> str:
+    location = violation["node_path"]
+    if violation.get("line_number"):
+        location += f":{violation['line_number']}"
+    return f"{location}: {violation['rule_code']} ({violation['severity']}) {violation['details']}"
+
+def print_text(report: Dict[str, Any]) -> None:
+    for violation in report["new"]:
+        print(format_violation(violation))
+    print(f"{len(report['new'])} new, {len(report['existing'])} existing violations", file=sys.stderr)
+
+def print_record(record: Dict[str, Any], text: bool) -> None:
+    """
+    Print one watch record: a JSON line, or with text one line per
+    violation, marked + when added and - when removed
+    """
+    if not text:
+        print(json.dumps(record, ensure_ascii=False), flush=True)
+        return
+    if record["type"] == "snapshot":
+        lines = [format_violation(violation) for violation in record["violations"]]
+    else:
+        lines = ([f"+ {format_violation(violation)}" for violation in record["added"]] +
+                 [f"- {format_violation(violation)}" for violation in record["removed"]])
+    for line in lines:
+        print(line)
+    print(f"{record['metrics']['counts']['violations']} violations", file=sys.stderr, flush=True)
+
+def watch(session: WatchSession, text: bool = False) -> int:
+    """
+    Print the snapshot and then every update of a started session until
+    interrupted
+    """
+    printed = threading.Event()
+
+    def on_update(update):
+        # Updates start on the watcher thread; the snapshot goes out first
+        printed.wait()
+        print_record(update, text)
+
+    snapshot, unsubscribe = session.subscribe(on_update)
+    print_record(snapshot, text)
+    printed.set()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        unsubscribe()
+        session.close()
+    return 0
+
+def serve(host: str, port: int, session: Optional[WatchSession] = None) -> int:
+    import uvicorn
+
+    import main as server
+    if session is not None:
+        server.set_watch_session(session)
+    uvicorn.run(server.app, host=host, port=port)
+    return 0
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="drift-analyze", description="Check a repository for architecture drift")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    check_command = commands.add_parser("check", help="analyze a checkout and fail on new violations")
+    check_command.add_argument("root", nargs="?", default=".", help="checkout to analyze (default: .)")
+    check_command.add_argument("--rules", help=f"rules file (default: the first of {', '.join(RULES_FILES)} in root)")
+    scope = check_command.add_mutually_exclusive_group()
+    scope.add_argument("--changed-files", nargs="*", metavar="PATH",
+                       help="report only these files' violations, and only those HEAD did not have")
+    scope.add_argument("--since", metavar="REF", help="report only files changed since REF, and only violations REF did not have")
+    check_command.add_argument("--format", choices=("json", "text"), default="json")
+    check_command.add_argument("--cache-dir", help="fact cache directory (default: .git/drift-cache)")
+    check_command.add_argument("--no-cache", action="store_true", help="parse every file")
+    check_command.add_argument("--workers", type=int, help="parser processes (default: DRIFT_PARSE_WORKERS or CPU count)")
+
+    watch_command = commands.add_parser("watch", help="keep a checkout's violations up to date as files are saved")
+    watch_command.add_argument("root", nargs="?", default=".", help="checkout to watch (default: .)")
+    watch_command.add_argument("--rules", help=f"rules file (default: the first of {', '.join(RULES_FILES)} in root)")
+    watch_command.add_argument("--format", choices=("json", "text"), default="json")
+    watch_command.add_argument("--cache-dir", help="fact cache directory (default: .git/drift-cache)")
+    watch_command.add_argument("--no-cache", action="store_true", help="parse every file")
+    watch_command.add_argument("--workers", type=int, help="parser processes for the first load")
+    watch_command.add_argument("--serve", action="store_true", help="push updates from GET /watch/events instead")
+
+    serve_command = commands.add_parser("serve", help="run the HTTP analyzer service")
+    for command in (watch_command, serve_command):
+        command.add_argument("--host", default="127.0.0.1")
+        command.add_argument("--port", type=int, default=8000)
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        return serve(args.host, args.port)
+
+    root = os.path.abspath(args.root)
+    try:
+        rules = load_rules(root, args.rules)
+        cache = None if args.no_cache else FactCache(os.path.join(args.cache_dir or default_cache_dir(root),
+                                                                  "facts.sqlite3"))
+        if args.command == "watch":
+            session = WatchSession(root, rules, cache)
+            session.start(args.workers)
+            return serve(args.host, args.port, session) if args.serve else watch(session, args.format == "text")
+        changed = None
+        since = None
+        if args.changed_files is not None:
+            # Like --since HEAD: what HEAD already had is not new
+            changed = relative_paths(root, args.changed_files)
+            since = head_commit(root)
+        elif args.since:
+            since = run_git(["rev-parse", "--verify", f"{args.since}^{{commit}}"], cwd=root).strip()
+            changed = changed_since(root, since)
+        report = check(root, rules, changed, since, cache, args.workers)
+    except subprocess.CalledProcessError as e:
+        print(f"drift-analyze: git failed: {e.stderr.strip()}", file=sys.stderr)
+        return 2
+    except (OSError, yaml.YAMLError) as e:
+        print(f"drift-analyze: {e}", file=sys.stderr)
+        return 2
+
+    if args.format == "text":
+        print_text(report)
+    else:
+        json.dump(report, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+    return 1 if report["new"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,41 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-import tempfile
+from pydantic import BaseModel, Field, model_validator
+from typing import Literal
+import asyncio
 import subprocess
 import os
 import json
-import shutil
-from analysis.scan import analyze_repo
+import logging
+import time
+from contextlib import asynccontextmanager
+from analysis.gitstore import HostLimiter
+from analysis.jobs import JobManager, QueueFullError
+from analysis.runner import (collect_shard_async, range_max_commits, run_analysis, run_analysis_async,
+                             run_range_analysis, run_range_analysis_async, shutdown_scan_executor,
+                             stream_analysis_async)
+from analysis.telemetry import REGISTRY
+from analysis.watch import WatchSession
 
-app = FastAPI(title="Drift Analyzer", version="1.0.0")
+logging.basicConfig(level=os.environ.get("DRIFT_LOG_LEVEL", "INFO"),
+                    format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger("drift-analyzer")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Stop the job workers, the watch session and the scan processes when
+    the server shuts down
+    """
+    yield
+    if _job_manager is not None:
+        _job_manager.shutdown()
+    if _watch_session is not None:
+        _watch_session.close()
+    shutdown_scan_executor()
+
+app = FastAPI(title="Drift Analyzer", version="1.0.0", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -24,49 +51,289 @@ class GitSpec(BaseModel):
     ref: str
     token: str | None = None
 
+class ViewSpec(BaseModel):
+    # For format "directories": directory levels shown below prefix, and
+    # the page of groups to return
+    depth: int = Field(default=1, ge=1)
+    prefix: str = ""
+    offset: int = Field(default=0, ge=0)
+    limit: int | None = Field(default=None, ge=1)
+
 class AnalyzeReq(BaseModel):
     rules: dict
     git: GitSpec
-    mode: str = "full"
+    # "incremental" reuses cached per-file results for unchanged blobs
+    mode: Literal["full", "incremental"] = "full"
+    # Parser processes for large repos; defaults to DRIFT_PARSE_WORKERS or the CPU count
+    workers: int | None = Field(default=None, ge=1)
+    # Send results as NDJSON records while the scan runs (POST /analyze only)
+    stream: bool = False
+    # "compact" returns columns of string-table indexes instead of records
+    # (see analysis.payload); "layers" and "directories" return aggregated
+    # graphs (see analysis.aggregate); ignored when streaming
+    format: Literal["records", "compact", "layers", "directories"] = "records"
+    view: ViewSpec = Field(default_factory=ViewSpec)
+    # Split the parse across this many shards, collected by the peers in
+    # DRIFT_PEERS or by local processes; defaults to one per peer
+    shards: int | None = Field(default=None, ge=1)
+    shard_by: Literal["hash", "prefix"] = "hash"
+
+class ShardReq(BaseModel):
+    # One shard of a coordinator's scan; git.ref is the commit SHA
+    rules: dict
+    git: GitSpec
+    paths: list[str]
+    mode: Literal["full", "incremental"] = "full"
+
+class RepoSpec(BaseModel):
+    repo_url: str
+    token: str | None = None
+
+class AnalyzeRangeReq(BaseModel):
+    rules: dict
+    git: RepoSpec
+    base: str
+    # Either explicit commits, in order, or every first-parent commit after base up to head
+    commits: list[str] | None = Field(default=None, max_length=range_max_commits())
+    head: str | None = None
+    workers: int | None = Field(default=None, ge=1)
+
+    @model_validator(mode="after")
+    def check_commits(self):
+        if (self.commits is None) == (self.head is None):
+            raise ValueError("Give exactly one of commits and head")
+        return self
+
+# Encoded records are flushed in chunks of about this many bytes
+NDJSON_CHUNK_BYTES = 64 * 1024
+
+_job_manager = None
+
+# Caps concurrent fetches per remote host for requests served on the event loop
+_git_limiter = HostLimiter()
+
+# Seconds between comment lines that keep an idle event stream open
+WATCH_KEEPALIVE_SECONDS = 15
+
+# The working tree served by /watch/events (see `drift-analyze watch --serve`)
+_watch_session = None
+
+def set_watch_session(session: WatchSession) -> None:
+    """
+    Serve the updates of a started WatchSession at /watch/events
+    """
+    global _watch_session
+    _watch_session = session
+
+def get_job_manager() -> JobManager:
+    """
+    Start the analysis worker pool on first use
+    """
+    global _job_manager
+    if _job_manager is None:
+        _job_manager = JobManager(on_result=observe_result)
+    return _job_manager
+
+def observe_result(result):
+    """
+    Add a finished analysis's timings and counters to /metrics
+    """
+    if isinstance(result, dict) and isinstance(result.get("metrics"), dict):
+        REGISTRY.observe(result["metrics"])
+
+# Handlers are async so cheap endpoints answer straight from the event loop;
+# git runs as asyncio subprocesses and scans in the scan process pool
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Drift Analyzer API", "version": "1.0.0"}
 
 @app.get("/health")
-def health_check():
+async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Stage latency histograms and counters in Prometheus text format
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 @app.post("/analyze")
-def analyze(req: AnalyzeReq):
+async def analyze(req: AnalyzeReq):
     """
     Analyze a repository for architecture drift violations
     """
+    start = time.perf_counter()
     try:
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # Clone the repository
-            clone_cmd = ["git", "clone", "--depth", "1", req.git.repo_url, temp_dir]
-            if req.git.token:
-                # Handle private repos with token
-                repo_url = req.git.repo_url.replace("https://", f"https://{req.git.token}@")
-                clone_cmd = ["git", "clone", "--depth", "1", repo_url, temp_dir]
-            
-            result = subprocess.run(clone_cmd, capture_output=True, text=True, check=True)
-            
-            # Checkout specific ref
-            checkout_cmd = ["git", "checkout", req.git.ref]
-            result = subprocess.run(checkout_cmd, cwd=temp_dir, capture_output=True, text=True, check=True)
-            
-            # Analyze the repository
-            analysis_result = analyze_repo(temp_dir, req.rules)
-            
-            return analysis_result
-            
+        if req.stream:
+            records = await stream_analysis_async(req.git.repo_url, req.git.ref, req.rules, token=req.git.token,
+                                                  mode=req.mode, workers=req.workers, limiter=_git_limiter)
+            REGISTRY.count_request("analyze", "streamed")
+            return StreamingResponse(iter_ndjson(observe_records(records)), media_type="application/x-ndjson")
+        result = await run_analysis_async(req.git.repo_url, req.git.ref, req.rules, token=req.git.token,
+                                          mode=req.mode, workers=req.workers, result_format=req.format,
+                                          limiter=_git_limiter, view=req.view.model_dump(),
+                                          shards=req.shards, shard_by=req.shard_by)
     except subprocess.CalledProcessError as e:
+        REGISTRY.count_request("analyze", "git_error")
+        logger.warning("Git operation failed for %s@%s: %s", req.git.repo_url, req.git.ref, e.stderr)
         raise HTTPException(status_code=400, detail=f"Git operation failed: {e.stderr}")
     except Exception as e:
+        REGISTRY.count_request("analyze", "error")
+        logger.exception("Analysis of %s@%s failed", req.git.repo_url, req.git.ref)
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
+    REGISTRY.count_request("analyze", "ok")
+    observe_result(result)
+    logger.info("Analyzed %s@%s in %.2fs", req.git.repo_url, req.git.ref, time.perf_counter() - start)
+    return result
+
+@app.post("/shards/collect")
+async def collect_shard(req: ShardReq):
+    """
+    Parse one shard of files for a coordinating analyzer
+    """
+    try:
+        facts = await collect_shard_async(req.git.repo_url, req.git.ref, req.rules, req.paths,
+                                          token=req.git.token, mode=req.mode, limiter=_git_limiter)
+    except subprocess.CalledProcessError as e:
+        REGISTRY.count_request("shards_collect", "git_error")
+        raise HTTPException(status_code=400, detail=f"Git operation failed: {e.stderr}")
+    except Exception as e:
+        REGISTRY.count_request("shards_collect", "error")
+        logger.exception("Shard of %s@%s failed", req.git.repo_url, req.git.ref)
+        raise HTTPException(status_code=500, detail=f"Shard collection failed: {str(e)}")
+    REGISTRY.count_request("shards_collect", "ok")
+    return facts
+
+def observe_records(records):
+    """
+    Pass streamed records through, recording the final metrics record
+    """
+    for record in records:
+        if record.get("type") == "metrics":
+            REGISTRY.observe(record)
+        yield record
+
+@app.post("/analyze/range")
+async def analyze_range(req: AnalyzeRangeReq):
+    """
+    Analyze a base commit, then each later commit incrementally
+    """
+    try:
+        result = await run_range_analysis_async(req.git.repo_url, req.base, req.rules, commits=req.commits,
+                                                head=req.head, token=req.git.token, workers=req.workers,
+                                                limiter=_git_limiter)
+    except subprocess.CalledProcessError as e:
+        REGISTRY.count_request("analyze_range", "git_error")
+        raise HTTPException(status_code=400, detail=f"Git operation failed: {e.stderr}")
+    except ValueError as e:
+        REGISTRY.count_request("analyze_range", "rejected")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        REGISTRY.count_request("analyze_range", "error")
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+    REGISTRY.count_request("analyze_range", "ok")
+    return result
+
+def iter_ndjson(records):
+    """
+    Encode records as newline-delimited JSON, batching small records
+    """
+    buffer = []
+    size = 0
+    for record in records:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        buffer.append(line)
+        size += len(line)
+        if size >= NDJSON_CHUNK_BYTES:
+            yield "".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield "".join(buffer)
+
+@app.post("/jobs", status_code=202)
+async def submit_job(req: AnalyzeReq):
+    """
+    Queue an analysis and return its job id without waiting for the result
+    """
+    try:
+        job = get_job_manager().submit(run_analysis, repo_url=req.git.repo_url, ref=req.git.ref,
+                                       rules=req.rules, token=req.git.token, mode=req.mode,
+                                       workers=req.workers, result_format=req.format,
+                                       view=req.view.model_dump(), shards=req.shards, shard_by=req.shard_by)
+    except QueueFullError as e:
+        REGISTRY.count_request("jobs", "queue_full")
+        raise HTTPException(status_code=429, detail=str(e))
+    REGISTRY.count_request("jobs", "queued")
+    return job
+
+@app.post("/jobs/range", status_code=202)
+async def submit_range_job(req: AnalyzeRangeReq):
+    """
+    Queue a commit-range analysis (same body as /analyze/range)
+    """
+    try:
+        job = get_job_manager().submit(run_range_analysis, repo_url=req.git.repo_url, base=req.base,
+                                       rules=req.rules, commits=req.commits, head=req.head,
+                                       token=req.git.token, workers=req.workers)
+    except QueueFullError as e:
+        REGISTRY.count_request("jobs_range", "queue_full")
+        raise HTTPException(status_code=429, detail=str(e))
+    REGISTRY.count_request("jobs_range", "queued")
+    return job
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Report a job's status, with the analysis result once it has succeeded
+    """
+    job = get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """
+    Cancel a queued or running job
+    """
+    job = get_job_manager().cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job
+
+@app.get("/watch/events")
+async def watch_events():
+    """
+    Server-sent events for the watched working tree: a "snapshot" of every
+    violation, then an "update" with the violations added and removed each
+    time saved files change the analysis
+    """
+    session = _watch_session
+    if session is None:
+        raise HTTPException(status_code=404, detail="Not watching a working tree; start with drift-analyze watch --serve")
+    loop = asyncio.get_running_loop()
+    updates = asyncio.Queue()
+    snapshot, unsubscribe = session.subscribe(lambda update: loop.call_soon_threadsafe(updates.put_nowait, update))
+
+    async def events():
+        try:
+            yield f"event: snapshot\ndata: {json.dumps(snapshot, ensure_ascii=False)}\n\n"
+            while True:
+                try:
+                    update = await asyncio.wait_for(updates.get(), WATCH_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: update\ndata: {json.dumps(update, ensure_ascii=False)}\n\n"
+        finally:
+            unsubscribe()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Tests for the aggregated layer and directory views
+Run with pytest, or directly as a script
+"""
+
+import shutil
+
+from analysis.aggregate import aggregate_result
+from analysis.scan import analyze_repo
+from test_analyzer import create_mock_repo
+from test_scan import RULES, write_file
+
+def test_layer_view_counts_edges_and_violations():
+    repo = create_mock_repo()
+    try:
+        rules = dict(RULES, forbidden_dependencies=[{"from": "controllers", "to": "repositories"}])
+        result = analyze_repo(repo, rules)
+        view = aggregate_result(result, rules, "layers")
+
+        assert [node["id"] for node in view["nodes"]] == [
+            "controllers", "services", "repositories", "frontend", "DATABASE", "EXTERNAL"]
+        assert sum(edge["count"] for edge in view["edges"]) + sum(
+            node["internal_edges"] for node in view["nodes"]) == len(result["edges"])
+        assert sum(node["violations"] for node in view["nodes"]) == len(result["violations"])
+        forbidden = next(e for e in view["edges"] if (e["from"], e["to"]) == ("controllers", "repositories"))
+        assert forbidden["violations"] == forbidden["count"] == 1
+        assert forbidden["edge_types"] == {"constant": 1}
+    finally:
+        shutil.rmtree(repo, ignore_errors=True)
+
+def test_directory_view_drills_down_and_pages():
+    repo = create_mock_repo()
+    try:
+        write_file(repo, "app/controllers/admin/audit_controller.rb", "class AuditController\n  UserService\nend\n")
+        result = analyze_repo(repo, RULES)
+
+        top = aggregate_result(result, RULES, "directories")
+        assert [node["id"] for node in top["nodes"]] == ["app", "frontend", "DATABASE", "EXTERNAL"]
+        assert top["next_offset"] is None
+
+        drilled = aggregate_result(result, RULES, "directories", depth=1, prefix="app/controllers/")
+        by_id = {node["id"]: node for node in drilled["nodes"]}
+        assert by_id["app/controllers/admin"]["leaf"] is False
+        assert by_id["app/controllers/users_controller.rb"]["leaf"] is True
+        assert {"from": "app/controllers/admin", "to": "app/services", "count": 1, "violations": 0,
+                "edge_types": {"constant": 1}} in drilled["edges"]
+
+        # Pages together hold every edge of the unpaged view exactly once
+        edges = []
+        offset = 0
+        while offset is not None:
+            page = aggregate_result(result, RULES, "directories", prefix="app", offset=offset, limit=2)
+            assert len(page["nodes"]) <= 2
+            edges.extend(page["edges"])
+            offset = page["next_offset"]
+        full = aggregate_result(result, RULES, "directories", prefix="app")
+        assert sorted(map(str, edges)) == sorted(map(str, full["edges"]))
+    finally:
+        shutil.rmtree(repo, ignore_errors=True)
+
+if __name__ == "__main__":
+    test_layer_view_counts_edges_and_violations()
+    test_directory_view_drills_down_and_pages()
+    print("All aggregate tests passed")
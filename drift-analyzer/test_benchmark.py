@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Tests for the benchmark harness and synthetic repo generator
+Run with pytest, or directly as a script
+"""
+
+import copy
+import shutil
+import tempfile
+
+from analysis.scan import analyze_repo
+from benchmark import STAGES, compare_reports, generate_repo, measure
+
+def test_stages_reproduce_analyze_repo():
+    root = tempfile.mkdtemp(prefix="drift-bench-")
+    try:
+        rules = generate_repo(root, files=200, fan_out=4, rule_count=6, pattern_count=3, seed=7)
+        report = measure(root, rules, repeat=1)
+        result = analyze_repo(root, rules)
+
+        assert report["counts"] == result["metrics"]["counts"]
+        assert report["counts"]["nodes"] == 200
+        assert {"FORBIDDEN_DEP", "DISALLOWED_API"} <= {v["rule_code"] for v in result["violations"]}
+        assert set(report["stages"]) == set(STAGES)
+        assert all(numbers["peak_bytes"] > 0 for numbers in report["stages"].values())
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def test_compare_flags_slower_and_bigger_stages():
+    baseline = {"stages": {
+        "parse": {"seconds": 1.0, "peak_bytes": 1000},
+        "walk": {"seconds": 0.001, "peak_bytes": 100},
+    }}
+    current = copy.deepcopy(baseline)
+    current["stages"]["parse"]["seconds"] = 1.05
+    assert compare_reports(baseline, current) == []
+
+    current["stages"]["parse"]["seconds"] = 1.5
+    current["stages"]["walk"] = {"seconds": 0.002, "peak_bytes": 200}
+    # walk doubled in time but is below the noise floor; its memory still counts
+    assert compare_reports(baseline, current) == [
+        ("parse", "seconds", 1.0, 1.5),
+        ("walk", "peak_bytes", 100, 200),
+    ]
+
+if __name__ == "__main__":
+    test_stages_reproduce_analyze_repo()
+    test_compare_flags_slower_and_bigger_stages()
+    print("All benchmark tests passed")
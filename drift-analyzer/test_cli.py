@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Tests for the drift-analyze command line
+Run with pytest, or directly as a script
+"""
+
+import contextlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import yaml
+
+from analysis.scan import analyze_repo
+from cli import main
+from test_analyzer import create_mock_repo
+from test_gitstore import git
+from test_scan import RULES, write_file
+
+def run(*args):
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output), contextlib.redirect_stderr(io.StringIO()):
+        status = main(list(args))
+    return status, output.getvalue()
+
+def test_check_reports_new_violations():
+    repo = create_mock_repo()
+    try:
+        with open(os.path.join(repo, "architecture.yml"), "w") as f:
+            yaml.safe_dump(RULES, f)
+        git(repo, "init", "--quiet", "--initial-branch=main")
+        git(repo, "add", "-A")
+        git(repo, "commit", "--quiet", "-m", "mock")
+
+        expected = analyze_repo(repo, RULES)["violations"]
+        status, output = run("check", repo)
+        report = json.loads(output)
+        assert status == 1 and report["new"] == expected and report["existing"] == []
+        # The facts were cached inside .git; a second run parses nothing
+        assert report["metrics"]["cache"]["misses"] == 5
+        assert json.loads(run("check", repo)[1])["metrics"]["cache"]["misses"] == 0
+
+        # Nothing changed since HEAD, so nothing is reported
+        status, output = run("check", repo, "--since", "HEAD")
+        assert status == 0 and json.loads(output)["new"] == []
+
+        # Shifted lines keep old violations old; a new controller's are new
+        controller = os.path.join(repo, "app", "controllers", "users_controller.rb")
+        with open(controller) as f:
+            content = f.read()
+        write_file(repo, "app/controllers/users_controller.rb", "# Users\n" + content)
+        write_file(repo, "app/controllers/admin_controller.rb", "class AdminController\n  def show\n    User.find(1)\n  end\nend\n")
+        status, output = run("check", repo, "--since", "HEAD")
+        report = json.loads(output)
+        assert status == 1
+        assert [v["node_path"] for v in report["new"]] == [os.path.join("app", "controllers", "admin_controller.rb")]
+        assert len(report["existing"]) == len(expected)
+
+        status, output = run("check", repo, "--changed-files", os.path.join(repo, "app", "services", "user_service.rb"),
+                             "--format", "text")
+        assert (status, output) == (0, "")
+        # --changed-files compares with HEAD, as --since HEAD does
+        status, output = run("check", repo, "--changed-files", controller)
+        report = json.loads(output)
+        assert status == 0 and report["new"] == [] and len(report["existing"]) == len(expected)
+        admin = os.path.join(repo, "app", "controllers", "admin_controller.rb")
+        status, output = run("check", repo, "--changed-files", controller, admin, "--format", "text")
+        assert status == 1
+        assert output.splitlines()[0].startswith(os.path.join("app", "controllers", "admin_controller.rb") + ":")
+
+        # Before the first commit every violation is new
+        shutil.rmtree(os.path.join(repo, ".git"))
+        git(repo, "init", "--quiet", "--initial-branch=main")
+        status, output = run("check", repo, "--changed-files", controller)
+        assert status == 1 and len(json.loads(output)["new"]) == len(expected)
+    finally:
+        shutil.rmtree(repo, ignore_errors=True)
+
+def test_check_in_monorepo_subdirectory():
+    top = tempfile.mkdtemp(prefix="drift-monorepo-")
+    service = os.path.join(top, "svc")
+    rules = dict(RULES, forbidden_dependencies=[{"from": "services", "to": "controllers"}])
+    try:
+        shutil.move(create_mock_repo(), service)
+        with open(os.path.join(service, "architecture.yml"), "w") as f:
+            yaml.safe_dump(rules, f)
+        write_file(top, "other/app/controllers/other_controller.rb", "class OtherController; User.find(1); end\n")
+        git(top, "init", "--quiet", "--initial-branch=main")
+        git(top, "add", "-A")
+        git(top, "commit", "--quiet", "-m", "mock")
+
+        status, output = run("check", service, "--since", "HEAD")
+        assert status == 0 and json.loads(output)["new"] == []
+        # The cache goes to the repository's git directory, not into svc
+        assert os.path.isdir(os.path.join(top, ".git", "drift-cache"))
+        assert not os.path.exists(os.path.join(service, ".drift-cache"))
+
+        # A tracked file gains a forbidden dependency
+        write_file(service, "app/services/user_service.rb", "class UserService\n  def x; UsersController; end\nend\n")
+        write_file(top, "other/app/controllers/more_controller.rb", "class MoreController; User.find(1); end\n")
+        status, output = run("check", service, "--since", "HEAD")
+        report = json.loads(output)
+        assert status == 1
+        assert [(v["rule_code"], v["node_path"]) for v in report["new"]] == \
+            [("FORBIDDEN_DEP", os.path.join("app", "services", "user_service.rb"))]
+        # The same file passed with --changed-files is reported alike
+        status, output = run("check", service, "--changed-files", os.path.join(service, "app", "services", "user_service.rb"))
+        assert status == 1 and json.loads(output)["new"] == report["new"]
+    finally:
+        shutil.rmtree(top, ignore_errors=True)
+
+def test_check_does_not_import_the_server():
+    code = "import sys, cli; assert not {'fastapi', 'uvicorn', 'main'} & set(sys.modules)"
+    subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+
+if __name__ == "__main__":
+    test_check_reports_new_violations()
+    test_check_in_monorepo_subdirectory()
+    test_check_does_not_import_the_server()
+    print("All CLI tests passed")
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Tests for the bare-mirror git store, using local repositories as remotes
+Run with pytest, or directly as a script
+"""
+
+import asyncio
+import os
+import shutil
+import subprocess
+import tempfile
+
+from analysis.cache import FactCache
+from analysis.gitstore import HostLimiter, MirrorStore, remote_host
+from analysis.scan import analyze_repo
+from test_analyzer import create_mock_repo
+from test_scan import RULES
+
+def git(cwd, *args):
+    return subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com"] + list(args),
+                          cwd=cwd, capture_output=True, text=True, check=True).stdout.strip()
+
+def create_remote(base):
+    remote = os.path.join(base, "remote")
+    os.makedirs(os.path.join(remote, "app"))
+    git(remote, "init", "--quiet", "--initial-branch=main")
+    with open(os.path.join(remote, "app", "first.rb"), "w") as f:
+        f.write("class First; end\n")
+    git(remote, "add", "-A")
+    git(remote, "commit", "--quiet", "-m", "first")
+    first_sha = git(remote, "rev-parse", "HEAD")
+    with open(os.path.join(remote, "app", "second.rb"), "w") as f:
+        f.write("class Second; end\n")
+    git(remote, "add", "-A")
+    git(remote, "commit", "--quiet", "-m", "second")
+    return remote, first_sha
+
+def test_tree_non_tip_commit_and_branch():
+    base = tempfile.mkdtemp(prefix="drift-gitstore-")
+    try:
+        remote, first_sha = create_remote(base)
+        store = MirrorStore(os.path.join(base, "mirrors"))
+
+        with store.tree(remote, first_sha) as tree:
+            assert tree.commit == first_sha
+            assert sorted(tree.blobs) == ["app/first.rb"]
+
+        with store.tree(remote, "main") as tree:
+            assert sorted(tree.blobs) == ["app/first.rb", "app/second.rb"]
+
+            # A concurrent reader gets its own lease on the mirror
+            with store.tree(remote, first_sha) as other:
+                assert sorted(other.blobs) == ["app/first.rb"]
+            assert len(store._lease_locks(store._entry_dir(remote))) == 2
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+def test_evicts_least_recently_used_mirror():
+    base = tempfile.mkdtemp(prefix="drift-gitstore-")
+    try:
+        remote, _ = create_remote(base)
+        other_remote = os.path.join(base, "other")
+        shutil.copytree(remote, other_remote)
+        store = MirrorStore(os.path.join(base, "mirrors"), max_bytes=0)
+
+        with store.tree(remote, "main"):
+            pass
+        with store.tree(other_remote, "main"):
+            pass
+
+        # Only the most recently used mirror survives a zero-byte budget
+        assert os.listdir(store.root) == [os.path.basename(store._entry_dir(other_remote))]
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+def test_tree_analysis_matches_working_copy():
+    base = tempfile.mkdtemp(prefix="drift-gitstore-")
+    repo = create_mock_repo()
+    try:
+        with open(os.path.join(repo, "assets.bin"), "wb") as f:
+            f.write(os.urandom(4096))
+        git(repo, "init", "--quiet", "--initial-branch=main")
+        git(repo, "add", "-A")
+        git(repo, "commit", "--quiet", "-m", "mock")
+        store = MirrorStore(os.path.join(base, "mirrors"))
+
+        expected = analyze_repo(repo, RULES)
+        with store.tree(repo, "main") as tree:
+            assert "assets.bin" not in tree.blobs
+            assert analyze_repo(tree, RULES) == expected
+            # Incremental mode keys the fact cache by the listed blob SHAs
+            cache = FactCache(os.path.join(base, "facts.sqlite3"))
+            analyze_repo(tree, RULES, cache=cache)
+            assert analyze_repo(tree, RULES, cache=cache)["metrics"]["cache"]["misses"] == 0
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+        shutil.rmtree(repo, ignore_errors=True)
+
+def test_async_fetch_with_host_limit():
+    base = tempfile.mkdtemp(prefix="drift-gitstore-")
+    try:
+        remote, first_sha = create_remote(base)
+        store = MirrorStore(os.path.join(base, "mirrors"))
+        limiter = HostLimiter(limit=1)
+
+        async def fetch_all():
+            return await asyncio.gather(*(store.fetch_async(remote, ref, limiter=limiter)
+                                          for ref in ("main", first_sha, "main")))
+
+        main_sha, first, again = asyncio.run(fetch_all())
+        assert first == first_sha and again == main_sha == git(remote, "rev-parse", "HEAD")
+        assert store.fetch(remote, "main") == main_sha
+        assert remote_host("git@github.com:org/repo.git") == remote_host("https://GitHub.com/org/repo") == "github.com"
+        assert remote_host(remote) == ""
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+def test_known_commit_still_checks_access():
+    base = tempfile.mkdtemp(prefix="drift-gitstore-")
+    old_ttl = os.environ.get("DRIFT_ACCESS_TTL")
+    try:
+        remote, first_sha = create_remote(base)
+        store = MirrorStore(os.path.join(base, "mirrors"))
+        store.fetch(remote, "main")
+
+        # The commit is in the mirror and the caller just reached the remote
+        moved = remote + "-moved"
+        os.rename(remote, moved)
+        assert store.fetch(remote, first_sha) == first_sha
+        # Once that has expired, the remote is asked again
+        os.environ["DRIFT_ACCESS_TTL"] = "0"
+        try:
+            store.fetch(remote, first_sha)
+            raise AssertionError("served a mirrored commit without reaching the remote")
+        except subprocess.CalledProcessError:
+            pass
+        os.rename(moved, remote)
+        assert store.fetch(remote, first_sha) == first_sha
+    finally:
+        if old_ttl is None:
+            os.environ.pop("DRIFT_ACCESS_TTL", None)
+        else:
+            os.environ["DRIFT_ACCESS_TTL"] = old_ttl
+        shutil.rmtree(base, ignore_errors=True)
+
+if __name__ == "__main__":
+    test_tree_non_tip_commit_and_branch()
+    test_evicts_least_recently_used_mirror()
+    test_tree_analysis_matches_working_copy()
+    test_async_fetch_with_host_limit()
+    test_known_commit_still_checks_access()
+    print("All git store tests passed")
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Tests for walking a commit range incrementally
+Run with pytest, or directly as a script
+"""
+
+import os
+import shutil
+import tempfile
+from collections import Counter
+
+from analysis.gitstore import BlobReader, rev_list
+from analysis.history import HistoryWalker, violation_key
+from analysis.runner import run_range_analysis
+from analysis.scan import analyze_repo
+from test_gitstore import git
+from test_scan import write_file
+
+RULES = {
+    "layers": [
+        {"name": "controllers", "patterns": ["app/controllers/*.rb"]},
+        {"name": "models", "patterns": ["app/models/*.rb"]},
+        {"name": "components", "patterns": ["frontend/components/*.tsx"]},
+        {"name": "services", "patterns": ["frontend/services/*.ts"]},
+        {"name": "api", "patterns": ["frontend/api/*.ts"]},
+    ],
+    "forbidden_dependencies": [{"from": "components", "to": "api"}, {"from": "controllers", "to": "models"}],
+    "must_route_via": [{"from": "components", "to": "api", "via": "services", "transitive": True}],
+    "disallowed_apis": [{"layer": "controllers", "patterns": ["\\.where\\("]}],
+    "no_layer_cycles": True,
+}
+
+# Each commit writes (path, content) pairs; None deletes the file
+COMMITS = [
+    {
+        "app/controllers/users_controller.rb": "class UsersController\n  def index; User.all; end\nend\n",
+        "app/models/user.rb": "class User; end\n",
+        "frontend/components/List.tsx": "import { load } from '../services/users'\n",
+        "frontend/services/users.ts": "import { get } from '../api/client'\nexport const load = get\n",
+        "frontend/api/client.ts": "export const get = () => null\n",
+    },
+    {
+        # A disallowed API call and a direct component → api import
+        "app/controllers/users_controller.rb": "class UsersController\n  def index; User.where(a: 1); end\nend\n",
+        "frontend/components/Form.tsx": "import { get } from '@api/client'\n",
+    },
+    {
+        # The alias starts resolving, so Form.tsx gains an edge without changing
+        "tsconfig.json": '{"compilerOptions": {"baseUrl": ".", "paths": {"@api/*": ["frontend/api/*"]}}}',
+    },
+    {
+        # Only moves the disallowed API call down a line
+        "app/controllers/users_controller.rb": "# Users\nclass UsersController\n  def index; User.where(a: 1); end\nend\n",
+    },
+    {
+        # api depends back on services: a layer cycle
+        "frontend/api/client.ts": "import { load } from '../services/users'\nexport const get = () => load\n",
+        "frontend/components/List.tsx": None,
+        "README.md": "notes\n",
+        # The controller's reference to User stops resolving without it changing
+        "app/models/user.rb": None,
+    },
+    {
+        "app/controllers/users_controller.rb": "class UsersController\n  def index; User.all; end\nend\n",
+        "frontend/api/client.ts": "export const get = () => null\n",
+        "app/models/account.rb": "class Account\n  class User; end\nend\n",
+        "app/models/user.rb": "class User; end\n",
+    },
+]
+
+def violation_keys(violations):
+    return Counter(map(violation_key, violations))
+
+def test_walk_matches_full_analysis_of_every_commit():
+    base = tempfile.mkdtemp(prefix="drift-history-")
+    try:
+        repo = os.path.join(base, "repo")
+        os.makedirs(repo)
+        git(repo, "init", "--quiet", "--initial-branch=main")
+        shas = []
+        for files in COMMITS:
+            for path, content in files.items():
+                if content is None:
+                    os.remove(os.path.join(repo, path))
+                else:
+                    write_file(repo, path, content)
+            git(repo, "add", "-A")
+            git(repo, "commit", "--quiet", "-m", "change")
+            shas.append(git(repo, "rev-parse", "HEAD"))
+        assert rev_list(repo, shas[0], shas[-1]) == shas[1:]
+
+        with BlobReader(repo) as blobs:
+            walker = HistoryWalker(repo, RULES, None, blobs)
+            loaded = walker.load(shas[0])
+            previous = None
+            codes = set()
+            for i, sha in enumerate(shas):
+                step = walker.advance(sha) if i else None
+                git(repo, "checkout", "--quiet", sha)
+                expected = analyze_repo(repo, RULES)
+                current = violation_keys(expected["violations"])
+
+                assert (step or loaded)["metrics"] == expected["metrics"]
+                if step is not None:
+                    assert violation_keys(step["added"]) == current - previous
+                    assert violation_keys(step["removed"]) == previous - current
+                if i == 3:
+                    assert step["added"] == step["removed"] == []
+                previous = current
+                codes.update(v["rule_code"] for v in expected["violations"])
+        assert codes == {"DISALLOWED_API", "FORBIDDEN_DEP", "BYPASS_LAYER", "LAYER_CYCLE"}
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+def test_overlong_range_is_refused_before_fetching():
+    old_max = os.environ.get("DRIFT_RANGE_MAX_COMMITS")
+    os.environ["DRIFT_RANGE_MAX_COMMITS"] = "2"
+    try:
+        # A fetch from this remote would fail with CalledProcessError
+        try:
+            run_range_analysis("/nonexistent/repo", "main", RULES, commits=["a", "b", "c"])
+            raise AssertionError("expected ValueError")
+        except ValueError as e:
+            assert "3 commits" in str(e)
+    finally:
+        if old_max is None:
+            os.environ.pop("DRIFT_RANGE_MAX_COMMITS", None)
+        else:
+            os.environ["DRIFT_RANGE_MAX_COMMITS"] = old_max
+
+if __name__ == "__main__":
+    test_walk_matches_full_analysis_of_every_commit()
+    test_overlong_range_is_refused_before_fetching()
+    print("All history tests passed")
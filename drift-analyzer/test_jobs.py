@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Tests for the analysis job pool
+Run with pytest, or directly as a script
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from analysis.jobs import JobManager, QueueFullError
+
+def add(a, b):
+    return {"sum": a + b}
+
+def fail():
+    raise ValueError("boom")
+
+def sleep(seconds):
+    time.sleep(seconds)
+    return {}
+
+def spawn_and_sleep(pid_file):
+    # Stands in for the parser pool and git processes a scan starts
+    child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+    with open(pid_file, "w") as f:
+        f.write(str(child.pid))
+    time.sleep(60)
+    return {}
+
+def blob(size):
+    return {"data": "x" * size}
+
+def alive(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().split(")")[-1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+def wait_for(manager, job_id, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = manager.get(job_id)
+        if job["finished_at"] is not None:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish")
+
+def test_job_results_and_failures():
+    manager = JobManager(workers=2, queue_depth=10, timeout=30)
+    try:
+        ok = manager.submit(add, a=1, b=2)
+        bad = manager.submit(fail)
+        assert ok["status"] == "queued"
+
+        assert wait_for(manager, ok["id"])["result"] == {"sum": 3}
+        job = wait_for(manager, bad["id"])
+        assert job["status"] == "failed"
+        assert job["error"] == "Analysis failed: boom"
+        assert manager.get("missing") is None
+    finally:
+        manager.shutdown()
+
+def test_timeout_cancel_and_queue_limit():
+    manager = JobManager(workers=1, queue_depth=1, timeout=1)
+    try:
+        slow = manager.submit(sleep, seconds=10)
+        while manager.get(slow["id"])["status"] == "queued":
+            time.sleep(0.05)
+
+        waiting = manager.submit(add, a=1, b=1)
+        try:
+            manager.submit(add, a=2, b=2)
+            raise AssertionError("queue limit not enforced")
+        except QueueFullError:
+            pass
+
+        assert manager.cancel(waiting["id"])["status"] == "cancelled"
+        assert wait_for(manager, slow["id"])["status"] == "timed_out"
+
+        running = manager.submit(sleep, seconds=10)
+        while manager.get(running["id"])["status"] == "queued":
+            time.sleep(0.05)
+        manager.cancel(running["id"])
+        assert wait_for(manager, running["id"], timeout=5)["status"] == "cancelled"
+    finally:
+        manager.shutdown()
+
+def test_cancel_stops_processes_the_job_started():
+    if not os.path.isdir("/proc") or not hasattr(os, "setsid"):
+        return
+    manager = JobManager(workers=1, queue_depth=1, timeout=30)
+    pid_file = tempfile.mktemp(prefix="drift-job-")
+    try:
+        job = manager.submit(spawn_and_sleep, pid_file=pid_file)
+        deadline = time.time() + 30
+        while not (os.path.exists(pid_file) and os.path.getsize(pid_file)) and time.time() < deadline:
+            time.sleep(0.05)
+        with open(pid_file) as f:
+            pid = int(f.read())
+        assert alive(pid)
+        manager.cancel(job["id"])
+        assert wait_for(manager, job["id"], timeout=5)["status"] == "cancelled"
+        deadline = time.time() + 5
+        while alive(pid) and time.time() < deadline:
+            time.sleep(0.05)
+        assert not alive(pid)
+    finally:
+        manager.shutdown()
+        if os.path.exists(pid_file):
+            os.remove(pid_file)
+
+def test_retention_bounds_result_bytes():
+    manager = JobManager(workers=1, queue_depth=10, timeout=30, retention_bytes=150_000)
+    try:
+        jobs = [manager.submit(blob, size=100_000) for _ in range(3)]
+        # One worker runs them in order
+        wait_for(manager, jobs[-1]["id"])
+        # Older results go once the newer ones pass the byte limit
+        assert manager.get(jobs[0]["id"]) is None and manager.get(jobs[1]["id"]) is None
+        assert manager.get(jobs[2]["id"])["result"] == {"data": "x" * 100_000}
+    finally:
+        manager.shutdown()
+
+if __name__ == "__main__":
+    test_job_results_and_failures()
+    test_timeout_cancel_and_queue_limit()
+    test_cancel_stops_processes_the_job_started()
+    test_retention_bounds_result_bytes()
+    print("All job tests passed")
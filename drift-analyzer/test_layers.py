@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Tests for compiled layer matching
+Run with pytest, or directly as a script
+"""
+
+import fnmatch
+
+from analysis.layers import LayerMatcher, compile_layers
+
+def test_patterns_without_globstar_keep_fnmatch_semantics():
+    paths = ["app/controllers/a.rb", "x/app/controllers/deep/b.rb", "app/models/c.rb",
+             "controllers/d.rb", "lib/e.ts", "app/f.rb"]
+    patterns = ["*/controllers/*.rb", "app/*", "*.rb", "[al]*/*.ts", "a?p/models/c.rb"]
+    for pattern in patterns:
+        matcher = LayerMatcher([{"name": "layer", "patterns": [pattern]}])
+        for path in paths:
+            assert (matcher.match(path) == "layer") == fnmatch.fnmatchcase(path, pattern), (pattern, path)
+
+def test_globstar_and_brace_expansion():
+    matcher = compile_layers([
+        {"name": "controllers", "patterns": ["app/controllers/**/*.rb"]},
+        {"name": "frontend", "patterns": ["**/app/**/*.{ts,tsx}"]},
+        {"name": "everything", "patterns": ["**"]},
+    ])
+    assert matcher.match("app/controllers/users_controller.rb") == "controllers"
+    assert matcher.match("app/controllers/admin/users_controller.rb") == "controllers"
+    assert matcher.match("app/controllers_old/users_controller.rb") == "everything"
+    assert matcher.match("web/app/page.tsx") == "frontend"
+    assert matcher.match("web/app/lib/config.ts") == "frontend"
+    assert matcher.match("web/app/lib/config.js") == "everything"
+    assert matcher.match("app\\controllers\\windows.rb") == "controllers"
+
+def test_first_matching_layer_wins():
+    matcher = LayerMatcher([
+        {"name": "admin", "patterns": ["app/controllers/admin/*.rb"]},
+        {"name": "controllers", "patterns": ["app/controllers/**/*.rb"]},
+    ])
+    assert matcher.match("app/controllers/admin/users_controller.rb") == "admin"
+    assert matcher.match("app/controllers/users_controller.rb") == "controllers"
+    assert LayerMatcher([]).match("app/controllers/users_controller.rb") == "unknown"
+
+if __name__ == "__main__":
+    test_patterns_without_globstar_keep_fnmatch_semantics()
+    test_globstar_and_brace_expansion()
+    test_first_matching_layer_wins()
+    print("All layer tests passed")
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Tests for single-scan multi-pattern matching
+Run with pytest, or directly as a script
+"""
+
+import re
+
+from analysis.patterns import PatternSet
+
+CONTENT = """class UsersController
+  def index
+    User.where(active: true).find(1)
+    ActiveRecord::Base.connection
+  end
+end
+"""
+
+def test_reports_every_pattern_with_first_line():
+    patterns = ["ActiveRecord::Base", "\\.where\\(", "\\.find\\(", "where", "\\.destroy\\("]
+    found = PatternSet(patterns).scan(CONTENT)
+    # "where" overlaps "\.where\(" but must still be reported
+    assert found == {0: 4, 1: 3, 2: 3, 3: 3}
+    for index, pattern in enumerate(patterns):
+        assert (index in found) == bool(re.search(pattern, CONTENT))
+
+def test_patterns_that_cannot_share_an_alternation():
+    patterns = ["(\\w)\\1", "(?i)activerecord", "(?P<x>def)", "(?P<x>end)", "[unclosed", "index"]
+    found = PatternSet(patterns).scan(CONTENT)
+    # "ll" in "Controller", the case-insensitive match, and both named groups
+    assert found == {0: 1, 1: 4, 2: 2, 3: 5, 5: 2}
+
+if __name__ == "__main__":
+    test_reports_every_pattern_with_first_line()
+    test_patterns_that_cannot_share_an_alternation()
+    print("All pattern tests passed")
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Tests for the compact analysis payload
+Run with pytest, or directly as a script
+"""
+
+import json
+import shutil
+
+from analysis.payload import compact_result, expand_result
+from analysis.scan import analyze_repo, scan_repo
+from test_analyzer import create_mock_repo
+from test_scan import RULES
+
+def test_compact_payload_round_trips():
+    repo = create_mock_repo()
+    try:
+        result = analyze_repo(repo, RULES)
+        payload = compact_result(result)
+
+        assert payload["format"] == "compact"
+        assert len(payload["strings"]) == len(set(payload["strings"]))
+        assert len(payload["edges"]["from_path"]) == len(result["edges"])
+        assert all(isinstance(i, int) for i in payload["nodes"]["path"])
+        assert expand_result(json.loads(json.dumps(payload))) == result
+        assert len(json.dumps(payload)) < len(json.dumps(result))
+
+        # Built straight from the graph columns, without edge dicts
+        scan = scan_repo(repo, RULES)
+        from_graph = compact_result({"nodes": scan.nodes, "violations": scan.violations,
+                                     "metrics": scan.metrics}, scan.graph)
+        assert expand_result(from_graph) == result
+    finally:
+        shutil.rmtree(repo, ignore_errors=True)
+
+if __name__ == "__main__":
+    test_compact_payload_round_trips()
+    print("All payload tests passed")
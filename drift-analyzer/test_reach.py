@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Tests for transitive layer reachability and the graph-wide rules
+Run with pytest, or directly as a script
+"""
+
+import random
+
+from analysis.graph import EdgeGraph
+from analysis.reach import Reachability
+from analysis.scan import check_rules
+
+def node(path, layer):
+    return {"path": path, "module_name": path, "layer": layer, "lang": "ruby"}
+
+def brute_force_reach(nodes, edges, start, excluded=None):
+    layers = {n["path"]: n["layer"] for n in nodes}
+    seen = {start}
+    stack = [start]
+    while stack:
+        current = stack.pop()
+        for edge in edges:
+            target = edge["to_path"]
+            if edge["from_path"] == current and target not in seen and layers.get(target) != excluded:
+                seen.add(target)
+                stack.append(target)
+    return {layers[path] for path in seen if path in layers}
+
+def test_reachability_matches_brute_force():
+    rng = random.Random(7)
+    layers = ["a", "b", "c", "d", "e"]
+    nodes = [node(f"f{i}.rb", rng.choice(layers)) for i in range(300)]
+    edges = [{"from_path": rng.choice(nodes)["path"], "to_path": rng.choice(nodes)["path"], "edge_type": "import"}
+             for _ in range(420)]
+    edges += [{"from_path": n["path"], "to_path": "DATABASE", "edge_type": "db_call"} for n in nodes[:20]]
+    graph = EdgeGraph.from_edges(nodes, edges)
+
+    for excluded in (None, "c"):
+        reach = Reachability(graph, excluded_layer=graph.ids[excluded] if excluded else None)
+        for n in nodes:
+            if n["layer"] == excluded:
+                continue
+            expected = brute_force_reach(nodes, edges, n["path"], excluded)
+            vertex = graph.ids[n["path"]]
+            assert {layer for layer in layers if reach.reaches(vertex, graph.ids[layer])} == expected
+            for layer in expected - {n["layer"]}:
+                path = reach.path_to_layer(vertex, graph.ids[layer])
+                assert graph.strings[graph.from_ids[path[0]]] == n["path"]
+                assert graph.layer_ids[graph.to_ids[path[-1]]] == graph.ids[layer]
+
+def test_transitive_routes_and_layer_cycles():
+    nodes = [
+        node("app/controllers/a.rb", "controllers"),
+        node("app/controllers/b.rb", "controllers"),
+        node("app/helpers/h.rb", "helpers"),
+        node("app/services/s.rb", "services"),
+        node("app/models/m.rb", "models"),
+    ]
+    edges = [
+        # b goes through a service; a sneaks around it via a helper
+        {"from_path": "app/controllers/b.rb", "to_path": "app/services/s.rb", "edge_type": "import"},
+        {"from_path": "app/services/s.rb", "to_path": "app/models/m.rb", "edge_type": "import"},
+        {"from_path": "app/controllers/a.rb", "to_path": "app/helpers/h.rb", "edge_type": "import"},
+        {"from_path": "app/helpers/h.rb", "to_path": "app/models/m.rb", "edge_type": "import"},
+        # models depend back on helpers: a cycle between the two layers
+        {"from_path": "app/models/m.rb", "to_path": "app/helpers/h.rb", "edge_type": "import"},
+    ]
+    rules = {
+        "layers": [{"name": name, "patterns": []} for name in ("controllers", "helpers", "services", "models")],
+        "must_route_via": [{"from": "controllers", "to": "models", "via": "services", "transitive": True}],
+        "no_layer_cycles": True,
+    }
+
+    violations = check_rules(nodes, edges, rules)
+    assert [(v["rule_code"], v["node_path"]) for v in violations] == [
+        ("BYPASS_LAYER", "app/controllers/a.rb"),
+        ("LAYER_CYCLE", "app/helpers/h.rb"),
+    ]
+    assert violations[0]["details"].endswith("app/controllers/a.rb → app/helpers/h.rb → app/models/m.rb")
+    assert "helpers and models" in violations[1]["details"]
+
+if __name__ == "__main__":
+    test_reachability_matches_brute_force()
+    test_transitive_routes_and_layer_cycles()
+    print("All reachability tests passed")
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Tests for size-capped, memory-mapped source reading
+Run with pytest, or directly as a script
+"""
+
+import os
+import shutil
+
+from analysis.patterns import PatternSet, compile_binary_pattern_set
+from analysis.reader import SourceReader, sniff
+from analysis.scan import analyze_repo, parse_source
+from test_analyzer import create_mock_repo
+from test_scan import RULES, write_file
+
+def test_sniff_classifies_heads():
+    assert sniff(b"class User\n  def x; end\nend\n") is None
+    assert sniff(b"\x89PNG\r\n\x1a\n\0\0\0") == "binary"
+    assert sniff(b"var a=1;" * 400) == "minified"
+    assert sniff(b"// @generated by protoc\nexport const x = 1;\n") == "generated"
+    assert sniff(b"# frozen_string_literal: true\n# Code generated by gen. DO NOT EDIT.\nclass A; end\n") == "generated"
+    assert sniff(b"/**\n * Client for the API\n * @generated\n */\nexport {}\n") == "generated"
+    # Markers count only in the comment a file starts with
+    assert sniff(b"# Slugs are auto-generated. DO NOT EDIT them\nclass A; end\n") is None
+    assert sniff(b"class A\n  # @generated\nend\n") is None
+
+def test_binary_scan_matches_text_scan():
+    content = "class A\r\n  def x\r\n    User.where(id: 1)\r\n  end\r\nend\r\n"
+    patterns = ("ActiveRecord::Base", "\\.where\\(", "(\\w)\\1")
+    binary = compile_binary_pattern_set(patterns)
+    assert binary.scan(content.encode()) == PatternSet(patterns).scan(content.replace("\r\n", "\n"))
+    # Patterns only a str regex understands fall back to decoding
+    assert compile_binary_pattern_set(("caf\\u00e9",)) is None
+    assert parse_source("ruby", "café = User.find(1)".encode(), [])["db_calls"] == 1
+
+def test_skips_large_binary_and_generated_files():
+    repo = create_mock_repo()
+    try:
+        before = analyze_repo(repo, RULES)
+        write_file(repo, ".gitattributes", "app/generated/** linguist-generated\n*.rb diff=ruby\n")
+        write_file(repo, "app/generated/client_controller.rb", "ActiveRecord::Base.where(x)\n")
+        write_file(repo, "frontend/tsconfig.tsbuildinfo", '{"program": "import x from \'y\'"}')
+        write_file(repo, "app/controllers/big_controller.rb", "User.find(1)\n" + "# pad\n" * 200_000)
+        with open(os.path.join(repo, "app/controllers/blob_controller.rb"), "wb") as f:
+            f.write(b"User.find(1)\0\0\0")
+
+        reader = SourceReader(repo)
+        assert reader.read("app/controllers/users_controller.rb")
+        for path in ("app/generated/client_controller.rb", "frontend/tsconfig.tsbuildinfo",
+                     "app/controllers/big_controller.rb", "app/controllers/blob_controller.rb"):
+            assert reader.read(path) is None
+        assert reader.skipped == {"generated": 2, "too_large": 1, "binary": 1}
+
+        after = analyze_repo(repo, RULES)
+        assert after["violations"] == before["violations"]
+        assert after["edges"] == before["edges"]
+        # Every skipped file is a node left unparsed
+        assert before["metrics"]["counts"]["skipped"] == 0
+        assert after["metrics"]["counts"]["skipped"] == 4
+        # Without a cap the large file is read
+        assert SourceReader(repo, max_bytes=0).read("app/controllers/big_controller.rb")
+    finally:
+        shutil.rmtree(repo, ignore_errors=True)
+
+def test_mentioning_generated_code_mid_file_is_analysed():
+    repo = create_mock_repo()
+    try:
+        write_file(repo, "app/controllers/posts_controller.rb",
+                   "class PostsController\n"
+                   "  # Slugs are auto-generated from the title; DO NOT EDIT them by hand\n"
+                   "  def show; Post.find(params[:id]); end\n"
+                   "end\n")
+        result = analyze_repo(repo, RULES)
+        assert [v["rule_code"] for v in result["violations"] if v["node_path"] == "app/controllers/posts_controller.rb"] \
+            == ["DISALLOWED_API"]
+        assert result["metrics"]["counts"]["skipped"] == 0
+    finally:
+        shutil.rmtree(repo, ignore_errors=True)
+
+if __name__ == "__main__":
+    test_sniff_classifies_heads()
+    test_binary_scan_matches_text_scan()
+    test_skips_large_binary_and_generated_files()
+    test_mentioning_generated_code_mid_file_is_analysed()
+    print("All reader tests passed")
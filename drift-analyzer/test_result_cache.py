@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Tests for the analysis result cache
+Run with pytest, or directly as a script
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from analysis import cache as cache_module
+from analysis.cache import ResultCache, result_key
+
+def test_rules_hash_ignores_key_order():
+    rules = {"layers": [{"name": "a", "patterns": ["*.rb"]}], "disallowed_apis": []}
+    reordered = {"disallowed_apis": [], "layers": [{"patterns": ["*.rb"], "name": "a"}]}
+    assert result_key("repo", "ABC", rules) == result_key("repo", "abc", reordered)
+    assert result_key("repo", "abc", rules) != result_key("repo", "abc", rules, "full:compact")
+    assert result_key("repo", "abc", rules) != result_key("other", "abc", rules)
+    # A newer parser does not reuse results an older one computed
+    assert result_key("repo", "abc", rules, facts_version=5) != result_key("repo", "abc", rules, facts_version=6)
+    current = result_key("repo", "abc", rules)
+    original = cache_module.RESULT_VERSION
+    try:
+        cache_module.RESULT_VERSION = original + 1
+        assert result_key("repo", "abc", rules) != current
+    finally:
+        cache_module.RESULT_VERSION = original
+
+def test_concurrent_requests_share_one_computation():
+    base = tempfile.mkdtemp(prefix="drift-results-")
+    try:
+        cache = ResultCache(os.path.join(base, "results.sqlite3"))
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return {"violations": len(calls)}
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("k", compute)))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == [{"violations": 1}] * 8
+        assert len(calls) == 1
+
+        # Later requests, and a fresh process, are served from storage
+        assert cache.get_or_compute("k", compute) == {"violations": 1}
+        assert ResultCache(cache.path).get("k") == {"violations": 1}
+        assert len(calls) == 1
+
+        # Failures reach the caller and are not stored
+        def fail():
+            raise ValueError("boom")
+        try:
+            cache.get_or_compute("bad", fail)
+            raise AssertionError("expected ValueError")
+        except ValueError:
+            pass
+        assert cache.get("bad") is None
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+def test_evicts_least_recently_used_results():
+    base = tempfile.mkdtemp(prefix="drift-results-")
+    try:
+        value = {"edges": "x" * 100}
+        cache = ResultCache(os.path.join(base, "results.sqlite3"), max_bytes=250)
+        cache.put("a", value)
+        time.sleep(0.01)
+        cache.put("b", value)
+        time.sleep(0.01)
+        assert cache.get("a") == value  # a is now the most recently used
+        time.sleep(0.01)
+        cache.put("c", value)
+        assert cache.get("b") is None
+        assert cache.get("a") == value and cache.get("c") == value
+
+        # A zero budget stores nothing
+        disabled = ResultCache(os.path.join(base, "disabled.sqlite3"), max_bytes=0)
+        assert disabled.get_or_compute("a", lambda: value) == value
+        assert disabled.get("a") is None
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+if __name__ == "__main__":
+    test_rules_hash_ignores_key_order()
+    test_concurrent_requests_share_one_computation()
+    test_evicts_least_recently_used_results()
+    print("All result cache tests passed")
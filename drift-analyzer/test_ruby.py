@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Tests for the Ruby constant scanner and definition index
+Run with pytest, or directly as a script
+"""
+
+import shutil
+
+from analysis.ruby import RubyIndex, scan_constants
+from analysis.scan import analyze_repo, collect_ruby_constant_edges
+from test_analyzer import create_mock_repo
+from test_scan import write_file
+
+SOURCE = """# class Commented < Base
+module Admin
+  class UsersController < ApplicationController
+    LIMIT = 10 if defined?(Paging)
+    def index
+      @users = User.where(active: true).limit(LIMIT)
+      sql = <<~SQL
+        select * from users where kind = 'end'
+      SQL
+      return if sql.empty?
+      rows.each do |row|
+        tag(row, class: "Ignored", end: 1)
+      end
+      Admin::Audit.log(self.class.name, :Symbol, "#{Quoted}")
+    end
+    def short = Short
+    class << self
+      def build; Builder.new; end
+    end
+  end
+end
+class Admin::Report < ::Base
+  while pending? do
+    Poller.poll
+  end
+end
+Admin::UsersController.build
+"""
+
+def test_scanner_tracks_nesting_and_skips_non_code():
+    definitions, references = scan_constants(SOURCE)
+    assert definitions == ["Admin", "Admin::UsersController", "Admin::Report"]
+    assert references == [
+        ["ApplicationController", 3, "Admin"],
+        ["LIMIT", 4, "Admin::UsersController"],
+        ["Paging", 4, "Admin::UsersController"],
+        ["User", 6, "Admin::UsersController"],
+        ["Admin::Audit", 14, "Admin::UsersController"],
+        ["Short", 16, "Admin::UsersController"],
+        ["Builder", 18, "Admin::UsersController"],
+        ["::Base", 22, ""],
+        ["Poller", 24, "Admin::Report"],
+        ["Admin::UsersController", 27, ""],
+    ]
+    # Bytes (as from a mapped file) scan the same
+    assert scan_constants(SOURCE.encode("utf-8")) == (definitions, references)
+
+def test_index_resolves_lexically_and_prefers_conventional_files():
+    index = RubyIndex()
+    index.add("app/models/user.rb", ["User"])
+    index.add("app/models/admin/user.rb", ["Admin::User", "Admin::User::ROLES"])
+    index.add("app/models/concerns/user_extensions.rb", ["User"])
+    index.add("app/controllers/admin/users_controller.rb", ["Admin::UsersController"])
+
+    assert index.lookup("User", "Admin::UsersController") == "app/models/admin/user.rb"
+    assert index.lookup("User", "") == "app/models/user.rb"
+    assert index.lookup("::User", "Admin::UsersController") == "app/models/user.rb"
+    # Undefined constants under a known class fall back to the class
+    assert index.lookup("Admin::User::STATUS", "") == "app/models/admin/user.rb"
+    assert index.lookup("Rails", "Admin") is None
+    assert list(index.resolve_targets("app/controllers/admin/users_controller.rb", [
+        ["User", 3, "Admin::UsersController"], ["Admin::User", 5, ""], ["Admin::UsersController", 7, ""],
+    ])) == [("app/models/admin/user.rb", 3)]
+
+def test_controller_to_model_reference_is_forbidden():
+    repo = create_mock_repo()
+    try:
+        write_file(repo, "app/models/user.rb", "class User < ApplicationRecord\nend\n")
+        rules = {
+            "layers": [
+                {"name": "controllers", "patterns": ["app/controllers/*.rb"]},
+                {"name": "models", "patterns": ["app/models/*.rb"]},
+            ],
+            "forbidden_dependencies": [{"from": "controllers", "to": "models"}],
+        }
+        result = analyze_repo(repo, rules)
+        constant_edges = [e for e in result["edges"] if e["edge_type"] == "constant"]
+        assert {"from_path": "app/controllers/users_controller.rb", "to_path": "app/models/user.rb",
+                "edge_type": "constant", "line_number": 4} in constant_edges
+        assert sorted(map(str, constant_edges)) == sorted(map(str, collect_ruby_constant_edges(repo)))
+        assert [(v["rule_code"], v["edge_type"]) for v in result["violations"]] == [("FORBIDDEN_DEP", "constant")]
+    finally:
+        shutil.rmtree(repo, ignore_errors=True)
+
+if __name__ == "__main__":
+    test_scanner_tracks_nesting_and_skips_non_code()
+    test_index_resolves_lexically_and_prefers_conventional_files()
+    test_controller_to_model_reference_is_forbidden()
+    print("All Ruby tests passed")
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Tests for the runner's event-loop entry points
+Run with pytest, or directly as a script
+"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+
+from analysis import runner
+from analysis.cache import FactCache, ResultCache
+from analysis.gitstore import MirrorStore
+from analysis.scan import iter_analysis, resolve_workers
+from test_analyzer import create_mock_repo
+from test_gitstore import git
+from test_scan import RULES
+
+def without_telemetry(record):
+    return {key: value for key, value in record.items() if key not in ("timings", "counters")}
+
+def test_streamed_analysis_comes_from_scan_process():
+    base = tempfile.mkdtemp(prefix="drift-runner-")
+    repo = create_mock_repo()
+    saved = runner._mirror_store, runner._result_cache, runner._fact_cache
+    try:
+        runner._mirror_store = MirrorStore(os.path.join(base, "mirrors"))
+        runner._result_cache = ResultCache(os.path.join(base, "results.sqlite3"))
+        runner._fact_cache = FactCache(os.path.join(base, "facts.sqlite3"))
+        git(repo, "init", "--quiet", "--initial-branch=main")
+        git(repo, "add", "-A")
+        git(repo, "commit", "--quiet", "-m", "mock")
+
+        async def stream():
+            return list(await runner.stream_analysis_async(repo, "main", RULES))
+
+        records = asyncio.run(stream())
+        assert runner._scan_executor is not None
+        assert [without_telemetry(record) for record in records] == list(iter_analysis(repo, RULES))
+        assert "timings" in records[-1]
+
+        async def abandon():
+            records = await runner.stream_analysis_async(repo, "main", RULES)
+            next(records)
+            records.close()
+
+        asyncio.run(abandon())
+    finally:
+        runner.shutdown_scan_executor()
+        runner._mirror_store, runner._result_cache, runner._fact_cache = saved
+        shutil.rmtree(base, ignore_errors=True)
+        shutil.rmtree(repo, ignore_errors=True)
+
+def test_scan_processes_share_parse_workers():
+    base = tempfile.mkdtemp(prefix="drift-runner-")
+    saved = runner._mirror_store, runner._result_cache, runner._fact_cache
+    saved_env = {name: os.environ.get(name) for name in ("DRIFT_SCAN_WORKERS", "DRIFT_PARSE_WORKERS")}
+    try:
+        runner._mirror_store = MirrorStore(os.path.join(base, "mirrors"))
+        runner._result_cache = ResultCache(os.path.join(base, "results.sqlite3"))
+        runner._fact_cache = FactCache(os.path.join(base, "facts.sqlite3"))
+        os.environ["DRIFT_SCAN_WORKERS"] = "2"
+        os.environ.pop("DRIFT_PARSE_WORKERS", None)
+
+        # Two scans at once start about one parser per CPU between them
+        parse_workers = runner.get_scan_executor().submit(resolve_workers).result()
+        assert parse_workers == max((os.cpu_count() or 1) // 2, 1)
+        assert resolve_workers() == (os.cpu_count() or 1)
+        assert runner.get_scan_executor().submit(resolve_workers, 3).result() == 3
+    finally:
+        runner.shutdown_scan_executor()
+        runner._mirror_store, runner._result_cache, runner._fact_cache = saved
+        for name, value in saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        shutil.rmtree(base, ignore_errors=True)
+
+if __name__ == "__main__":
+    test_streamed_analysis_comes_from_scan_process()
+    test_scan_processes_share_parse_workers()
+    print("All runner tests passed")
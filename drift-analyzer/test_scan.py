@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the scan pipeline
+Run with pytest, or directly as a script
+"""
+
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from analysis.cache import FactCache
+from analysis.inventory import build_inventory
+from analysis.scan import analyze_repo, check_rules, collect_nodes, iter_analysis
+from test_analyzer import create_mock_repo
+
+RULES = {
+    "layers": [
+        {"name": "controllers", "patterns": ["app/controllers/*.rb"]},
+        {"name": "services", "patterns": ["app/services/*.rb"]},
+        {"name": "repositories", "patterns": ["app/repositories/*.rb"]},
+        {"name": "frontend", "patterns": ["frontend/*/*.ts", "frontend/*/*.tsx"]},
+    ],
+    "forbidden_dependencies": [],
+    "must_route_via": [],
+    "disallowed_apis": [
+        {"layer": "controllers", "patterns": ["ActiveRecord::Base", "\\.where\\(", "\\.find\\("]}
+    ],
+}
+
+def write_file(root, path, content=""):
+    full_path = os.path.join(root, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    with open(full_path, "w") as f:
+        f.write(content)
+
+def test_inventory_skips_ignored_dirs():
+    repo = create_mock_repo()
+    try:
+        write_file(repo, "node_modules/react/index.ts", "export {}")
+        write_file(repo, "vendor/bundle/gem.rb", "class Gem; end")
+        write_file(repo, ".git/hooks/hook.rb", "")
+        write_file(repo, "frontend/dist/bundle.ts", "")
+
+        paths = [source.path for source in build_inventory(repo)]
+        assert paths == sorted(paths)
+        assert "frontend/components/UserList.tsx" in paths
+        assert "app/controllers/users_controller.rb" in paths
+        assert not any(p.startswith(("node_modules", "vendor", ".git", "frontend/dist")) for p in paths)
+    finally:
+        shutil.rmtree(repo, ignore_errors=True)
+
+def test_analyze_repo_single_pass_matches_file_reads():
+    repo = create_mock_repo()
+    try:
+        result = analyze_repo(repo, RULES)
+
+        imports = [e for e in result["edges"] if e["edge_type"] == "import"]
+        assert {"from_path": "frontend/components/UserList.tsx",
+                "to_path": "frontend/services/UserService.ts",
+                "edge_type": "import", "line_number": 3} in imports
+
+        # check_rules reading files itself must agree with the single pass
+        nodes = collect_nodes(repo, RULES)
+        assert check_rules(nodes, result["edges"], RULES, repo) == result["violations"]
+        assert [v["node_path"] for v in result["violations"]] == ["app/controllers/users_controller.rb"]
+    finally:
+        shutil.rmtree(repo, ignore_errors=True)
+
+def test_incremental_cache_reparses_only_changed_files():
+    repo = create_mock_repo()
+    cache_dir = tempfile.mkdtemp(prefix="drift-cache-")
+    try:
+        cache = FactCache(os.path.join(cache_dir, "facts.sqlite3"))
+        full = analyze_repo(repo, RULES)
+
+        first = analyze_repo(repo, RULES, cache=cache)
+        assert first["metrics"].pop("cache") == {"hits": 0, "misses": 5}
+        assert first == full
+
+        write_file(repo, "app/services/user_service.rb", "class UserService\n  def all; User.where(x: 1); end\nend\n")
+        second = analyze_repo(repo, RULES, cache=cache)
+        assert second["metrics"].pop("cache") == {"hits": 4, "misses": 1}
+        assert second == analyze_repo(repo, RULES)
+    finally:
+        shutil.rmtree(repo, ignore_errors=True)
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+def test_parallel_parse_is_identical_to_serial():
+    repo = create_mock_repo()
+    old_min_files = os.environ.get("DRIFT_PARALLEL_MIN_FILES")
+    try:
+        for i in range(40):
+            write_file(repo, f"app/controllers/c{i}_controller.rb", f"class C{i}\n  def x; User.find({i}); end\nend\n")
+            write_file(repo, f"frontend/components/C{i}.tsx", "import { UserService } from '../services/UserService';\n")
+
+        serial = analyze_repo(repo, RULES, workers=1)
+        os.environ["DRIFT_PARALLEL_MIN_FILES"] = "0"
+        parallel = analyze_repo(repo, RULES, workers=3)
+        assert json.dumps(parallel) == json.dumps(serial)
+    finally:
+        if old_min_files is None:
+            os.environ.pop("DRIFT_PARALLEL_MIN_FILES", None)
+        else:
+            os.environ["DRIFT_PARALLEL_MIN_FILES"] = old_min_files
+        shutil.rmtree(repo, ignore_errors=True)
+
+def test_parallel_parse_from_unguarded_script():
+    # Spawned parser processes import the script again, running its
+    # module-level analysis while they start up
+    repo = create_mock_repo()
+    script = os.path.join(repo, "unguarded.py")
+    with open(script, "w") as f:
+        f.write("import json, sys\n"
+                f"sys.path.insert(0, {os.path.dirname(os.path.abspath(__file__))!r})\n"
+                "from analysis.scan import analyze_repo\n"
+                "from test_scan import RULES\n"
+                "print(json.dumps(analyze_repo(sys.argv[1], RULES, workers=2)))\n")
+    try:
+        env = dict(os.environ, DRIFT_PARALLEL_MIN_FILES="0")
+        output = subprocess.run([sys.executable, script, repo], env=env, capture_output=True, text=True,
+                                timeout=120, check=True).stdout
+        assert json.loads(output.splitlines()[-1]) == analyze_repo(repo, RULES, workers=1)
+    finally:
+        shutil.rmtree(repo, ignore_errors=True)
+
+def test_streamed_records_match_analyze_repo():
+    repo = create_mock_repo()
+    try:
+        rules = dict(RULES, forbidden_dependencies=[{"from": "frontend", "to": "frontend"}])
+        result = analyze_repo(repo, rules)
+        records = list(iter_analysis(repo, rules, batch_size=2))
+
+        assert records[-1] == {"type": "metrics", **result["metrics"]}
+        by_type = {}
+        for record in records[:-1]:
+            by_type.setdefault(record.pop("type"), []).append(record)
+        assert by_type["node"] == result["nodes"]
+
+        def key(record):
+            return json.dumps(record, sort_keys=True)
+        assert sorted(map(key, by_type["edge"])) == sorted(map(key, result["edges"]))
+        assert sorted(map(key, by_type["violation"])) == sorted(map(key, result["violations"]))
+        assert any(v["rule_code"] == "FORBIDDEN_DEP" for v in by_type["violation"])
+    finally:
+        shutil.rmtree(repo, ignore_errors=True)
+
+def nested_loop_violations(nodes, edges, rules):
+    """The original O(rules x edges) evaluation, kept as a reference"""
+    layer_map = {node["path"]: node["layer"] for node in nodes}
+    found = []
+    for code, key in (("FORBIDDEN_DEP", "forbidden_dependencies"), ("BYPASS_LAYER", "must_route_via")):
+        for rule in rules[key]:
+            for edge in edges:
+                if layer_map.get(edge["from_path"]) == rule["from"] and layer_map.get(edge["to_path"]) == rule["to"]:
+                    found.append((code, edge["from_path"], edge["to_path"]))
+    return found
+
+def test_indexed_rules_match_nested_loops():
+    random.seed(7)
+    layers = ["controllers", "services", "models", "jobs", "unknown"]
+    nodes = [{"path": f"f{i}.rb", "layer": random.choice(layers), "lang": "ruby"} for i in range(60)]
+    edges = [{"from_path": f"f{random.randrange(60)}.rb", "to_path": f"f{random.randrange(60)}.rb", "edge_type": "import"}
+             for _ in range(400)]
+    rules = {
+        "forbidden_dependencies": [{"from": random.choice(layers), "to": random.choice(layers)} for _ in range(30)],
+        "must_route_via": [{"from": random.choice(layers), "to": random.choice(layers), "via": "services"} for _ in range(30)],
+    }
+
+    violations = check_rules(nodes, edges, rules)
+    expected = nested_loop_violations(nodes, edges, rules)
+    assert len(violations) == len(expected)
+    assert [(v["rule_code"], v["node_path"]) for v in violations] == [(code, path) for code, path, _ in expected]
+    forbidden = [v for v in violations if v["rule_code"] == "FORBIDDEN_DEP"]
+    assert [v["details"].split(" → ")[1] for v in forbidden] == [to for code, _, to in expected if code == "FORBIDDEN_DEP"]
+
+if __name__ == "__main__":
+    test_inventory_skips_ignored_dirs()
+    test_analyze_repo_single_pass_matches_file_reads()
+    test_incremental_cache_reparses_only_changed_files()
+    test_parallel_parse_is_identical_to_serial()
+    test_parallel_parse_from_unguarded_script()
+    test_streamed_records_match_analyze_repo()
+    test_indexed_rules_match_nested_loops()
+    print("All scan tests passed")
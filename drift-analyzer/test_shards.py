@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Tests for sharded scans: partitioning, and a coordinator merging the facts
+collected by peers or local processes
+Run with pytest, or directly as a script
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from analysis import runner
+from analysis.cache import FactCache, ResultCache
+from analysis.gitstore import MirrorStore
+from analysis.scan import analyze_repo
+from analysis.shards import partition
+from test_analyzer import create_mock_repo
+from test_gitstore import git
+from test_scan import RULES
+
+PATHS = ["app/a.rb", "app/b.rb", "app/models/c.rb", "lib/d.rb", "src/e.ts", "src/f.ts", "README.rb"]
+
+def test_partition_by_hash_and_prefix():
+    by_hash = partition(PATHS, 3)
+    assert sorted(path for shard in by_hash for path in shard) == sorted(PATHS)
+    assert partition(PATHS, 3) == by_hash
+
+    by_prefix = partition(PATHS, 3, by="prefix")
+    assert by_prefix == [["app/a.rb", "app/b.rb", "app/models/c.rb"], ["src/e.ts", "src/f.ts"], ["lib/d.rb", "README.rb"]]
+    # Never more shards than files, and no empty ones
+    assert len(partition(PATHS[:2], 8)) <= 2
+    assert partition(["app/a.rb", "app/b.rb"], 2, by="prefix") == [["app/a.rb", "app/b.rb"]]
+    try:
+        partition(PATHS, 2, by="size")
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+
+class PeerHandler(BaseHTTPRequestHandler):
+    # Serves POST /shards/collect the way main.py does
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        collected = runner.collect_shard(body["git"]["repo_url"], body["git"]["ref"], body["rules"], body["paths"],
+                                         token=body["git"]["token"], mode=body["mode"])
+        data = json.dumps(collected).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+def test_sharded_scan_matches_single_scan():
+    base = tempfile.mkdtemp(prefix="drift-shards-")
+    repo = create_mock_repo()
+    saved = runner._mirror_store, runner._result_cache, runner._fact_cache
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PeerHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        runner._mirror_store = MirrorStore(os.path.join(base, "mirrors"))
+        runner._result_cache = ResultCache(os.path.join(base, "results.sqlite3"))
+        runner._fact_cache = FactCache(os.path.join(base, "facts.sqlite3"))
+        git(repo, "init", "--quiet", "--initial-branch=main")
+        git(repo, "add", "-A")
+        git(repo, "commit", "--quiet", "-m", "mock")
+        peer = f"http://127.0.0.1:{server.server_address[1]}"
+
+        with runner.get_mirror_store().tree(repo, "main") as tree:
+            expected = analyze_repo(tree, RULES)
+            # Local processes stand in for peers
+            local = runner.run_sharded_scan(repo, tree, RULES, shards=2, shard_by="prefix").as_dict()
+            assert local == expected
+            # A peer that cannot be reached has its shard parsed here instead
+            remote = runner.run_sharded_scan(repo, tree, RULES, shards=3, peers=[peer, "http://127.0.0.1:9"],
+                                             mode="incremental")
+            assert {key: value for key, value in remote.as_dict().items() if key != "metrics"} == \
+                {key: value for key, value in expected.items() if key != "metrics"}
+            assert remote.metrics["cache"]["misses"] == len(expected["nodes"])
+    finally:
+        server.shutdown()
+        runner._mirror_store, runner._result_cache, runner._fact_cache = saved
+        shutil.rmtree(base, ignore_errors=True)
+        shutil.rmtree(repo, ignore_errors=True)
+
+if __name__ == "__main__":
+    test_partition_by_hash_and_prefix()
+    test_sharded_scan_matches_single_scan()
+    print("All shard tests passed")
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Tests for stage timings, counters and the /metrics endpoint
+Run with pytest, or directly as a script
+"""
+
+import os
+import shutil
+import tempfile
+
+from fastapi.testclient import TestClient
+
+import main
+from analysis import runner
+from analysis.cache import ResultCache
+from analysis.gitstore import MirrorStore
+from analysis.scan import scan_repo
+from analysis.telemetry import MetricsRegistry, Telemetry
+from test_gitstore import create_remote
+from test_scan import RULES
+from test_analyzer import create_mock_repo
+
+def test_scan_counts_match_serial_and_parallel():
+    repo = create_mock_repo()
+    try:
+        counts = []
+        for workers, min_files in ((1, "2000"), (2, "1")):
+            os.environ["DRIFT_PARALLEL_MIN_FILES"] = min_files
+            telemetry = Telemetry()
+            scan = scan_repo(repo, RULES, workers=workers, telemetry=telemetry)
+            assert set(telemetry.timings) == {"walk", "collect_nodes", "parse", "edges", "check_rules"}
+            counts.append(telemetry.counters)
+        assert counts[0] == counts[1]
+        assert counts[0]["files_read"] == len(scan.nodes)
+        assert counts[0]["bytes_read"] > 0 and counts[0]["regex_evaluations"] > 0
+    finally:
+        os.environ.pop("DRIFT_PARALLEL_MIN_FILES", None)
+        shutil.rmtree(repo, ignore_errors=True)
+
+def test_registry_renders_histograms():
+    registry = MetricsRegistry()
+    registry.observe({"timings": {"parse": 0.02}, "counters": {"files_read": 3}})
+    registry.observe({"timings": {"parse": 2.0}, "counters": {"files_read": 4}})
+    registry.count_request("analyze", "ok")
+    text = registry.render()
+    assert 'drift_stage_seconds_bucket{stage="parse",le="0.025"} 1' in text
+    assert 'drift_stage_seconds_bucket{stage="parse",le="+Inf"} 2' in text
+    assert 'drift_stage_seconds_count{stage="parse"} 2' in text
+    assert "drift_files_read_total 7" in text
+    assert 'drift_requests_total{endpoint="analyze",outcome="ok"} 1' in text
+
+def test_analyze_reports_timings_and_exports_metrics():
+    base = tempfile.mkdtemp(prefix="drift-telemetry-")
+    saved = runner._mirror_store, runner._result_cache
+    try:
+        remote, _ = create_remote(base)
+        runner._mirror_store = MirrorStore(os.path.join(base, "mirrors"))
+        runner._result_cache = ResultCache(os.path.join(base, "results.sqlite3"))
+        client = TestClient(main.app)
+        body = {"rules": {"layers": []}, "git": {"repo_url": remote, "ref": "main"}}
+
+        first = client.post("/analyze", json=body).json()["metrics"]
+        assert {"fetch", "walk", "parse", "check_rules", "serialize", "total"} <= set(first["timings"])
+        assert first["counters"]["files_read"] == 2
+        assert first["counters"]["result_cache_misses"] == 1
+
+        # Served from the result cache: no walk or parse this time
+        second = client.post("/analyze", json=body).json()["metrics"]
+        assert "parse" not in second["timings"]
+        assert second["counters"] == {"result_cache_hits": 1}
+
+        streamed = client.post("/analyze", json=dict(body, stream=True)).text
+        assert '"timings"' in streamed.splitlines()[-1]
+
+        text = client.get("/metrics").text
+        assert 'drift_stage_seconds_count{stage="parse"}' in text
+        assert 'drift_requests_total{endpoint="analyze",outcome="ok"}' in text
+    finally:
+        runner._mirror_store, runner._result_cache = saved
+        shutil.rmtree(base, ignore_errors=True)
+
+if __name__ == "__main__":
+    test_scan_counts_match_serial_and_parallel()
+    test_registry_renders_histograms()
+    test_analyze_reports_timings_and_exports_metrics()
+    print("All telemetry tests passed")
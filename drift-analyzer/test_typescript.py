@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Tests for the TypeScript import scanner and resolver
+Run with pytest, or directly as a script
+"""
+
+import shutil
+import tempfile
+
+from analysis.typescript import TsResolver, scan_imports
+from test_scan import write_file
+
+SOURCE = """import React from 'react';
+import type { User } from "./types";
+import './globals.css';
+import {
+  Button,
+  Card,
+} from '@/components/ui';
+export * from './button';
+export { default as Card } from './card';
+export { helper };
+const lazy = import('./lazy');
+const fs = require("fs");
+// import { Commented } from './commented';
+const text = "import { Quoted } from './quoted'";
+const meta = import.meta.url;
+<p>Don't import from 'jsx-text' here</p>
+"""
+
+def test_scanner_handles_full_import_grammar():
+    assert scan_imports(SOURCE) == [
+        ["react", 1],
+        ["./types", 2],
+        ["./globals.css", 3],
+        ["@/components/ui", 4],
+        ["./button", 8],
+        ["./card", 9],
+        ["./lazy", 11],
+        ["fs", 12],
+    ]
+    assert scan_imports("const x = 1;\n") == []
+
+def test_resolver_uses_inventory_and_tsconfig_paths():
+    repo = tempfile.mkdtemp(prefix="drift-analyzer-")
+    try:
+        write_file(repo, "tsconfig.base.json", """{
+  // shared options
+  "compilerOptions": {
+    "baseUrl": ".",
+    "paths": {"@/*": ["web/src/*"], "@lib": ["web/lib/index.ts"],},
+  },
+}""")
+        write_file(repo, "web/tsconfig.json", '{"extends": "../tsconfig.base"}')
+        known = {"web/src/components/ui/index.ts", "web/lib/index.ts", "web/src/util.ts", "web/src/page.tsx"}
+        resolver = TsResolver(repo, known)
+
+        edges = resolver.resolve("web/src/page.tsx", [
+            ["@/components/ui", 1], ["@lib", 2], ["./util.js", 3], ["./missing", 4], ["react", 5],
+        ])
+        assert [edge["to_path"] for edge in edges] == [
+            "web/src/components/ui/index.ts",
+            "web/lib/index.ts",
+            "web/src/util.ts",
+            "web/src/missing",
+            "EXTERNAL:react",
+        ]
+        # Files outside any config's directory get no aliases
+        assert resolver.resolve("other/a.ts", [["@lib", 1]])[0]["to_path"] == "EXTERNAL:@lib"
+    finally:
+        shutil.rmtree(repo, ignore_errors=True)
+
+if __name__ == "__main__":
+    test_scanner_handles_full_import_grammar()
+    test_resolver_uses_inventory_and_tsconfig_paths()
+    print("All TypeScript tests passed")
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Tests for watch mode: the live graph of a working tree and the watchers
+that feed it
+Run with pytest, or directly as a script
+"""
+
+import json
+import os
+import queue
+import shutil
+import tempfile
+
+from analysis.scan import analyze_repo
+from analysis.watch import InotifyWatcher, LiveGraph, PollingWatcher, WatchSession, apply_changes
+from test_history import RULES
+from test_scan import write_file
+
+FILES = {
+    "app/controllers/users_controller.rb": "class UsersController\n  def index; Account.first; end\nend\n",
+    "app/models/user.rb": "class User; end\n",
+    "frontend/components/List.tsx": "import { load } from '../services/users'\nimport { get } from '../api/client'\n",
+    "frontend/services/users.ts": "import { get } from '@api/client'\nexport const load = get\n",
+}
+
+# (path, content) edits applied in turn; None deletes the file
+EDITS = [
+    # Resolves List.tsx's import of ../api/client, but not the alias yet
+    ("frontend/api/client.ts", "export const get = () => null\n"),
+    ("tsconfig.json", '{"compilerOptions": {"baseUrl": ".", "paths": {"@api/*": ["frontend/api/*"]}}}'),
+    # Defines the constant the controller already refers to
+    ("app/models/account.rb", "class Account; end\n"),
+    ("app/controllers/users_controller.rb", "class UsersController\n  def index; Account.where(a: 1); end\nend\n"),
+    # api depends back on services: a layer cycle
+    ("frontend/api/client.ts", "import { load } from '../services/users'\nexport const get = () => load\n"),
+    ("app/models/account.rb", None),
+    ("frontend/services/users.ts", None),
+]
+
+def violation_keys(violations):
+    return sorted(json.dumps(violation, sort_keys=True) for violation in violations)
+
+def apply_edit(root, path, content):
+    if content is None:
+        os.remove(os.path.join(root, path))
+    else:
+        write_file(root, path, content)
+
+def test_live_graph_matches_full_scan_after_each_edit():
+    root = tempfile.mkdtemp(prefix="drift-watch-")
+    try:
+        for path, content in FILES.items():
+            write_file(root, path, content)
+        graph = LiveGraph(root, RULES)
+        graph.load()
+        expected = analyze_repo(root, RULES)
+        assert violation_keys(graph.current_violations()) == violation_keys(expected["violations"])
+
+        for path, content in EDITS:
+            apply_edit(root, path, content)
+            update = graph.update([path])
+            expected = analyze_repo(root, RULES)
+            assert violation_keys(graph.current_violations()) == violation_keys(expected["violations"]), path
+            assert update["metrics"] == expected["metrics"]
+
+        # Saving unchanged content, or a file the analysis ignores, is no update
+        write_file(root, "README.md", "notes\n")
+        write_file(root, "app/models/user.rb", "class User; end\n")
+        assert graph.update(["README.md", "app/models/user.rb"]) is None
+        # Removing a directory removes the files below it
+        shutil.rmtree(os.path.join(root, "frontend"))
+        update = graph.update(["frontend"])
+        assert update["metrics"] == analyze_repo(root, RULES)["metrics"]
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def test_watchers_report_saved_files():
+    root = tempfile.mkdtemp(prefix="drift-watch-")
+    try:
+        write_file(root, "app/models/user.rb", "class User; end\n")
+        watchers = [PollingWatcher(root, interval=0.01)]
+        try:
+            watchers.append(InotifyWatcher(root))
+        except OSError:
+            pass
+
+        write_file(root, "app/models/user.rb", "class User\nend\n")
+        write_file(root, "app/models/admin/role.rb", "class Role; end\n")
+        write_file(root, "node_modules/pkg/index.ts", "export {}\n")
+        write_file(root, "notes.txt", "")
+        for watcher in watchers:
+            changed = watcher.poll(1)
+            assert changed == {"app/models/user.rb", "app/models/admin/role.rb"}, type(watcher).__name__
+
+        os.remove(os.path.join(root, "app/models/user.rb"))
+        for watcher in watchers:
+            assert watcher.poll(1) == {"app/models/user.rb"}, type(watcher).__name__
+            watcher.close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def test_session_pushes_updates_to_subscribers():
+    root = tempfile.mkdtemp(prefix="drift-watch-")
+    session = WatchSession(root, RULES)
+    try:
+        write_file(root, "app/controllers/users_controller.rb", "class UsersController; end\n")
+        session.start()
+        updates = queue.Queue()
+        snapshot, unsubscribe = session.subscribe(updates.put)
+        assert snapshot["type"] == "snapshot" and snapshot["violations"] == []
+
+        write_file(root, "app/controllers/users_controller.rb", "class UsersController\n  def index; User.where(a: 1); end\nend\n")
+        update = updates.get(timeout=5)
+        assert update["type"] == "update" and [v["rule_code"] for v in update["added"]] == ["DISALLOWED_API"]
+        unsubscribe()
+        assert apply_changes(session.graph, set()) is None
+    finally:
+        session.close()
+        shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == "__main__":
+    test_live_graph_matches_full_scan_after_each_edit()
+    test_watchers_report_saved_files()
+    test_session_pushes_updates_to_subscribers()
+    print("All watch tests passed")
@@ -1,7 +1,7 @@
 class ScanRepoJob < ApplicationJob
   queue_as :scans
 
-  def perform(project_id:, ref:)
+  def perform(project_id:, ref:, mode: 'incremental')
     project = Project.find(project_id)
     rules = project.rules
     
@@ -12,11 +12,12 @@ class ScanRepoJob < ApplicationJob
       repo_url: project.repo_url,
       ref: ref,
       rules: rules,
-      token: ENV['GITHUB_TOKEN']
+      token: ENV['GITHUB_TOKEN'],
+      mode: mode
     )
     
     # Persist the results
-    scan = ScanPersister.persist!(project, ref, result)
+    scan = ScanPersister.persist!(project, ref, result, mode: mode)
     
     Rails.logger.info "Scan completed for project #{project.name}. Drift score: #{scan.drift_score}"
     
@@ -1,11 +1,23 @@
 class AnalyzerClient
-  def self.analyze!(repo_url:, ref:, rules:, token:)
-    conn = Faraday.new(url: ENV.fetch('ANALYZER_URL', 'http://localhost:8000')) do |f|
-      f.request :json
-      f.response :json
-      f.adapter Faraday.default_adapter
-    end
-    
+  POLL_INTERVAL = ENV.fetch('ANALYZER_POLL_INTERVAL', '2').to_f
+  JOB_TIMEOUT = ENV.fetch('ANALYZER_JOB_TIMEOUT', '1800').to_f
+  FINISHED_STATUSES = %w[succeeded failed cancelled timed_out].freeze
+
+  # Submits an analysis job and polls until it finishes, so no HTTP
+  # connection is held open for the length of the scan
+  def self.analyze!(repo_url:, ref:, rules:, token:, mode: 'full')
+    job_id = submit!(repo_url: repo_url, ref: ref, rules: rules, token: token, mode: mode)
+    wait_for!(job_id)
+
+  rescue Faraday::ConnectionFailed => e
+    Rails.logger.error "Failed to connect to analyzer: #{e.message}"
+    raise "Analyzer service unavailable"
+  rescue => e
+    Rails.logger.error "Analyzer client error: #{e.message}"
+    raise e
+  end
+
+  def self.submit!(repo_url:, ref:, rules:, token:, mode: 'full')
     payload = {
       git: {
         repo_url: repo_url,
@@ -13,25 +25,61 @@ class AnalyzerClient
         token: token
       },
       rules: rules,
-      mode: 'full'
+      mode: mode,
+      # Columnar payload with a shared string table; ScanPersister reads both formats
+      format: 'compact'
     }
-    
+
     Rails.logger.info "Sending analysis request to analyzer: #{payload[:git][:repo_url]}"
-    
-    response = conn.post('/analyze', payload)
-    
+
+    response = connection.post('/jobs', payload)
+
     if response.success?
-      response.body
+      response.body['id']
     else
+      # 429 means the analyzer queue is full; raising lets Sidekiq retry later
       Rails.logger.error "Analyzer request failed: #{response.status} - #{response.body}"
       raise "Analyzer request failed: #{response.status}"
     end
-    
-  rescue Faraday::ConnectionFailed => e
-    Rails.logger.error "Failed to connect to analyzer: #{e.message}"
-    raise "Analyzer service unavailable"
-  rescue => e
-    Rails.logger.error "Analyzer client error: #{e.message}"
-    raise e
+  end
+
+  def self.wait_for!(job_id)
+    deadline = Time.now + JOB_TIMEOUT
+
+    loop do
+      response = connection.get("/jobs/#{job_id}")
+      unless response.success?
+        Rails.logger.error "Analyzer job lookup failed: #{response.status} - #{response.body}"
+        raise "Analyzer job lookup failed: #{response.status}"
+      end
+
+      job = response.body
+      if FINISHED_STATUSES.include?(job['status'])
+        return job['result'] if job['status'] == 'succeeded'
+
+        raise "Analyzer job #{job_id} #{job['status']}: #{job['error']}"
+      end
+
+      if Time.now > deadline
+        cancel!(job_id)
+        raise "Analyzer job #{job_id} did not finish within #{JOB_TIMEOUT.to_i}s"
+      end
+
+      sleep POLL_INTERVAL
+    end
+  end
+
+  def self.cancel!(job_id)
+    connection.delete("/jobs/#{job_id}")
+  rescue Faraday::Error => e
+    Rails.logger.warn "Failed to cancel analyzer job #{job_id}: #{e.message}"
+  end
+
+  def self.connection
+    Faraday.new(url: ENV.fetch('ANALYZER_URL', 'http://localhost:8000')) do |f|
+      f.request :json
+      f.response :json
+      f.adapter Faraday.default_adapter
+    end
   end
 end
@@ -1,49 +1,56 @@
 class ScanPersister
-  def self.persist!(project, ref, result)
+  BATCH_SIZE = ENV.fetch('SCAN_PERSIST_BATCH_SIZE', '5000').to_i
+
+  NODE_COLUMNS = %w[path module_name layer lang].freeze
+  EDGE_COLUMNS = %w[from_path to_path edge_type].freeze
+  VIOLATION_COLUMNS = %w[node_path rule_code severity details suggestion].freeze
+
+  def self.persist!(project, ref, result, mode: 'full')
     ActiveRecord::Base.transaction do
       # Create the scan record
       scan = project.scans.create!(
         git_sha: ref,
-        mode: 'full',
+        mode: mode,
         drift_score: result.dig('metrics', 'drift_score') || 0.0
       )
-      
-      # Persist graph nodes
-      Array(result['nodes']).each do |node_data|
-        scan.graph_nodes.create!(
-          path: node_data['path'],
-          module_name: node_data['module_name'],
-          layer: node_data['layer'],
-          lang: node_data['lang']
-        )
-      end
-      
-      # Persist graph edges
-      Array(result['edges']).each do |edge_data|
-        scan.graph_edges.create!(
-          from_path: edge_data['from_path'],
-          to_path: edge_data['to_path'],
-          edge_type: edge_data['edge_type']
-        )
-      end
-      
-      # Persist violations
-      Array(result['violations']).each do |violation_data|
-        scan.violations.create!(
-          node_path: violation_data['node_path'],
-          rule_code: violation_data['rule_code'],
-          severity: violation_data['severity'],
-          details: violation_data['details'],
-          suggestion: violation_data['suggestion']
-        )
-      end
-      
+
+      # Rows go in with multi-row INSERTs of BATCH_SIZE each rather than one
+      # create! per record, so validations and callbacks are skipped
+      now = Time.current
+      defaults = { 'scan_id' => scan.id, 'created_at' => now, 'updated_at' => now }
+      insert_batches(GraphNode, each_row(result, 'nodes', NODE_COLUMNS), defaults)
+      insert_batches(GraphEdge, each_row(result, 'edges', EDGE_COLUMNS), defaults)
+      insert_batches(Violation, each_row(result, 'violations', VIOLATION_COLUMNS), defaults)
+
       scan
     end
-    
+
   rescue => e
     Rails.logger.error "Failed to persist scan results: #{e.message}"
     Rails.logger.error e.backtrace.join("\n")
     raise e
   end
+
+  # Yields one hash of the given columns per record, reading either the
+  # analyzer's record lists or its compact payload, where each column is a
+  # list of indexes into the shared 'strings' table
+  def self.each_row(result, section, columns)
+    return enum_for(:each_row, result, section, columns) unless block_given?
+
+    if result['format'] == 'compact'
+      strings = result['strings']
+      table = result[section] || {}
+      table.fetch(columns.first, []).size.times do |i|
+        yield columns.to_h { |column| [column, table[column][i] && strings[table[column][i]]] }
+      end
+    else
+      Array(result[section]).each { |record| yield record.slice(*columns) }
+    end
+  end
+
+  def self.insert_batches(model, rows, defaults)
+    rows.each_slice(BATCH_SIZE) do |batch|
+      model.insert_all!(batch.map { |row| row.merge(defaults) })
+    end
+  end
 end